@@ -0,0 +1,101 @@
+# benchmarks/bench_backup.py
+"""
+Задержка записи заявок (add_submission) во время снимка базы (utils/backup.py):
+без снимка, со снимком шагами по BACKUP_STEP_PAGES страниц с паузами и со снимком
+за один шаг. Показывает время и размер снимка и p50/p95/max задержки записи.
+
+Запуск: python -m benchmarks.bench_backup --rows 500000 --rate 200
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.bench_draw import build_db
+from database.database import Database
+from utils.backup import BackupManager
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def measure(path: str, backup_dir: str, step_pages: int | None, step_pause: float, rate: float,
+                  first_user_id: int) -> tuple[list[float], object]:
+    """Пишет заявки с частотой rate, пока идет снимок (или 3 с без снимка)."""
+    db = Database(path)
+    await db.connect()
+    latencies = []
+    stop = asyncio.Event()
+
+    async def _write(user_id: int):
+        start = time.perf_counter()
+        await db.add_submission(user_id, f"user{user_id}", f"col{user_id}", [f"rec{user_id}"])
+        latencies.append(time.perf_counter() - start)
+
+    async def _writer():
+        tasks = []
+        user_id = first_user_id
+        while not stop.is_set():
+            tasks.append(asyncio.create_task(_write(user_id)))
+            user_id += 1
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*tasks)
+
+    writer = asyncio.create_task(_writer())
+    info = None
+    try:
+        if step_pages is None:
+            await asyncio.sleep(3)
+        else:
+            manager = BackupManager(path, backup_dir, interval=0, keep=1, step_pages=step_pages,
+                                    step_pause=step_pause)
+            info = await manager.create()
+    finally:
+        stop.set()
+        await writer
+        await db.close()
+    return latencies, info
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "backup.db")
+        start = time.perf_counter()
+        await build_db(path, args.rows)
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        print(f"Создана база на {args.rows} участников ({os.path.getsize(path) / 1024 / 1024:.0f} МБ) "
+              f"за {time.perf_counter() - start:.1f} с")
+
+        modes = (
+            ("Без снимка", None, 0.0),
+            (f"Шагами по {args.step_pages} стр.", args.step_pages, args.step_pause_ms / 1000),
+            ("Один шаг", 2 ** 31 - 1, 0.0),
+        )
+        for index, (title, step_pages, step_pause) in enumerate(modes):
+            latencies, info = await measure(path, os.path.join(tmp, f"backups{index}"), step_pages, step_pause,
+                                            args.rate, 100_000_000 + index * 10_000_000)
+            line = (f"{title:22} записей {len(latencies):5}, задержка p50 {_percentile(latencies, 0.5) * 1000:6.1f} мс, "
+                    f"p95 {_percentile(latencies, 0.95) * 1000:6.1f} мс, max {max(latencies) * 1000:6.1f} мс")
+            if info is not None:
+                line += f"; снимок {info.seconds:.2f} с, {info.size / 1024 / 1024:.1f} МБ"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--rate", type=float, default=200.0, help="Заявок в секунду во время замера")
+    parser.add_argument("--step-pages", type=int, default=256)
+    parser.add_argument("--step-pause-ms", type=float, default=5.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
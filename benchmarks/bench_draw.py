@@ -0,0 +1,93 @@
+# benchmarks/bench_draw.py
+"""
+Розыгрыш среди большого числа участников: потоковая взвешенная выборка
+(utils.draw, память O(победителей)) против загрузки всех подтвержденных
+участников в список и выборки из него. Показывает время и пик памяти Python.
+
+Запуск: python -m benchmarks.bench_draw --rows 1000000 --winners 100
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from database.database import Database
+from utils.draw import DRAW_STATUSES, run_draw, status_weight
+
+STATUSES = ["pending"] * 10 + ["approved"] * 80 + ["bonus"] * 5 + ["rejected"] * 5
+
+
+async def build_db(path: str, rows: int):
+    db = Database(path)
+    await db.setup_database()
+    await db.close()
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO participants (campaign_id, user_id, username, collection_photo_id, receipt_photo_id, status) "
+        "VALUES (1, ?, ?, ?, ?, ?)",  # Первая кампания создается миграцией
+        ((10_000_000 + i, f"user{i}", f"col{i}", f"rec{i}", rng.choice(STATUSES)) for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+async def naive_draw(db: Database, count: int, seed: str, bonus_weight: float) -> list[int]:
+    """Все участники в памяти, затем взвешенная выборка без возвращения по тем же ключам."""
+    placeholders = ", ".join("?" * len(DRAW_STATUSES))
+    rows = await db.fetchall(f"SELECT id, user_id, status FROM participants WHERE status IN ({placeholders})",
+                             DRAW_STATUSES)
+    rng = random.Random(seed)
+    keys = [rng.random() ** (1 / status_weight(status, bonus_weight)) for _, _, status in rows]
+    order = sorted(range(len(rows)), key=keys.__getitem__, reverse=True)[:count]
+    return [rows[i][0] for i in order]
+
+
+async def streaming_draw(db: Database, count: int, seed: str, bonus_weight: float) -> list[int]:
+    result = await run_draw(db, count, seed, bonus_weight)
+    return [submission_id for submission_id, _, _ in result.winners]
+
+
+async def measure(path: str, func, count: int) -> tuple[float, float]:
+    """Возвращает (время в с, пик памяти в МБ) одного розыгрыша."""
+    db = Database(path)
+    await db.connect()
+    start = time.perf_counter()
+    await func(db, count, "bench", 2.0)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    await func(db, count, "bench", 2.0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await db.close()
+    return elapsed, peak / 1024 / 1024
+
+
+async def run(rows: int, winners: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "draw.db")
+        start = time.perf_counter()
+        await build_db(path, rows)
+        print(f"Создана база на {rows} участников за {time.perf_counter() - start:.1f} с")
+
+        for title, func in (("Потоковый (куча)", streaming_draw), ("Все в памяти", naive_draw)):
+            elapsed, peak = await measure(path, func, winners)
+            print(f"{title:18} {elapsed:6.2f} с, пик памяти {peak:7.1f} МБ")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--winners", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.winners))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/bench_email.py
+"""
+Прогоняет пачку заявок через EmailWorker против локального SMTP-сервера (aiosmtpd)
+и фейкового Bot API. Показывает, сколько писем ушло, сколько заявок попало в дайджесты
+и сколько времени заняло постановка в очередь (то, что ждет хендлер).
+
+Запуск: pip install -r requirements-dev.txt && python -m benchmarks.bench_email --submissions 200
+"""
+
+import argparse
+import asyncio
+import time
+
+from aiosmtpd.controller import Controller
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from utils.email_sender import EmailWorker
+
+
+class _CountingHandler:
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        self.bytes += len(envelope.content)
+        return "250 OK"
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--submissions", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--digest-max", type=int, default=10)
+    args = parser.parse_args()
+
+    handler = _CountingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=8025)
+    controller.start()
+    api = FakeBotAPI(latency_ms=args.latency_ms)
+    await api.start()
+    bot = api.make_bot()
+
+    worker = EmailWorker(host="127.0.0.1", port=8025, sender="bot@example.com", password=None,
+                         receiver="admin@example.com", starttls=False, digest_max=args.digest_max)
+    worker.start(bot)
+    try:
+        start = time.perf_counter()
+        for i in range(args.submissions):
+            worker.enqueue(f"Новая заявка №{i}", [f"col_{i}", f"rec_{i}"])
+        enqueue_time = time.perf_counter() - start
+        await worker.stop()
+        total_time = time.perf_counter() - start
+    finally:
+        await bot.session.close()
+        await api.stop()
+        controller.stop()
+
+    stats = worker.get_stats()
+    print(f"Заявок: {args.submissions}, писем принято сервером: {handler.messages} "
+          f"({handler.bytes / 1024:.0f} КБ)")
+    print(f"Постановка в очередь: {enqueue_time * 1000:.2f} мс всего, "
+          f"{enqueue_time / args.submissions * 1e6:.1f} мкс на заявку")
+    print(f"Отправка всей очереди: {total_time:.2f} с, {stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
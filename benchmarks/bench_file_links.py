@@ -0,0 +1,85 @@
+# benchmarks/bench_file_links.py
+"""
+Сравнивает скорость генерации CSV для /get_users_db:
+старый вариант (два последовательных bot.get_file на строку) против
+FileLinkResolver (параллельные запросы + TTL-кэш).
+
+Запуск: python -m benchmarks.bench_file_links --rows 2000 --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import time
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from utils.export_data import resolve_photo_links
+from utils.file_links import file_link_resolver
+
+COLUMNS = ["id", "user_id", "username", "collection_photo_id", "receipt_photo_ids", "status"]
+
+
+def make_rows(count: int) -> list[tuple]:
+    return [(i, 1000 + i, f"user{i}", f"col_{i}", f"rec_{i}", "pending") for i in range(1, count + 1)]
+
+
+async def sequential_csv(rows: list[tuple], bot) -> bytes:
+    """Прежняя реализация: по два последовательных get_file на строку."""
+    prefix = f"https://api.telegram.org/file/bot{bot.token}/"
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(COLUMNS)
+    for row in rows:
+        row_list = list(row)
+        for idx in (3, 4):
+            file_info = await bot.get_file(row_list[idx])
+            row_list[idx] = f"{prefix}{file_info.file_path}"
+        writer.writerow(row_list)
+    return output.getvalue().encode("utf-8")
+
+
+async def links_csv(rows: list[tuple], bot) -> bytes:
+    """Текущая реализация: ссылки через FileLinkResolver."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(COLUMNS)
+    writer.writerows(await resolve_photo_links(COLUMNS, rows, bot))
+    return output.getvalue().encode("utf-8")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency_ms=args.latency_ms)
+    await api.start()
+    bot = api.make_bot()
+    rows = make_rows(args.rows)
+    try:
+        start = time.perf_counter()
+        await sequential_csv(rows, bot)
+        before = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await links_csv(rows, bot)
+        after_cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await links_csv(rows, bot)
+        after_warm = time.perf_counter() - start
+    finally:
+        await bot.session.close()
+        await api.stop()
+
+    print(f"Строк: {args.rows}, задержка API: {args.latency_ms} мс, "
+          f"параллельность: {file_link_resolver.concurrency}")
+    print(f"до (последовательно):   {args.rows / before:10.1f} строк/с ({before:.2f} с)")
+    print(f"после (холодный кэш):   {args.rows / after_cold:10.1f} строк/с ({after_cold:.2f} с)")
+    print(f"после (теплый кэш):     {args.rows / after_warm:10.1f} строк/с ({after_warm:.2f} с)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+# benchmarks/bench_fsm_storage.py
+"""
+Сравнивает задержки get/set SQLiteStorage (холодный и теплый кэш) с MemoryStorage.
+
+Запуск: python -m benchmarks.bench_fsm_storage --users 5000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from database.database import Database
+from database.fsm_storage import SQLiteStorage
+
+STATE = "SubmissionStates:waiting_for_receipt_photo"
+
+
+def _report(name: str, samples: list[float]):
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1e6
+    p99 = samples[int(len(samples) * 0.99)] * 1e6
+    print(f"{name:32} среднее {statistics.mean(samples) * 1e6:8.1f} мкс  p50 {p50:8.1f}  p99 {p99:8.1f}")
+
+
+async def _measure(name: str, keys: list[StorageKey], op):
+    samples = []
+    for key in keys:
+        start = time.perf_counter()
+        await op(key)
+        samples.append(time.perf_counter() - start)
+    _report(name, samples)
+
+
+async def _measure_concurrent(name: str, keys: list[StorageKey], op):
+    """Все операции одновременно, как при всплеске апдейтов: считается общая пропускная способность."""
+    start = time.perf_counter()
+    await asyncio.gather(*(op(key) for key in keys))
+    elapsed = time.perf_counter() - start
+    print(f"{name:32} {len(keys) / elapsed:10.0f} операций/с")
+
+
+async def bench_storage(title: str, storage, keys: list[StorageKey]):
+    print(f"--- {title}")
+
+    async def _set(key):
+        await storage.set_state(key, STATE)
+        await storage.set_data(key, {"collection_photo_id": f"photo_{key.user_id}"})
+
+    await _measure("set_state + set_data", keys, _set)
+    await _measure("get_state + get_data (кэш)", keys, lambda k: asyncio.gather(storage.get_state(k),
+                                                                                 storage.get_data(k)))
+    if isinstance(storage, SQLiteStorage):
+        storage._cache.clear()
+        await _measure("get_state (холодный кэш)", keys, storage.get_state)
+        storage._cache.clear()
+    await _measure_concurrent("set_data параллельно", keys, lambda k: storage.set_data(k, {"n": k.user_id}))
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    args = parser.parse_args()
+    keys = [StorageKey(bot_id=1, chat_id=i, user_id=i) for i in range(1, args.users + 1)]
+
+    await bench_storage("MemoryStorage", MemoryStorage(), keys)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        await db.setup_database()
+        await bench_storage("SQLiteStorage", SQLiteStorage(db), keys)
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+# benchmarks/bench_migrations.py
+"""
+Миграция схемы на большой базе: создает базу в формате прежних версий бота
+(только таблица participants без индексов, user_version = 0), применяет все
+миграции и сравнивает выборку подтвержденных участников до и после.
+
+Запуск: python -m benchmarks.bench_migrations --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from database.database import Database
+from database.migrations import MIGRATIONS
+
+LEGACY_SCHEMA = '''
+    CREATE TABLE participants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL UNIQUE,
+        username TEXT,
+        collection_photo_id TEXT,
+        receipt_photo_id TEXT,
+        status TEXT DEFAULT 'pending',
+        full_name TEXT,
+        address TEXT,
+        phone_number TEXT
+    )
+'''
+APPROVED_QUERY = "SELECT user_id FROM participants WHERE status IN ('approved', 'bonus')"
+# После миграций бот читает только текущую кампанию (Database.get_approved_users)
+CAMPAIGN_APPROVED_QUERY = (f"SELECT user_id FROM participants WHERE campaign_id = {Database.CURRENT_CAMPAIGN} "
+                           "AND status IN ('approved', 'bonus')")
+STATUSES = ["pending"] * 90 + ["approved"] * 6 + ["bonus"] * 1 + ["rejected"] * 3
+
+
+def build_legacy_db(path: str, rows: int):
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    conn.execute(LEGACY_SCHEMA)
+    conn.executemany(
+        "INSERT INTO participants (user_id, username, collection_photo_id, receipt_photo_id, status) "
+        "VALUES (?, ?, ?, ?, ?)",
+        ((10_000_000 + i, f"user{i}", f"AgACAgIAAxkBAAI{i:012d}col", f"AgACAgIAAxkBAAI{i:012d}rec",
+          rng.choice(STATUSES)) for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def time_query(path: str, query: str = APPROVED_QUERY, repeat: int = 5) -> tuple[float, int, str]:
+    """Возвращает (среднее время запроса в мс, количество строк, план запроса)."""
+    conn = sqlite3.connect(path)
+    plan = "; ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}"))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        count = len(conn.execute(query).fetchall())
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    conn.close()
+    return elapsed, count, plan
+
+
+async def migrate(path: str) -> float:
+    db = Database(path)
+    start = time.perf_counter()
+    await db.setup_database()
+    elapsed = time.perf_counter() - start
+    await db.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "legacy.db")
+        start = time.perf_counter()
+        build_legacy_db(path, args.rows)
+        print(f"Создана база на {args.rows} строк за {time.perf_counter() - start:.1f} с, "
+              f"{os.path.getsize(path) / 1024 / 1024:.0f} МБ")
+
+        before_ms, count, plan = time_query(path)
+        print(f"До миграции:    {before_ms:8.1f} мс, {count} строк, план: {plan}")
+
+        elapsed = asyncio.run(migrate(path))
+        print(f"Миграции 1..{len(MIGRATIONS)} (одна транзакция): {elapsed:.1f} с, "
+              f"размер {os.path.getsize(path) / 1024 / 1024:.0f} МБ")
+
+        after_ms, count, plan = time_query(path, CAMPAIGN_APPROVED_QUERY)
+        print(f"После миграции: {after_ms:8.1f} мс, {count} строк, план: {plan}")
+
+        elapsed = asyncio.run(migrate(path))
+        print(f"Повторный запуск (миграций нет): {elapsed * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
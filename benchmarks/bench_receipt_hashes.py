@@ -0,0 +1,55 @@
+# benchmarks/bench_receipt_hashes.py
+"""
+Скорость поиска похожих чеков: одна новая заявка против N предыдущих.
+Сравнивает векторный проход ReceiptHashIndex (NumPy) с циклом на чистом Python.
+
+Запуск: python -m benchmarks.bench_receipt_hashes --receipts 100000
+"""
+
+import argparse
+import random
+import time
+
+from utils import receipt_hashes
+from utils.receipt_hashes import ReceiptHashIndex
+
+
+def python_search(hashes: list[int], phash: int, max_distance: int) -> list[int]:
+    return [i for i, h in enumerate(hashes) if bin((h ^ phash) & 0xFFFFFFFFFFFFFFFF).count("1") <= max_distance]
+
+
+def _timeit(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--receipts", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if not receipt_hashes.np:
+        raise SystemExit("Для бенчмарка нужны numpy и Pillow.")
+
+    rng = random.Random(42)
+    hashes = [rng.getrandbits(64) - 2 ** 63 for _ in range(args.receipts)]
+    index = ReceiptHashIndex()
+    start = time.perf_counter()
+    for i, phash in enumerate(hashes, start=1):
+        index.add(i, 0, i, 1, phash)
+    print(f"Построение индекса на {args.receipts} чеков: {(time.perf_counter() - start) * 1000:.1f} мс")
+
+    # Запрос - слегка измененный существующий чек (3 бита отличаются)
+    query = hashes[len(hashes) // 2] ^ 0b10101
+    numpy_ms = _timeit(lambda: index.search(query), args.repeat)
+    python_ms = _timeit(lambda: python_search(hashes, query, index.max_distance), max(1, args.repeat // 10))
+    print(f"NumPy:  {numpy_ms:8.2f} мс на поиск, найдено {len(index.search(query))}")
+    print(f"Python: {python_ms:8.2f} мс на поиск, найдено {len(python_search(hashes, query, index.max_distance))}")
+    print(f"Ускорение: {python_ms / numpy_ms:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
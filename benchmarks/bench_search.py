@@ -0,0 +1,87 @@
+# benchmarks/bench_search.py
+"""
+Поиск участника по части username: индекс FTS5 (Database.search_participants)
+против полного просмотра таблицы с LIKE '%...%' - так искали бы по выгрузке.
+Показывает задержку запросов и размер индекса.
+
+Запуск: python -m benchmarks.bench_search --rows 1000000 --queries 200
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.bench_draw import build_db
+from database.database import Database
+from utils.search import parse_query
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def _index_size(path: str) -> int | None:
+    """Размер таблиц participants_fts* в байтах (None, если SQLite собран без dbstat)."""
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'participants_fts%'").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+async def _like_search(db: Database, query: str, limit: int) -> list[tuple]:
+    return await db.fetchall(
+        "SELECT id, user_id, username, status, updated_at FROM participants "
+        "WHERE username LIKE ? ORDER BY id DESC LIMIT ?", (f"%{query}%", limit)
+    )
+
+
+async def _fts_search(db: Database, query: str, limit: int) -> list[tuple]:
+    match, number, submission_only = parse_query(query)
+    return await db.search_participants(match, number, None, limit, submission_only)
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search.db")
+        start = time.perf_counter()
+        await build_db(path, args.rows)  # Индекс заполняется триггером при вставке
+        print(f"Создана база на {args.rows} участников за {time.perf_counter() - start:.1f} с")
+        size = _index_size(path)
+        if size is not None:
+            print(f"Размер индекса FTS5: {size / 1024 / 1024:.1f} МБ из {os.path.getsize(path) / 1024 / 1024:.1f} МБ")
+
+        rng = random.Random(1)
+        # Имена в базе - user<N>: ищем по началу имени, как админ набирает его в /find
+        queries = [f"user{rng.randrange(args.rows)}"[:rng.randint(6, 9)] for _ in range(args.queries)]
+        db = Database(path)
+        await db.connect()
+        try:
+            for title, func in (("FTS5 (префикс)", _fts_search), ("LIKE '%...%'", _like_search)):
+                latencies = []
+                for query in queries[:args.queries if func is _fts_search else max(1, args.queries // 10)]:
+                    start = time.perf_counter()
+                    await func(db, query, 10)
+                    latencies.append(time.perf_counter() - start)
+                print(f"{title:16} запросов {len(latencies):4}, p50 {_percentile(latencies, 0.5) * 1000:8.2f} мс, "
+                      f"p95 {_percentile(latencies, 0.95) * 1000:8.2f} мс")
+        finally:
+            await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
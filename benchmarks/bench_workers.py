@@ -0,0 +1,138 @@
+# benchmarks/bench_workers.py
+"""
+Масштабирование многопроцессного режима (BOT_WORKERS, utils/cluster.py).
+Пользователи проходят /start -> submit_application -> фото коллекции -> фото чека
+против фейкового Bot API: сначала в одном процессе (как main.py с BOT_WORKERS=0),
+затем через Ingress с 1, 2, 4... процессами-обработчиками на общей базе в WAL.
+Прирост ограничен числом ядер: на одном ядре процессы только делят его между собой.
+
+Запуск:
+  python -m benchmarks.bench_workers --users 2000 --workers 1,2,4
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks import updates
+from benchmarks.fake_bot_api import FakeBotAPI
+from database.database import Database
+from main import create_dispatcher, create_outbox, worker_process
+from utils.cluster import Ingress
+from utils.send_scheduler import SendScheduler, SendSchedulerMiddleware
+
+FIRST_USER_ID = 10_000_000
+
+
+def _user_updates(user_id: int) -> list[dict]:
+    return [
+        updates.command(user_id, "/start"),
+        updates.callback(user_id, "submit_application"),
+        updates.photo(user_id, f"col{user_id}"),
+        updates.photo(user_id, f"rec{user_id}"),
+    ]
+
+
+async def _count_submissions(db_path: str) -> int:
+    db = Database(db_path)
+    await db.connect()
+    try:
+        row = await db.fetchone("SELECT COUNT(*) FROM participants")
+        return row[0]
+    finally:
+        await db.close()
+
+
+async def run_single(api: FakeBotAPI, db_path: str, users: int, concurrency: int) -> float:
+    """Один процесс: пользователи действуют параллельно, апдейты каждого - по очереди."""
+    bot = api.make_bot()
+    bot.session.middleware(SendSchedulerMiddleware(SendScheduler(global_rate=1e6, per_chat_rate=1e6)))
+    db = Database(db_path)
+    await db.connect()
+    dp = create_dispatcher(db)
+    outbox = create_outbox(db, bot)
+    workflow_data = dict(db_instance=db, outbox=outbox, broadcaster=None)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def user_flow(user_id: int):
+        async with semaphore:
+            for update in _user_updates(user_id):
+                await dp.feed_raw_update(bot, update, **workflow_data)
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(user_flow(FIRST_USER_ID + i) for i in range(users)))
+        return time.perf_counter() - start
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        await db.close()
+
+
+async def run_cluster(api: FakeBotAPI, db_path: str, users: int, workers: int) -> float:
+    """Ingress и workers процессов: апдейты раскладываются по ID пользователя."""
+    with tempfile.TemporaryDirectory() as socket_dir:
+        ingress = Ingress(workers, worker_process, socket_dir, db_name=db_path, api_url=api.url,
+                          send_rate=1e6, per_chat_rate=1e6, log_level=logging.WARNING)
+        await ingress.start()  # Запуск процессов в замер не входит
+        try:
+            start = time.perf_counter()
+            # Апдейты пользователей перемешаны, как при реальном приеме
+            for step in range(4):
+                for i in range(users):
+                    await ingress.dispatch(_user_updates(FIRST_USER_ID + i)[step])
+            await ingress.wait_idle()
+            elapsed = time.perf_counter() - start
+        finally:
+            await ingress.stop()
+        if ingress.lost:
+            print(f"  потеряно апдейтов: {ingress.lost}")
+        return elapsed
+
+
+async def run(args):
+    api = FakeBotAPI(latency_ms=args.latency_ms)
+    await api.start()
+    print(f"Ядер: {os.cpu_count()}, пользователей: {args.users}, апдейтов: {args.users * 4}, "
+          f"задержка API: {args.latency_ms:g} мс")
+    results = {}
+    try:
+        for workers in [0] + [int(n) for n in args.workers.split(",")]:
+            with tempfile.TemporaryDirectory() as tmp:
+                db_path = os.path.join(tmp, "workers.db")
+                db = Database(db_path)
+                await db.setup_database()
+                await db.close()
+                if workers:
+                    elapsed = await run_cluster(api, db_path, args.users, workers)
+                    name = f"{workers} обработч."
+                else:
+                    elapsed = await run_single(api, db_path, args.users, args.concurrency)
+                    name = "один процесс"
+                submissions = await _count_submissions(db_path)
+            rate = args.users * 4 / elapsed
+            results[workers] = rate
+            speedup = rate / results[0]
+            print(f"{name:14} {elapsed:7.2f} с  {rate:8.1f} апдейтов/с  x{speedup:.2f}  "
+                  f"заявок: {submissions}/{args.users}")
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workers", default="1,2,4", help="Числа процессов-обработчиков через запятую")
+    parser.add_argument("--concurrency", type=int, default=100, help="Пользователей одновременно в одном процессе")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Задержка ответа фейкового Bot API")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)  # Логи каждого апдейта исказят замеры
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# benchmarks/fake_bot_api.py
+
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+FAKE_PHOTO = b"\xff\xd8\xff\xe0" + b"\x00" * 20_000  # ~20 КБ "jpeg"
+
+
+class FakeBotAPI:
+    """
+    Локальная замена Telegram Bot API для бенчмарков.
+    Отвечает на основные методы, которые использует бот, с настраиваемой задержкой
+    и долей ответов 429 (Flood control) с retry_after.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                 flood_rate: float = 0.0, retry_after: int = 1, photo: bytes = FAKE_PHOTO,
+                 blocked_chats: set[int] | None = None):
+        self.host = host
+        self.port = port
+        self.latency = latency_ms / 1000
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.photo = photo
+        self.blocked_chats = blocked_chats or set()  # Чаты, где пользователь "заблокировал" бота
+
+        self.calls = Counter()  # Количество вызовов по методам
+        self.floods = 0
+        self.sent_to = Counter()  # Количество отправленных сообщений по chat_id
+        self._message_id = 0
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def make_bot(self, token: str = "123456:FAKE-TOKEN") -> Bot:
+        """Создает Bot, который ходит в этот сервер вместо api.telegram.org."""
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.url))
+        return Bot(token=token, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+
+    def _message(self, chat_id, **extra) -> dict:
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+        }
+        message.update(extra)
+        return message
+
+    def _result(self, method: str, params: dict):
+        chat_id = params.get("chat_id")
+        if method == "getme":
+            return {"id": 123456, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        if method == "getfile":
+            file_id = params.get("file_id", "")
+            return {"file_id": file_id, "file_unique_id": f"u_{file_id}", "file_size": len(self.photo),
+                    "file_path": f"photos/{file_id}.jpg"}
+        if method == "sendmessage":
+            self.sent_to[chat_id] += 1
+            return self._message(chat_id, text=params.get("text", ""))
+        if method == "sendmediagroup":
+            self.sent_to[chat_id] += 1
+            media = json.loads(params.get("media") or "[]")
+            return [self._message(chat_id, photo=[{"file_id": "p", "file_unique_id": "p", "width": 1, "height": 1}])
+                    for _ in media]
+        if method == "senddocument":
+            self.sent_to[chat_id] += 1
+            return self._message(chat_id, document={"file_id": "d", "file_unique_id": "d"})
+        if method == "editmessagetext":
+            return self._message(chat_id, text=params.get("text", ""))
+        return True
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {k: v for k, v in (await request.post()).items() if isinstance(v, str)}
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method.startswith("send") and self.flood_rate and random.random() < self.flood_rate:
+            self.floods += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        if method.startswith("send") and int(params.get("chat_id") or 0) in self.blocked_chats:
+            return web.json_response({
+                "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user",
+            }, status=403)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        self.calls["download"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(body=self.photo, content_type="image/jpeg")
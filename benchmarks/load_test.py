@@ -0,0 +1,203 @@
+# benchmarks/load_test.py
+"""
+Нагрузочный тест: настоящий Dispatcher (роутеры, SQLite FSM, middleware метрик, outbox)
+против локального фейкового Bot API с задержкой и инъекцией 429.
+
+Сценарий:
+  1. N пользователей проходят /start -> submit_application -> фото коллекции -> фото чеков;
+  2. админ подтверждает каждую заявку (admin:approve:*);
+  3. админ выгружает базу (/get_users_db).
+
+Запуск:
+  python -m benchmarks.load_test --users 2000 --concurrency 200 --latency-ms 30 --save baseline.json
+  python -m benchmarks.load_test --users 2000 --compare baseline.json
+  python -m benchmarks.load_test --users 500 --journal journal/   # записать апдейты для benchmarks.replay
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks import updates
+from benchmarks.fake_bot_api import FakeBotAPI
+from config import ADMIN_IDS
+from database.database import Database
+from main import create_dispatcher, create_outbox
+from middlewares.metrics import ApiMetricsMiddleware
+from utils.journal import UpdateJournal
+from utils.metrics import metrics
+from utils.send_scheduler import SendScheduler, SendSchedulerMiddleware
+
+FIRST_USER_ID = 10_000_000
+
+
+async def _run_phase(name: str, jobs, concurrency: int, results: dict):
+    """Выполняет корутины-сценарии с ограничением параллельности и считает апдейты в секунду."""
+    semaphore = asyncio.Semaphore(concurrency)
+    counter = {"updates": 0}
+
+    async def _guarded(job):
+        async with semaphore:
+            handled = await job
+        counter["updates"] += handled
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_guarded(job) for job in jobs))
+    elapsed = time.perf_counter() - start
+    results[name] = {
+        "updates": counter["updates"],
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(counter["updates"] / elapsed, 1) if elapsed else 0,
+    }
+    print(f"{name:12} {counter['updates']:7} апдейтов за {elapsed:7.2f} с "
+          f"({results[name]['updates_per_sec']} апдейтов/с)")
+
+
+async def run(args) -> dict:
+    api = FakeBotAPI(latency_ms=args.latency_ms, flood_rate=args.flood_rate)
+    await api.start()
+    bot = api.make_bot()
+    # Планировщик нужен всегда (он повторяет запросы после 429), а лимиты Telegram включаются по флагу
+    scheduler = SendScheduler() if args.telegram_limits else SendScheduler(global_rate=1e6, per_chat_rate=1e6)
+    bot.session.middleware(SendSchedulerMiddleware(scheduler))
+    bot.session.middleware(ApiMetricsMiddleware(metrics))
+
+    tmp = tempfile.TemporaryDirectory()
+    db = Database(os.path.join(tmp.name, "load.db"))
+    await db.setup_database()
+    journal = UpdateJournal(args.journal) if args.journal else None
+    if journal:
+        journal.start()
+    dp = create_dispatcher(db, journal)
+    outbox = create_outbox(db, bot)
+    outbox.start()
+    workflow_data = dict(db_instance=db, outbox=outbox, broadcaster=None)
+    admin_id = ADMIN_IDS[0]
+
+    errors = {"count": 0}
+
+    async def feed(update: dict):
+        # Как и при polling, ошибка одного апдейта не останавливает остальные
+        try:
+            await dp.feed_raw_update(bot, update, **workflow_data)
+        except Exception:
+            errors["count"] += 1
+
+    async def user_flow(user_id: int) -> int:
+        await feed(updates.command(user_id, "/start"))
+        await feed(updates.callback(user_id, "submit_application"))
+        await feed(updates.photo(user_id, f"col{user_id}"))
+        await feed(updates.photo(user_id, f"rec{user_id}"))
+        return 4
+
+    async def approve(submission_id: int, user_id: int, version: int) -> int:
+        await feed(updates.callback(admin_id, f"admin:approve:{submission_id}:{user_id}:{version}"))
+        return 1
+
+    async def export() -> int:
+        await feed(updates.command(admin_id, "/get_users_db"))
+        return 1
+
+    phases = {}
+    try:
+        user_ids = range(FIRST_USER_ID, FIRST_USER_ID + args.users)
+        await _run_phase("submissions", (user_flow(uid) for uid in user_ids), args.concurrency, phases)
+        submissions = await db.fetchall("SELECT id, user_id, version FROM participants")
+        await _run_phase("moderation", (approve(*row) for row in submissions), args.concurrency, phases)
+        await _run_phase("export", [export()], 1, phases)
+        await outbox.stop()
+        if journal:
+            await journal.stop()
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        await api.stop()
+        await db.close()
+        tmp.cleanup()
+
+    handlers = {
+        name: {
+            "count": h.count,
+            "p50_ms": round(h.percentile(0.5) * 1000, 2),
+            "p95_ms": round(h.percentile(0.95) * 1000, 2),
+            "p99_ms": round(h.percentile(0.99) * 1000, 2),
+        }
+        for name, h in metrics.histograms.get("bot_handler_seconds", {}).items()
+    }
+    db_histograms = metrics.histograms.get("db_query_seconds", {})
+    return {
+        "config": vars(args) | {"save": None, "compare": None, "journal": None},
+        "phases": phases,
+        "handlers": handlers,
+        "db_seconds": round(sum(h.sum for name, h in db_histograms.items() if name != "execute"), 3),
+        "db_queries": sum(h.count for name, h in db_histograms.items() if name != "execute"),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "api_calls": dict(api.calls),
+        "api_floods": api.floods,
+        "update_errors": errors["count"],
+    }
+
+
+def _print_report(report: dict):
+    print("\nЗадержки хендлеров (мс):")
+    for name, h in sorted(report["handlers"].items()):
+        print(f"  {name:36} n={h['count']:7}  p50={h['p50_ms']:8.1f}  p95={h['p95_ms']:8.1f}  p99={h['p99_ms']:8.1f}")
+    print(f"Время в БД: {report['db_seconds']} с на {report['db_queries']} запросов")
+    print(f"Пиковый RSS: {report['peak_rss_mb']} МБ, вызовы API: {report['api_calls']}, 429: {report['api_floods']}, "
+          f"ошибок апдейтов: {report['update_errors']}")
+
+
+def _compare(report: dict, baseline: dict):
+    """Печатает изменения ключевых показателей относительно сохраненного прогона."""
+    def _delta(name: str, before: float, after: float, higher_is_better: bool):
+        if not before:
+            return
+        change = (after - before) / before * 100
+        better = change > 0 if higher_is_better else change < 0
+        mark = "лучше" if better else "хуже" if abs(change) >= 5 else "≈"
+        print(f"  {name:44} {before:10.2f} -> {after:10.2f} ({change:+.1f}%, {mark})")
+
+    print("\nСравнение с базовым прогоном:")
+    for phase, values in report["phases"].items():
+        if phase in baseline["phases"]:
+            _delta(f"{phase} апдейтов/с", baseline["phases"][phase]["updates_per_sec"],
+                   values["updates_per_sec"], True)
+    for name, h in report["handlers"].items():
+        if name in baseline["handlers"]:
+            _delta(f"{name} p95, мс", baseline["handlers"][name]["p95_ms"], h["p95_ms"], False)
+    _delta("время в БД, с", baseline["db_seconds"], report["db_seconds"], False)
+    _delta("пиковый RSS, МБ", baseline["peak_rss_mb"], report["peak_rss_mb"], False)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100, help="Пользователей, действующих одновременно")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Задержка ответа фейкового Bot API")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Доля отправок, получающих 429")
+    parser.add_argument("--telegram-limits", action="store_true",
+                        help="Включить планировщик отправок с реальными лимитами Telegram")
+    parser.add_argument("--save", help="Сохранить результат в JSON")
+    parser.add_argument("--compare", help="Сравнить с сохраненным JSON")
+    parser.add_argument("--journal", help="Записать апдейты в журнал в этой папке (для benchmarks.replay)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)  # Логи каждого апдейта исказят замеры
+    report = asyncio.run(run(args))
+    _print_report(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            _compare(report, json.load(f))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результат сохранен в {args.save}")
+
+
+if __name__ == "__main__":
+    main()
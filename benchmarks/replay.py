@@ -0,0 +1,206 @@
+# benchmarks/replay.py
+"""
+Воспроизведение журнала апдейтов (JOURNAL_ENABLED=1, см. utils/journal.py):
+настоящий Dispatcher (как в main.py: db_instance, outbox, broadcaster) против локального
+фейкового Bot API - с исходной скоростью, в N раз быстрее или без пауз.
+В конце сравнивает задержки обработки по меткам апдейтов с записанными в журнале.
+
+Запуск:
+  python -m benchmarks.replay journal/                          # исходная скорость
+  python -m benchmarks.replay journal/ --speed 10               # в 10 раз быстрее
+  python -m benchmarks.replay journal/ --speed 0 --db bot.db    # без пауз, на копии рабочей базы
+
+В многопроцессном режиме (BOT_WORKERS) у каждого обработчика своя папка journal/worker-N:
+передайте journal/ или несколько папок - записи сливаются по времени получения.
+ADMIN_IDS должны совпадать с записью, иначе апдейты админов не пройдут фильтры.
+Без --db повтор идет на пустой базе: кнопки модерации старых заявок ее не найдут.
+"""
+
+import argparse
+import asyncio
+import heapq
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from database.database import Database
+from main import create_dispatcher, create_outbox
+from middlewares.antiflood import AntiFloodMiddleware
+from middlewares.metrics import ApiMetricsMiddleware
+from utils.broadcast import Broadcaster
+from utils.journal import journal_files, read_journal
+from utils.metrics import metrics
+from utils.send_scheduler import SendScheduler, SendSchedulerMiddleware
+
+REORDER_SECONDS = 60  # Записи пишутся после обработки: упорядочиваем по времени получения в этом окне
+
+
+def ordered_records(paths: list[str]):
+    """Записи журнала по времени получения (в файле они идут по времени окончания обработки)."""
+    heap = []
+    for seq, record in enumerate(read_journal(paths)):
+        heapq.heappush(heap, (record["t"], seq, record))
+        while heap[0][0] < record["t"] - REORDER_SECONDS:
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def _copy_db(source: str, target: str):
+    """Копия базы через backup API (рабочую базу повтор не меняет)."""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    with dst:
+        src.backup(dst)
+    src.close()
+    dst.close()
+
+
+def _journal_groups(args_paths: list[str]) -> list[list[str]]:
+    """Файлы журнала по источникам: каждая папка (и ее подпапки worker-N) - отдельный поток записей."""
+    groups = []
+    for path in args_paths:
+        if not os.path.isdir(path):
+            groups.append([path])
+            continue
+        directories = [path] + sorted(os.path.join(path, name) for name in os.listdir(path)
+                                      if os.path.isdir(os.path.join(path, name)))
+        groups += [files for directory in directories if (files := journal_files(directory))]
+    return groups
+
+
+async def replay(args) -> dict:
+    groups = _journal_groups(args.journal)
+    paths = [path for group in groups for path in group]
+    if not paths:
+        raise SystemExit("Файлы журнала не найдены.")
+
+    api = FakeBotAPI(latency_ms=args.latency_ms)
+    await api.start()
+    bot = api.make_bot()
+    scheduler = SendScheduler() if args.telegram_limits else SendScheduler(global_rate=1e6, per_chat_rate=1e6)
+    bot.session.middleware(SendSchedulerMiddleware(scheduler))
+    bot.session.middleware(ApiMetricsMiddleware(metrics))
+
+    tmp = tempfile.TemporaryDirectory()
+    db_path = os.path.join(tmp.name, "replay.db")
+    if args.db:
+        _copy_db(args.db, db_path)
+    db = Database(db_path)
+    await db.setup_database()
+    dp = create_dispatcher(db)
+    for middleware in dp.update.outer_middleware:
+        if isinstance(middleware, AntiFloodMiddleware):
+            # Лимиты флуда масштабируются вместе со временем, без пауз отключаются
+            middleware.rate = middleware.rate * args.speed if args.speed else 0
+    outbox = create_outbox(db, bot)
+    outbox.start()
+    broadcaster = Broadcaster(db, bot)
+    workflow_data = dict(db_instance=db, broadcaster=broadcaster, outbox=outbox)
+
+    recorded: dict[str, list[float]] = {}
+    replayed: dict[str, list[float]] = {}
+    stats = {"updates": 0, "errors": 0, "max_lag": 0.0}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+
+    async def feed(record: dict):
+        start = time.perf_counter()
+        try:
+            await dp.feed_raw_update(bot, record["u"], **workflow_data)
+        except Exception:
+            stats["errors"] += 1
+        finally:
+            replayed.setdefault(record["l"], []).append((time.perf_counter() - start) * 1000)
+            semaphore.release()
+
+    started = time.perf_counter()
+    first_t = last_t = None
+    try:
+        records = heapq.merge(*(ordered_records(group) for group in groups), key=lambda record: record["t"])
+        for record in records:
+            if first_t is None:
+                first_t = record["t"]
+            last_t = record["t"]
+            if args.speed:
+                due = started + (record["t"] - first_t) / args.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                stats["max_lag"] = max(stats["max_lag"], time.perf_counter() - due)
+            await semaphore.acquire()
+            recorded.setdefault(record["l"], []).append(record["ms"])
+            stats["updates"] += 1
+            task = asyncio.create_task(feed(record))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        await outbox.stop()
+        await broadcaster.stop()
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        await api.stop()
+        await db.close()
+        tmp.cleanup()
+
+    return {
+        "files": len(paths),
+        "updates": stats["updates"],
+        "errors": stats["errors"],
+        "seconds": elapsed,
+        "recorded_seconds": last_t - first_t if first_t is not None else 0,
+        "max_lag": stats["max_lag"],
+        "labels": {
+            label: {
+                "count": len(values),
+                "recorded_p50": _percentile(values, 0.5),
+                "recorded_p95": _percentile(values, 0.95),
+                "replay_p50": _percentile(replayed.get(label, []), 0.5),
+                "replay_p95": _percentile(replayed.get(label, []), 0.95),
+            }
+            for label, values in recorded.items()
+        },
+    }
+
+
+def _print_report(report: dict, speed: float):
+    mode = f"x{speed:g}" if speed else "без пауз"
+    print(f"Повтор ({mode}): {report['updates']} апдейтов из {report['files']} файлов за {report['seconds']:.2f} с "
+          f"(в записи {report['recorded_seconds']:.2f} с), ошибок: {report['errors']}")
+    if speed:
+        print(f"Максимальное отставание от расписания: {report['max_lag'] * 1000:.0f} мс")
+    print("\nЗадержки обработки (мс): запись -> повтор")
+    for label, row in sorted(report["labels"].items(), key=lambda item: -item[1]["count"]):
+        change = ((row["replay_p95"] - row["recorded_p95"]) / row["recorded_p95"] * 100
+                  if row["recorded_p95"] else 0)
+        print(f"  {label:28} n={row['count']:7}  p50 {row['recorded_p50']:8.1f} -> {row['replay_p50']:8.1f}  "
+              f"p95 {row['recorded_p95']:8.1f} -> {row['replay_p95']:8.1f} ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("journal", nargs="+", help="Файлы журнала или папка с ними")
+    parser.add_argument("--speed", type=float, default=1.0, help="Множитель скорости, 0 - без пауз")
+    parser.add_argument("--concurrency", type=int, default=1000, help="Апдейтов в обработке одновременно")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Задержка ответа фейкового Bot API")
+    parser.add_argument("--no-telegram-limits", dest="telegram_limits", action="store_false",
+                        help="Отключить лимиты отправки Telegram в планировщике")
+    parser.add_argument("--db", help="Начать с копии этой базы (например, рабочей)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)  # Логи каждого апдейта исказят замеры
+    report = asyncio.run(replay(args))
+    _print_report(report, args.speed)
+
+
+if __name__ == "__main__":
+    main()
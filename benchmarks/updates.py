@@ -0,0 +1,64 @@
+# benchmarks/updates.py
+"""Фабрика синтетических апдейтов Telegram (в виде словарей, как их присылает Bot API)."""
+
+import itertools
+import time
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def _message(user_id: int, **fields) -> dict:
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+    }
+    message.update(fields)
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def command(user_id: int, text: str) -> dict:
+    name = text.split()[0]
+    return _message(user_id, text=text, entities=[{"type": "bot_command", "offset": 0, "length": len(name)}])
+
+
+def text(user_id: int, value: str) -> dict:
+    return _message(user_id, text=value)
+
+
+def photo(user_id: int, file_id: str, media_group_id: str | None = None) -> dict:
+    fields = {"photo": [{"file_id": file_id, "file_unique_id": f"u{file_id}", "width": 1280, "height": 960}]}
+    if media_group_id:
+        fields["media_group_id"] = media_group_id
+    return _message(user_id, **fields)
+
+
+def callback(user_id: int, data: str, message_id: int = 1) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "chat_instance": str(user_id),
+            "from": _user(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "...",
+            },
+        },
+    }
+
+
+def inline_query(user_id: int, query: str, offset: str = "") -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "inline_query": {"id": str(next(_update_ids)), "from": _user(user_id), "query": query, "offset": offset},
+    }
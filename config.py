@@ -1,4 +1,5 @@
 import os
+import re
 from dotenv import load_dotenv
 
 # Загружаем переменные из .env файла
@@ -6,6 +7,9 @@ load_dotenv()
 
 # --- Настройки базы данных ---
 DB_NAME = "promo.db"  # Имя файла базы данных SQLite
+DB_READERS = int(os.getenv("DB_READERS", "4"))  # Количество read-only соединений в пуле
+DB_WRITE_BATCH_MS = int(os.getenv("DB_WRITE_BATCH_MS", "5"))  # Окно группировки записей в одну транзакцию, мс
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "256"))  # Максимум запросов в одной транзакции
 
 # --- Основные настройки бота ---
 # Загрузка токена бота
@@ -15,6 +19,22 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 raw_admin_ids = os.getenv("ADMIN_IDS", "")
 ADMIN_IDS = [int(admin_id.strip()) for admin_id in raw_admin_ids.split(',')] if raw_admin_ids else []
 
+# --- Режим получения апдейтов ---
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()  # "polling" или "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный адрес бота, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Обязателен для вебхука, проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_UPDATES = int(os.getenv("WEBHOOK_MAX_UPDATES", "100"))  # Апдейтов в обработке одновременно
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Соединений от Telegram (1-100)
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))  # Ожидание апдейтов при остановке, сек
+
+# --- Многопроцессный режим ---
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "0"))  # Процессов-обработчиков пользователей (0 - все в одном процессе)
+BOT_IPC_DIR = os.getenv("BOT_IPC_DIR", "")  # Папка для Unix-сокетов обработчиков (по умолчанию временная)
+WORKER_MAX_UPDATES = int(os.getenv("WORKER_MAX_UPDATES", "100"))  # Апдейтов в обработке в одном процессе
+
 # --- Настройки почты ---
 # Эти переменные загружаются из .env
 SMTP_EMAIL = os.getenv("SMTP_EMAIL")
@@ -25,14 +45,109 @@ RECEIVER_EMAIL = os.getenv("RECEIVER_EMAIL")
 # Они должны быть загружены из .env и затем доступны для импорта из config.py
 EMAIL_SMTP_SERVER = os.getenv("EMAIL_SMTP_SERVER") # Убедитесь, что это имя соответствует вашему .env
 EMAIL_SMTP_PORT = int(os.getenv("EMAIL_SMTP_PORT")) # Убедитесь, что это имя соответствует вашему .env и что оно int
+EMAIL_SMTP_STARTTLS = os.getenv("EMAIL_SMTP_STARTTLS", "1") == "1"  # Выполнять STARTTLS после подключения
+EMAIL_DIGEST_MAX = int(os.getenv("EMAIL_DIGEST_MAX", "10"))  # Максимум заявок в одном письме-дайджесте
+EMAIL_MAX_RETRIES = int(os.getenv("EMAIL_MAX_RETRIES", "3"))  # Повторов отправки письма при ошибке
+EMAIL_RETRY_DELAY = float(os.getenv("EMAIL_RETRY_DELAY", "2"))  # Начальная задержка между повторами, сек
+
+# --- Лимиты отправки сообщений (ограничения Telegram) ---
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))  # Сообщений в секунду на весь бот
+SEND_PER_CHAT_RATE = float(os.getenv("SEND_PER_CHAT_RATE", "1"))  # Сообщений в секунду в один чат
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))  # Повторов после ответа 429 (retry_after)
+
+# --- Настройки рассылок ---
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "30"))  # Одновременных отправок в рассылке
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "500"))  # Получателей, читаемых из БД за раз
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "3"))  # Обновление прогресса, сек
+
+# --- Настройки хранилища состояний FSM ---
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))  # Записей в LRU-кэше процесса
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(3 * 24 * 3600)))  # Через сколько секунд брошенное состояние удаляется
+FSM_SWEEP_INTERVAL = int(os.getenv("FSM_SWEEP_INTERVAL", "3600"))  # Период очистки устаревших состояний, сек
+
+# --- Защита от флуда ---
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", "1"))  # Апдейтов в секунду от одного пользователя (0 - без ограничения)
+FLOOD_BURST = int(os.getenv("FLOOD_BURST", "5"))  # Сколько апдейтов подряд пропускается без ограничения
+FLOOD_TRACKED_USERS = int(os.getenv("FLOOD_TRACKED_USERS", "50000"))  # Пользователей в LRU счетчиков
+SUBMISSION_DEBOUNCE_SECONDS = float(os.getenv("SUBMISSION_DEBOUNCE_SECONDS", "10"))  # Повторная заявка раньше - дубль
+MEDIA_GROUP_WAIT = float(os.getenv("MEDIA_GROUP_WAIT", "0.6"))  # Сколько ждать остальные фото альбома, сек
+
+# --- Настройки доставки уведомлений админам (outbox) ---
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))  # Уведомлений, отправляемых параллельно
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))  # Попыток доставки до пометки failed
+OUTBOX_RETRY_DELAY = float(os.getenv("OUTBOX_RETRY_DELAY", "2"))  # Начальная задержка повтора, сек
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))  # Период проверки outbox без новых строк, сек
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))  # Сколько строка занята доставкой до повторной выдачи, сек
+
+# --- Журнал апдейтов для воспроизведения нагрузки (benchmarks/replay.py) ---
+JOURNAL_ENABLED = os.getenv("JOURNAL_ENABLED", "0") == "1"  # Записывать все входящие апдейты
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "journal")  # Папка для файлов журнала
+JOURNAL_ROTATE_MB = int(os.getenv("JOURNAL_ROTATE_MB", "64"))  # Новый файл после стольких МБ несжатых данных
+JOURNAL_KEEP = int(os.getenv("JOURNAL_KEEP", "20"))  # Сколько последних файлов хранить
+JOURNAL_SCRUB_PII = os.getenv("JOURNAL_SCRUB_PII", "1") == "1"  # Убирать имена, телефоны и текст сообщений
+
+# --- Метрики ---
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Порт для /metrics в формате Prometheus (0 - не запускать)
+
+# --- Настройки получения ссылок на файлы Telegram ---
+FILE_LINK_CONCURRENCY = int(os.getenv("FILE_LINK_CONCURRENCY", "16"))  # Одновременных запросов get_file
+FILE_LINK_TTL = int(os.getenv("FILE_LINK_TTL", "3300"))  # Время жизни file_path в кэше, сек (ссылка живет ~1 час)
+
+# --- Настройки экспорта ---
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))  # Строк на одну страницу при потоковой выгрузке
+
+# --- Резервные копии базы ---
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")  # Папка для сжатых снимков базы
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "6"))  # Период снимков, ч (0 - только по /backup)
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "14"))  # Сколько последних снимков хранить
+BACKUP_STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", "256"))  # Страниц БД, копируемых за один шаг
+BACKUP_STEP_PAUSE_MS = float(os.getenv("BACKUP_STEP_PAUSE_MS", "5"))  # Пауза между шагами копирования, мс
+EXPORT_FROM_SNAPSHOT = os.getenv("EXPORT_FROM_SNAPSHOT", "0") == "1"  # Выгрузка /get_users_db из последнего снимка
+
+# --- Кампании (розыгрыши) и архив завершенных ---
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")  # Папка для сжатых архивов завершенных кампаний
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))  # Архивировать через N дней после закрытия (0 - только командой)
+ARCHIVE_DELETE_BATCH = int(os.getenv("ARCHIVE_DELETE_BATCH", "1000"))  # Заявок, удаляемых из рабочей базы за транзакцию
+
+# --- Очередь модерации ---
+QUEUE_PAGE_SIZE = int(os.getenv("QUEUE_PAGE_SIZE", "10"))  # Заявок на одной странице /queue
+
+# --- Поиск участников (/find и inline-запросы) ---
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))  # Результатов на странице /find
+SEARCH_INLINE_PAGE_SIZE = int(os.getenv("SEARCH_INLINE_PAGE_SIZE", "20"))  # Результатов в ответе на inline-запрос (до 50)
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "15"))  # Сколько хранить результаты частых запросов, сек
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))  # Страниц результатов в кэше
+
+# --- Розыгрыш ---
+DRAW_BONUS_WEIGHT = float(os.getenv("DRAW_BONUS_WEIGHT", "2"))  # Вес участников со статусом bonus (approved = 1)
+DRAW_PAGE_SIZE = int(os.getenv("DRAW_PAGE_SIZE", "2000"))  # Участников, читаемых из БД за раз
+
+# --- Поиск повторно присланных чеков ---
+RECEIPT_PHASH_DISTANCE = int(os.getenv("RECEIPT_PHASH_DISTANCE", "6"))  # Порог расстояния Хэмминга для похожих чеков (из 64 бит)
 
 # --- Настройки файловой системы ---
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "data/uploads")
 
+# --- Локальное зеркало фотографий заявок ---
+PHOTO_MIRROR_ENABLED = os.getenv("PHOTO_MIRROR_ENABLED", "1") == "1"  # Сохранять фото заявок в UPLOAD_FOLDER
+PHOTO_MIRROR_MAX_MB = int(os.getenv("PHOTO_MIRROR_MAX_MB", "2048"))  # Лимит размера зеркала, МБ (0 - без лимита)
+PHOTO_MIRROR_CONCURRENCY = int(os.getenv("PHOTO_MIRROR_CONCURRENCY", "4"))  # Одновременных скачиваний
+PHOTO_PUBLIC_URL = os.getenv("PHOTO_PUBLIC_URL")  # Адрес, по которому веб-сервер раздает UPLOAD_FOLDER (без него в выгрузке ссылки Telegram)
+
 # Проверка наличия обязательных переменных
 if not BOT_TOKEN or not ADMIN_IDS:
     raise ValueError("Ошибка: BOT_TOKEN и ADMIN_IDS должны быть указаны в .env файле.")
 
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError("Ошибка: BOT_MODE должен быть 'polling' или 'webhook'.")
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise ValueError("Ошибка: для BOT_MODE=webhook нужно указать WEBHOOK_URL в .env файле.")
+# Без секрета любой, кто узнает WEBHOOK_PATH, сможет присылать боту поддельные апдейты (в том числе от имени админов)
+if BOT_MODE == "webhook" and not re.fullmatch(r"[A-Za-z0-9_-]{16,256}", WEBHOOK_SECRET or ""):
+    raise ValueError("Ошибка: для BOT_MODE=webhook нужно указать WEBHOOK_SECRET в .env файле "
+                     "(от 16 до 256 символов A-Z, a-z, 0-9, _ и -).")
+
 # Дополнительная проверка для почты, если вы её используете
 if (SMTP_EMAIL and SMTP_PASSWORD and RECEIVER_EMAIL and EMAIL_SMTP_SERVER and EMAIL_SMTP_PORT) is None:
     print("Предупреждение: Не все настройки SMTP почты указаны в .env, отправка email может не работать.")
\ No newline at end of file
@@ -1,124 +1,980 @@
 # database/database.py
 
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+
 import aiosqlite
-from config import DB_NAME  # Предполагается, что DB_NAME определен в config.py
+from database.migrations import migrate, rebuild_statistics
+from utils.metrics import metrics
+from config import DB_NAME, DB_READERS, DB_WRITE_BATCH_MS, DB_WRITE_BATCH_MAX  # Предполагается, что DB_NAME определен в config.py
+
+logger = logging.getLogger(__name__)
+
+
+def receipt_photos(payload: dict) -> list[str]:
+    """Все фото чеков заявки (в уведомлениях, поставленных до поддержки альбомов, есть только receipt_photo)."""
+    return payload.get("receipt_photos") or [payload["receipt_photo"]]
+
+
+class CampaignClosed(Exception):
+    """Прием заявок закрыт: нет активной кампании."""
 
 
 class Database:
     """
     Класс для управления операциями с базой данных SQLite.
-    Использует одно асинхронное соединение для всех операций.
+    Работает в режиме WAL: чтение идет через небольшой пул read-only соединений,
+    а все записи проходят через одну задачу-писателя, которая собирает
+    накопившиеся запросы и фиксирует их одной транзакцией (group commit).
     """
 
-    def __init__(self, db_name: str = DB_NAME):
+    # Столбцы, которые попадают в выгрузку (без full_name, address, phone_number)
+    PARTICIPANT_EXPORT_COLUMNS = ["id", "user_id", "username", "collection_photo_id", "receipt_photo_ids", "status"]
+    # Столбцы выгрузки, которых нет в participants: все чеки заявки (альбом) через пробел, по порядку
+    EXPORT_COLUMN_SQL = {
+        "receipt_photo_ids": "COALESCE((SELECT group_concat(file_id, ' ') FROM (SELECT file_id FROM submission_receipts "
+                             "WHERE submission_id = participants.id ORDER BY position)), receipt_photo_id)",
+    }
+    CAMPAIGN_COLUMNS = ("id", "name", "status", "created_at", "closed_at", "archived_at",
+                        "archive_path", "archive_sha256", "archive_rows")
+    # Текущая кампания - последняя, заявки которой еще в рабочей базе (активная или закрытая).
+    # Подзапрос без корреляции вычисляется один раз, и условие идет по индексу (campaign_id, ...)
+    CURRENT_CAMPAIGN = "(SELECT MAX(id) FROM campaigns WHERE status != 'archived')"
+
+    def __init__(self, db_name: str = DB_NAME, readers: int = DB_READERS,
+                 batch_interval_ms: int = DB_WRITE_BATCH_MS, batch_max: int = DB_WRITE_BATCH_MAX):
         self.db_name = db_name
-        self.conn = None  # Соединение с базой данных
+        self.conn = None  # Соединение писателя (единственное, через которое идут записи)
+        self.readers_count = max(1, readers)
+        self.batch_interval = batch_interval_ms / 1000
+        self.batch_max = max(1, batch_max)
+
+        self._readers: list[aiosqlite.Connection] = []
+        self._reader_pool: asyncio.Queue | None = None
+        self._write_queue: asyncio.Queue | None = None
+        self._writer_task: asyncio.Task | None = None
+        self._connect_lock = asyncio.Lock()
+
+        # Счетчики для наблюдения за нагрузкой на писателя
+        self.commits = 0
+        self.writes = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
 
     async def connect(self):
-        """Устанавливает соединение с базой данных, если оно еще не установлено."""
-        if self.conn is None:
-            self.conn = await aiosqlite.connect(self.db_name)
-            await self.conn.execute("PRAGMA foreign_keys = ON")  # Включаем поддержку внешних ключей
+        """Открывает соединение писателя, пул читателей и запускает задачу записи."""
+        if self.conn is not None:
+            return
+        async with self._connect_lock:
+            if self.conn is not None:
+                return
+            conn = await aiosqlite.connect(self.db_name, isolation_level=None)
+            await conn.execute("PRAGMA journal_mode = WAL")
+            await conn.execute("PRAGMA synchronous = NORMAL")
+            await conn.execute("PRAGMA foreign_keys = ON")  # Включаем поддержку внешних ключей
+            await conn.execute("PRAGMA busy_timeout = 5000")
+
+            self._reader_pool = asyncio.Queue()
+            for _ in range(self.readers_count):
+                reader = await aiosqlite.connect(f"file:{self.db_name}?mode=ro", uri=True)
+                await reader.execute("PRAGMA foreign_keys = ON")
+                await reader.execute("PRAGMA busy_timeout = 5000")
+                self._readers.append(reader)
+                self._reader_pool.put_nowait(reader)
+
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+            self.conn = conn
 
     async def close(self):
-        """Закрывает соединение с базой данных."""
-        if self.conn:
-            await self.conn.close()
-            self.conn = None
+        """Дожидается записи всех запросов из очереди и закрывает соединения."""
+        if self.conn is None:
+            return
+        await self._write_queue.put(None)  # Сигнал остановки для писателя
+        await self._writer_task
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+        await self.conn.close()
+        self.conn = None
+
+    @asynccontextmanager
+    async def _reader(self):
+        """Берет свободное read-only соединение из пула и возвращает его после использования."""
+        await self.connect()
+        reader = await self._reader_pool.get()
+        try:
+            yield reader
+        finally:
+            self._reader_pool.put_nowait(reader)
+
+    async def _writer_loop(self):
+        """
+        Забирает запросы из очереди и выполняет их пачками в одной транзакции.
+        Первый запрос пачки ждет batch_interval, чтобы к нему успели присоединиться остальные.
+        """
+        stopping = False
+        while not stopping:
+            job = await self._write_queue.get()
+            if job is None:
+                break
+            batch = [job]
+            if self.batch_interval > 0:
+                await asyncio.sleep(self.batch_interval)
+            while len(batch) < self.batch_max and not self._write_queue.empty():
+                job = self._write_queue.get_nowait()
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: list):
+        """
+        Выполняет пачку запросов в одной транзакции. Каждый запрос обернут в SAVEPOINT,
+        поэтому ошибка в одном из них откатывает только его, а не всю пачку.
+        """
+        results = []
+        try:
+            await self.conn.execute("BEGIN IMMEDIATE")
+            for func, future in batch:
+                await self.conn.execute("SAVEPOINT write_job")
+                try:
+                    result = await func(self.conn)
+                except Exception as e:
+                    await self.conn.execute("ROLLBACK TO write_job")
+                    await self.conn.execute("RELEASE write_job")
+                    results.append((future, None, e))
+                else:
+                    await self.conn.execute("RELEASE write_job")
+                    results.append((future, result, None))
+            await self.conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Ошибка при фиксации пачки из {len(batch)} запросов: {e}")
+            try:
+                if self.conn.in_transaction:
+                    await self.conn.execute("ROLLBACK")
+            except Exception as rollback_error:
+                # Откат тоже может не пройти (ошибка диска, закрытое соединение):
+                # ожидающие все равно должны получить ошибку, а писатель - продолжить работу
+                logger.error(f"Не удалось откатить пачку: {rollback_error}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.commits += 1
+        self.writes += len(batch)
+        self.last_batch_size = len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
 
+    @metrics.timed("db_query_seconds")
+    async def run_in_transaction(self, func):
+        """
+        Ставит func(conn) в очередь писателя и ждет фиксации транзакции.
+        Все запросы внутри func выполняются атомарно. Возвращает результат func.
+        """
+        await self.connect()
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((func, future))
+        return await future
+
+    def get_stats(self) -> dict:
+        """Возвращает счетчики писателя: глубину очереди и размеры пачек."""
+        return {
+            "queue_depth": self._write_queue.qsize() if self._write_queue else 0,
+            "commits": self.commits,
+            "writes": self.writes,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": round(self.writes / self.commits, 2) if self.commits else 0,
+        }
+
+    @metrics.timed("db_query_seconds")
     async def execute(self, query: str, params: tuple = ()) -> aiosqlite.Cursor:
         """
-        Выполняет SQL-запрос и фиксирует изменения (COMMIT).
-        Возвращает объект курсора.
+        Выполняет SQL-запрос через писателя и дожидается фиксации (COMMIT).
+        Возвращает объект курсора (доступны rowcount и lastrowid).
         """
-        await self.connect()  # Убедимся, что соединение активно
-        async with self.conn.execute(query, params) as cursor:
-            await self.conn.commit()
-            return cursor
+        async def _job(conn: aiosqlite.Connection):
+            async with conn.execute(query, params) as cursor:
+                return cursor
+
+        return await self.run_in_transaction(_job)
 
+    @metrics.timed("db_query_seconds")
     async def fetchone(self, query: str, params: tuple = ()):
         """
         Выполняет SQL-запрос и возвращает одну строку результата (кортеж).
         """
-        await self.connect()
-        async with self.conn.execute(query, params) as cursor:
-            return await cursor.fetchone()
+        async with self._reader() as reader:
+            async with reader.execute(query, params) as cursor:
+                return await cursor.fetchone()
 
+    @metrics.timed("db_query_seconds")
     async def fetchall(self, query: str, params: tuple = ()):
         """
         Выполняет SQL-запрос и возвращает все строки результата (список кортежей).
         """
-        await self.connect()
-        async with self.conn.execute(query, params) as cursor:
-            return await cursor.fetchall()
+        async with self._reader() as reader:
+            async with reader.execute(query, params) as cursor:
+                return await cursor.fetchall()
 
     async def setup_database(self):
         """
-        Создает таблицы в базе данных, если они еще не существуют.
+        Приводит схему базы данных к текущей версии (см. database/migrations.py).
         Вызывается при запуске приложения.
         """
-        await self.execute('''
-            CREATE TABLE IF NOT EXISTS participants (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL UNIQUE,
-                username TEXT,
-                collection_photo_id TEXT,
-                receipt_photo_id TEXT,
-                status TEXT DEFAULT 'pending',
-                full_name TEXT,
-                address TEXT,
-                phone_number TEXT
-            )
-        ''')
+        before, after = await migrate(self)
+        if before != after:
+            logger.info(f"Схема БД обновлена с версии {before} до {after}.")
         print(f"Таблица 'participants' проверена/создана в {self.db_name}.")
 
     async def add_submission(self, user_id: int, username: str, collection_photo: str,
-                             receipt_photo: str) -> int | None:
+                             receipt_photos: list[str], notifications: list[tuple[str, int | None]] = (),
+                             receipt_unique_ids: list[str] | None = None) -> int | None:
         """
-        Добавляет новую заявку участника или обновляет существующую.
+        Добавляет новую заявку участника в активную кампанию или обновляет существующую.
+        Без активной кампании выбрасывает CampaignClosed.
+        receipt_photos - file_id всех фото чеков (альбом), receipt_unique_ids - их file_unique_id.
+        notifications - список (тип, chat_id) уведомлений, которые ставятся в outbox
+        в той же транзакции, что и заявка. В уведомление попадают заявки других
+        участников с любым из тех же чеков (по file_unique_id).
         Возвращает ID записи.
         """
-        await self.execute('''
-            INSERT INTO participants (user_id, username, collection_photo_id, receipt_photo_id, status)
-            VALUES (?, ?, ?, ?, 'pending')
-            ON CONFLICT(user_id) DO UPDATE SET
-            collection_photo_id = excluded.collection_photo_id,
-            receipt_photo_id = excluded.receipt_photo_id,
-            status = 'pending'
-        ''', (user_id, username, collection_photo, receipt_photo))
-
-        row = await self.fetchone('SELECT id FROM participants WHERE user_id = ?', (user_id,))
-        return row[0] if row else None
+        unique_ids = list(receipt_unique_ids or [None] * len(receipt_photos))
+        receipt_photo, receipt_unique_id = receipt_photos[0], unique_ids[0]
+
+        async def _job(conn: aiosqlite.Connection):
+            async with conn.execute("SELECT id FROM campaigns WHERE status = 'active'") as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                raise CampaignClosed()
+            campaign_id = row[0]
+            await conn.execute('''
+                INSERT INTO participants (campaign_id, user_id, username, collection_photo_id, receipt_photo_id, status,
+                                          receipt_unique_id, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, 'pending', ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT(campaign_id, user_id) DO UPDATE SET
+                username = excluded.username,
+                collection_photo_id = excluded.collection_photo_id,
+                receipt_photo_id = excluded.receipt_photo_id,
+                receipt_unique_id = excluded.receipt_unique_id,
+                status = 'pending',
+                version = version + 1,
+                updated_at = CURRENT_TIMESTAMP
+            ''', (campaign_id, user_id, username, collection_photo, receipt_photo, receipt_unique_id))
+            async with conn.execute(
+                'SELECT id, version FROM participants WHERE campaign_id = ? AND user_id = ?', (campaign_id, user_id)
+            ) as cursor:
+                row = await cursor.fetchone()
+            submission_id, version = row if row else (None, None)
+            await conn.execute('DELETE FROM submission_receipts WHERE submission_id = ?', (submission_id,))
+            await conn.executemany(
+                'INSERT INTO submission_receipts (submission_id, position, file_id, file_unique_id) VALUES (?, ?, ?, ?)',
+                [(submission_id, position, file_id, unique_id)
+                 for position, (file_id, unique_id) in enumerate(zip(receipt_photos, unique_ids))]
+            )
+            # История подач: повторная заявка не затирает прежние фото
+            await conn.execute('''
+                INSERT INTO submissions (submission_id, user_id, username, collection_photo_id, receipt_photo_id,
+                                         receipt_unique_id, receipt_photo_ids)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (submission_id, user_id, username, collection_photo, receipt_photo, receipt_unique_id,
+                  json.dumps(receipt_photos)))
+            duplicates = []
+            known_ids = [unique_id for unique_id in unique_ids if unique_id]
+            if known_ids:
+                async with conn.execute(f'''
+                    SELECT DISTINCT p.id, p.user_id FROM submission_receipts r
+                    JOIN participants p ON p.id = r.submission_id
+                    WHERE r.file_unique_id IN ({", ".join("?" * len(known_ids))}) AND p.user_id != ?
+                    LIMIT 10
+                ''', (*known_ids, user_id)) as cursor:
+                    duplicates = [list(row) for row in await cursor.fetchall()]
+            if notifications:
+                payload = json.dumps({
+                    "submission_id": submission_id,
+                    "campaign_id": campaign_id,
+                    "version": version,
+                    "user_id": user_id,
+                    "username": username,
+                    "collection_photo": collection_photo,
+                    "receipt_photo": receipt_photo,
+                    "receipt_photos": receipt_photos,
+                    "duplicates": duplicates,
+                }, ensure_ascii=False)
+                await conn.executemany(
+                    'INSERT INTO notification_outbox (kind, chat_id, payload) VALUES (?, ?, ?)',
+                    [(kind, chat_id, payload) for kind, chat_id in notifications]
+                )
+            return submission_id
+
+        return await self.run_in_transaction(_job)
 
     async def update_status(self, user_id: int, status: str):
-        """Обновляет статус участника."""
-        await self.execute('UPDATE participants SET status = ? WHERE user_id = ?', (status, user_id))
+        """Обновляет статус участника текущей кампании."""
+        await self.execute(
+            'UPDATE participants SET status = ?, version = version + 1, updated_at = CURRENT_TIMESTAMP '
+            f'WHERE campaign_id = {self.CURRENT_CAMPAIGN} AND user_id = ?', (status, user_id)
+        )
+
+    @staticmethod
+    async def _moderate(conn: aiosqlite.Connection, submission_id: int, expected_version: int | None, status: str,
+                        notification: tuple[str, dict] | None) -> bool:
+        """
+        Compare-and-set статуса одной заявки внутри транзакции писателя.
+        Заявки кампании, которая переносится в архив, не меняются.
+        """
+        if expected_version is None:
+            condition, params = "status = 'pending'", ()
+        else:
+            condition, params = "version = ?", (expected_version,)
+        cursor = await conn.execute(f'''
+            UPDATE participants SET status = ?, version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND {condition}
+            AND campaign_id IN (SELECT id FROM campaigns WHERE status IN ('active', 'closed'))
+        ''', (status, submission_id, *params))
+        if cursor.rowcount != 1:
+            return False
+        if notification:
+            kind, payload = notification
+            await conn.execute('''
+                INSERT INTO notification_outbox (kind, chat_id, payload)
+                SELECT ?, user_id, ? FROM participants WHERE id = ?
+            ''', (kind, json.dumps(payload | {"submission_id": submission_id}, ensure_ascii=False), submission_id))
+        return True
+
+    async def moderate_submission(self, submission_id: int, expected_version: int | None, status: str,
+                                  notification: tuple[str, dict] | None = None) -> tuple[bool, tuple | None]:
+        """
+        Меняет статус заявки, только если она не изменилась с момента показа админу
+        (compare-and-set по version). Без версии (старые кнопки) меняется только заявка в статусе pending.
+        notification - (тип, payload) уведомления пользователю, которое ставится в outbox
+        только при успешном изменении и в той же транзакции.
+        Возвращает (успех, (user_id, status, version) заявки после попытки или None, если ее нет).
+        """
+        async def _job(conn: aiosqlite.Connection):
+            won = await self._moderate(conn, submission_id, expected_version, status, notification)
+            async with conn.execute(
+                'SELECT user_id, status, version FROM participants WHERE id = ?', (submission_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            return won, row
+
+        return await self.run_in_transaction(_job)
+
+    async def moderate_submissions(self, items: list[tuple[int, int]], status: str,
+                                   notification: tuple[str, dict] | None = None) -> list[int]:
+        """
+        Пакетная модерация: compare-and-set для каждой пары (ID заявки, версия) в одной транзакции.
+        Возвращает ID заявок, статус которых изменен (остальные успели измениться).
+        """
+        async def _job(conn: aiosqlite.Connection):
+            return [submission_id for submission_id, version in items
+                    if await self._moderate(conn, submission_id, version, status, notification)]
+
+        return await self.run_in_transaction(_job)
+
+    async def get_pending_page(self, after_id: int = 0, before_id: int | None = None,
+                               limit: int = 10) -> tuple[list[tuple], bool, bool]:
+        """
+        Страница очереди модерации текущей кампании (keyset-пагинация по id через индекс (campaign_id, status)).
+        after_id - следующая страница, before_id - предыдущая.
+        Возвращает (строки (id, user_id, username, version, created_at, есть_дубликат_чека),
+        есть ли страница до, есть ли страница после).
+        """
+        columns = f'''
+            SELECT id, user_id, username, version, created_at,
+                   EXISTS (
+                       SELECT 1 FROM submission_receipts r
+                       JOIN submission_receipts d ON d.file_unique_id = r.file_unique_id
+                       WHERE r.submission_id = p.id AND d.submission_id != p.id
+                   )
+            FROM participants p WHERE campaign_id = {self.CURRENT_CAMPAIGN} AND status = 'pending'
+        '''
+        neighbour = (f"SELECT 1 FROM participants WHERE campaign_id = {self.CURRENT_CAMPAIGN} AND status = 'pending' "
+                     "AND id {} ? LIMIT 1")
+        if before_id is None:
+            rows = await self.fetchall(
+                f"{columns} AND id > ? ORDER BY id LIMIT ?", (after_id, limit + 1)
+            )
+            has_next = len(rows) > limit
+            rows = rows[:limit]
+            has_prev = bool(rows) and await self.fetchone(neighbour.format("<"), (rows[0][0],)) is not None
+        else:
+            rows = await self.fetchall(
+                f"{columns} AND id < ? ORDER BY id DESC LIMIT ?", (before_id, limit + 1)
+            )
+            has_prev = len(rows) > limit
+            rows = rows[:limit][::-1]
+            # Заявки после страницы могли быть разобраны, пока админ листал назад
+            has_next = await self.fetchone(neighbour.format(">"), (rows[-1][0] if rows else before_id - 1,)) is not None
+        return rows, has_prev, has_next
+
+    async def count_pending(self) -> int:
+        row = await self.fetchone(
+            f"SELECT COUNT(*) FROM participants WHERE campaign_id = {self.CURRENT_CAMPAIGN} AND status = 'pending'"
+        )
+        return row[0]
+
+    async def get_submission(self, submission_id: int) -> dict | None:
+        """Возвращает данные заявки в том же виде, что и payload уведомления админам."""
+        row = await self.fetchone('''
+            SELECT id, version, user_id, username, collection_photo_id, receipt_photo_id, status
+            FROM participants WHERE id = ?
+        ''', (submission_id,))
+        if row is None:
+            return None
+        keys = ("submission_id", "version", "user_id", "username", "collection_photo", "receipt_photo", "status")
+        rows = await self.fetchall(
+            'SELECT file_id FROM submission_receipts WHERE submission_id = ? ORDER BY position', (submission_id,)
+        )
+        return dict(zip(keys, row)) | {"receipt_photos": [file_id for file_id, in rows]}
+
+    async def search_participants(self, match: str | None = None, number: int | None = None,
+                                  before_id: int | None = None, limit: int = 10,
+                                  submission_only: bool = False) -> list[tuple]:
+        """
+        Поиск заявок для /find: number ищется как ID заявки и как user_id (по их индексам,
+        с submission_only - только как ID заявки), match - запрос FTS5 к индексу username (см. utils/search.py).
+        Результаты от новых к старым, следующая страница - before_id = ID последней строки.
+        Возвращает строки (id, user_id, username, status, updated_at).
+        """
+        before_id = before_id or 2 ** 63 - 1
+        if number is not None:
+            condition = "id = ?" if submission_only else "(id = ? OR user_id = ?)"
+            params = (number,) if submission_only else (number, number)
+            return await self.fetchall(f'''
+                SELECT id, user_id, username, status, updated_at FROM participants
+                WHERE {condition} AND id < ? ORDER BY id DESC LIMIT ?
+            ''', (*params, before_id, limit))
+        return await self.fetchall('''
+            SELECT p.id, p.user_id, p.username, p.status, p.updated_at
+            FROM participants_fts f JOIN participants p ON p.id = f.rowid
+            WHERE participants_fts MATCH ? AND f.rowid < ?
+            ORDER BY f.rowid DESC LIMIT ?
+        ''', (match, before_id, limit))
+
+    async def save_admin_message(self, submission_id: int, chat_id: int, message_id: int):
+        """Запоминает сообщение с кнопками модерации, отправленное админу."""
+        await self.execute(
+            'INSERT OR REPLACE INTO admin_messages (submission_id, chat_id, message_id) VALUES (?, ?, ?)',
+            (submission_id, chat_id, message_id)
+        )
+
+    async def get_admin_messages(self, submission_id: int) -> list[tuple[int, int]]:
+        """Возвращает (chat_id, message_id) сообщений с заявкой у всех админов."""
+        return await self.fetchall(
+            'SELECT chat_id, message_id FROM admin_messages WHERE submission_id = ?', (submission_id,)
+        )
 
     async def get_approved_users(self) -> list[int]:
-        """Возвращает user_id всех подтвержденных участников."""
-        rows = await self.fetchall("SELECT user_id FROM participants WHERE status IN ('approved', 'bonus')")
+        """Возвращает user_id всех подтвержденных участников текущей кампании."""
+        rows = await self.fetchall(
+            f"SELECT user_id FROM participants WHERE campaign_id = {self.CURRENT_CAMPAIGN} "
+            "AND status IN ('approved', 'bonus')"
+        )
         return [row[0] for row in rows]
 
-    async def get_all_participants_data(self) -> tuple[list[str], list[tuple]]:
+    async def set_receipt_phash(self, submission_id: int, position: int, file_id: str, phash: int):
+        """Сохраняет перцептивный хэш фото чека, если заявка не была изменена с тех пор."""
+        await self.execute(
+            'UPDATE submission_receipts SET phash = ? WHERE submission_id = ? AND position = ? AND file_id = ?',
+            (phash, submission_id, position, file_id)
+        )
+
+    async def get_receipt_phashes(self) -> list[tuple]:
         """
-        Возвращает данные из таблицы 'participants' для экспорта в CSV,
-        исключая 'full_name', 'address', 'phone_number'.
+        Возвращает (id заявки, позиция чека, user_id, campaign_id, phash) всех фото чеков
+        с посчитанным хэшем, кроме заявок архивированных кампаний.
         """
-        await self.connect()
-        # Выбираем только нужные столбцы, исключая full_name, address, phone_number
-        query = """
-            SELECT
-                id,
-                user_id,
-                username,
-                collection_photo_id,
-                receipt_photo_id,
-                status
-            FROM
-                participants
-        """
-        async with self.conn.execute(query) as cursor:
-            rows = await cursor.fetchall()
-            # Названия столбцов будут соответствовать запросу
-            column_names = [description[0] for description in cursor.description]
-            return column_names, rows
\ No newline at end of file
+        return await self.fetchall('''
+            SELECT r.submission_id, r.position, p.user_id, p.campaign_id, r.phash FROM submission_receipts r
+            JOIN participants p ON p.id = r.submission_id
+            WHERE r.phash IS NOT NULL
+            AND p.campaign_id IN (SELECT id FROM campaigns WHERE status != 'archived')
+        ''')
+
+    async def get_submission_campaign_id(self, submission_id: int) -> int | None:
+        """Кампания заявки (None, если заявки уже нет)."""
+        row = await self.fetchone('SELECT campaign_id FROM participants WHERE id = ?', (submission_id,))
+        return row[0] if row else None
+
+    # --- Статистика ---
+
+    async def get_status_counters(self, campaign_id: int | None = None) -> dict[str, int]:
+        """Количество заявок кампании (по умолчанию текущей) по статусам из счетчиков, без подсчета по participants."""
+        return dict(await self.fetchall(
+            f'SELECT status, count FROM status_counters WHERE campaign_id = COALESCE(?, {self.CURRENT_CAMPAIGN})',
+            (campaign_id,)
+        ))
+
+    async def get_hourly_stats(self, since_hour: str) -> list[tuple[str, int, int]]:
+        """Возвращает (час, подач, решений) начиная с since_hour ('YYYY-MM-DD HH:00', UTC)."""
+        return await self.fetchall(
+            'SELECT hour, SUM(submissions), SUM(decisions) FROM hourly_stats WHERE hour >= ? GROUP BY hour ORDER BY hour',
+            (since_hour,)
+        )
+
+    async def rebuild_stats(self) -> dict[tuple[int, str], tuple[int, int]]:
+        """Пересчитывает статистику с нуля. Возвращает найденные расхождения: (кампания, статус) -> (было, стало)."""
+        return await self.run_in_transaction(rebuild_statistics)
+
+    # --- Розыгрыш ---
+
+    async def iter_eligible(self, statuses: tuple[str, ...], page_size: int = 2000, campaign_id: int | None = None):
+        """
+        Отдает участников кампании (по умолчанию текущей) с нужными статусами страницами [(id, user_id, status)].
+        Статусы читаются по очереди: так каждая страница - поиск по индексу (campaign_id, status) без сортировки.
+        Порядок детерминирован (статус из statuses, затем id), это важно для повторяемости розыгрыша.
+        """
+        campaign_id = campaign_id or await self.get_current_campaign_id()
+        for status in statuses:
+            last_id = 0
+            while True:
+                rows = await self.fetchall(
+                    'SELECT id, user_id, status FROM participants WHERE campaign_id = ? AND status = ? AND id > ? '
+                    'ORDER BY id LIMIT ?', (campaign_id, status, last_id, page_size)
+                )
+                if not rows:
+                    break
+                yield rows
+                last_id = rows[-1][0]
+
+    async def save_draw(self, seed: str, bonus_weight: float, eligible: int, input_hash: str, admin_id: int,
+                        winners: list[tuple[int, int, str]], notification: tuple[str, dict] | None = None,
+                        campaign_id: int | None = None) -> int:
+        """
+        Сохраняет розыгрыш кампании (по умолчанию текущей) и победителей (submission_id, user_id, status) по местам.
+        notification - (тип, payload) уведомления, которое ставится в outbox каждому победителю
+        в той же транзакции (к payload добавляются draw_id и место). Возвращает ID розыгрыша.
+        """
+        async def _job(conn: aiosqlite.Connection):
+            cursor = await conn.execute(f'''
+                INSERT INTO draws (seed, winners_count, bonus_weight, eligible, input_hash, admin_id, campaign_id)
+                VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, {self.CURRENT_CAMPAIGN}))
+            ''', (seed, len(winners), bonus_weight, eligible, input_hash, admin_id, campaign_id))
+            draw_id = cursor.lastrowid
+            await conn.executemany(
+                'INSERT INTO draw_winners (draw_id, place, submission_id, user_id, status) VALUES (?, ?, ?, ?, ?)',
+                [(draw_id, place, *winner) for place, winner in enumerate(winners, start=1)]
+            )
+            if notification:
+                kind, payload = notification
+                await conn.executemany(
+                    'INSERT INTO notification_outbox (kind, chat_id, payload) VALUES (?, ?, ?)',
+                    [(kind, user_id, json.dumps(payload | {"draw_id": draw_id, "place": place}))
+                     for place, (_, user_id, _) in enumerate(winners, start=1)]
+                )
+            return draw_id
+
+        return await self.run_in_transaction(_job)
+
+    async def get_draw(self, draw_id: int) -> tuple | None:
+        """Возвращает (seed, winners_count, bonus_weight, eligible, input_hash, created_at, campaign_id) розыгрыша."""
+        return await self.fetchone(
+            'SELECT seed, winners_count, bonus_weight, eligible, input_hash, created_at, campaign_id FROM draws '
+            'WHERE id = ?', (draw_id,)
+        )
+
+    async def get_draw_winners(self, draw_id: int) -> list[tuple]:
+        """Возвращает победителей розыгрыша: (место, submission_id, user_id, status, username)."""
+        return await self.fetchall('''
+            SELECT w.place, w.submission_id, w.user_id, w.status, p.username
+            FROM draw_winners w LEFT JOIN participants p ON p.id = w.submission_id
+            WHERE w.draw_id = ? ORDER BY w.place
+        ''', (draw_id,))
+
+    # --- Кампании ---
+
+    async def get_current_campaign_id(self) -> int | None:
+        """ID текущей кампании (см. CURRENT_CAMPAIGN) или None."""
+        row = await self.fetchone(f"SELECT {self.CURRENT_CAMPAIGN}")
+        return row[0]
+
+    async def get_active_campaign(self) -> tuple[int, str] | None:
+        """(id, название) кампании, которая принимает заявки, или None."""
+        return await self.fetchone("SELECT id, name FROM campaigns WHERE status = 'active'")
+
+    async def get_campaign(self, campaign_id: int) -> dict | None:
+        """Кампания со столбцами CAMPAIGN_COLUMNS или None."""
+        row = await self.fetchone(
+            f"SELECT {', '.join(self.CAMPAIGN_COLUMNS)} FROM campaigns WHERE id = ?", (campaign_id,)
+        )
+        return dict(zip(self.CAMPAIGN_COLUMNS, row)) if row else None
+
+    async def get_campaigns(self) -> list[dict]:
+        """Все кампании от новых к старым (столбцы CAMPAIGN_COLUMNS)."""
+        rows = await self.fetchall(f"SELECT {', '.join(self.CAMPAIGN_COLUMNS)} FROM campaigns ORDER BY id DESC")
+        return [dict(zip(self.CAMPAIGN_COLUMNS, row)) for row in rows]
+
+    async def start_campaign(self, name: str) -> int | None:
+        """Начинает прием заявок в новую кампанию. Возвращает ее ID или None, если активная кампания уже есть."""
+        async def _job(conn: aiosqlite.Connection):
+            cursor = await conn.execute('''
+                INSERT INTO campaigns (name) SELECT ?
+                WHERE NOT EXISTS (SELECT 1 FROM campaigns WHERE status = 'active')
+            ''', (name,))
+            return cursor.lastrowid if cursor.rowcount == 1 else None
+
+        return await self.run_in_transaction(_job)
+
+    async def close_campaign(self) -> int | None:
+        """Закрывает прием заявок в активной кампании. Возвращает ее ID или None, если активной нет."""
+        async def _job(conn: aiosqlite.Connection):
+            async with conn.execute("SELECT id FROM campaigns WHERE status = 'active'") as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return None
+            await conn.execute(
+                "UPDATE campaigns SET status = 'closed', closed_at = CURRENT_TIMESTAMP WHERE id = ?", (row[0],)
+            )
+            return row[0]
+
+        return await self.run_in_transaction(_job)
+
+    async def get_campaigns_to_archive(self, closed_before: str) -> list[int]:
+        """ID кампаний, перенос которых в архив прерван, и закрытых раньше closed_before ('YYYY-MM-DD HH:MM:SS')."""
+        rows = await self.fetchall(
+            "SELECT id FROM campaigns WHERE status = 'archiving' OR (status = 'closed' AND closed_at <= ?) ORDER BY id",
+            (closed_before,)
+        )
+        return [row[0] for row in rows]
+
+    async def begin_campaign_archive(self, campaign_id: int) -> bool:
+        """
+        Переводит закрытую кампанию в статус 'archiving': ее заявки больше не меняются
+        модерацией, поэтому копия в архиве совпадает с тем, что удаляется из рабочей базы.
+        """
+        cursor = await self.execute(
+            "UPDATE campaigns SET status = 'archiving' WHERE id = ? AND status = 'closed'", (campaign_id,)
+        )
+        return cursor.rowcount == 1
+
+    async def save_campaign_archive(self, campaign_id: int, path: str, sha256: str, rows: int):
+        """Запоминает готовый файл архива: после этого заявки кампании можно удалять из рабочей базы."""
+        await self.execute(
+            "UPDATE campaigns SET archive_path = ?, archive_sha256 = ?, archive_rows = ? WHERE id = ?",
+            (path, sha256, rows, campaign_id)
+        )
+
+    async def delete_campaign_rows(self, campaign_id: int, limit: int) -> int:
+        """
+        Удаляет из рабочей базы до limit заявок кампании вместе с историей подач и сообщениями админам
+        (чеки удаляются каскадом, счетчики и индекс поиска - триггерами). Возвращает число удаленных заявок.
+        """
+        async def _job(conn: aiosqlite.Connection):
+            async with conn.execute(
+                'SELECT id FROM participants WHERE campaign_id = ? LIMIT ?', (campaign_id, limit)
+            ) as cursor:
+                ids = [(row[0],) for row in await cursor.fetchall()]
+            await conn.executemany('DELETE FROM submissions WHERE submission_id = ?', ids)
+            await conn.executemany('DELETE FROM admin_messages WHERE submission_id = ?', ids)
+            await conn.executemany('DELETE FROM participants WHERE id = ?', ids)
+            return len(ids)
+
+        return await self.run_in_transaction(_job)
+
+    async def finish_campaign_archive(self, campaign_id: int):
+        """Отмечает кампанию перенесенной в архив и удаляет ее обнулившиеся счетчики."""
+        async def _job(conn: aiosqlite.Connection):
+            await conn.execute(
+                "UPDATE campaigns SET status = 'archived', archived_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (campaign_id,)
+            )
+            await conn.execute('DELETE FROM status_counters WHERE campaign_id = ?', (campaign_id,))
+
+        await self.run_in_transaction(_job)
+
+    # --- Рассылки ---
+
+    async def create_broadcast(self, text: str, admin_chat_id: int,
+                               statuses: tuple[str, ...] = ('approved', 'bonus')) -> tuple[int, int]:
+        """
+        Создает рассылку и список ее получателей (участники текущей кампании с нужными статусами,
+        кроме заблокировавших бота) одной транзакцией.
+        Возвращает (ID рассылки, количество получателей).
+        """
+        placeholders = ", ".join("?" for _ in statuses)
+
+        async def _job(conn: aiosqlite.Connection):
+            cursor = await conn.execute(
+                'INSERT INTO broadcasts (text, admin_chat_id) VALUES (?, ?)', (text, admin_chat_id)
+            )
+            broadcast_id = cursor.lastrowid
+            cursor = await conn.execute(f'''
+                INSERT INTO broadcast_recipients (broadcast_id, user_id)
+                SELECT ?, user_id FROM participants
+                WHERE campaign_id = {self.CURRENT_CAMPAIGN} AND status IN ({placeholders})
+                AND user_id NOT IN (SELECT user_id FROM blocked_users)
+            ''', (broadcast_id, *statuses))
+            total = cursor.rowcount
+            await conn.execute('UPDATE broadcasts SET total = ? WHERE id = ?', (total, broadcast_id))
+            return broadcast_id, total
+
+        return await self.run_in_transaction(_job)
+
+    async def set_broadcast_progress_message(self, broadcast_id: int, message_id: int):
+        """Запоминает сообщение админу, в котором отображается прогресс рассылки."""
+        await self.execute('UPDATE broadcasts SET progress_message_id = ? WHERE id = ?', (message_id, broadcast_id))
+
+    async def get_running_broadcasts(self) -> list[tuple]:
+        """Возвращает незавершенные рассылки: (id, text, admin_chat_id, progress_message_id)."""
+        return await self.fetchall(
+            "SELECT id, text, admin_chat_id, progress_message_id FROM broadcasts WHERE status = 'running'"
+        )
+
+    async def get_pending_broadcast_recipients(self, broadcast_id: int, after_user_id: int, limit: int) -> list[int]:
+        """Возвращает следующую страницу получателей, которым рассылка еще не отправлена."""
+        rows = await self.fetchall('''
+            SELECT user_id FROM broadcast_recipients
+            WHERE broadcast_id = ? AND state = 'pending' AND user_id > ?
+            ORDER BY user_id LIMIT ?
+        ''', (broadcast_id, after_user_id, limit))
+        return [row[0] for row in rows]
+
+    async def mark_broadcast_recipient(self, broadcast_id: int, user_id: int, state: str):
+        """
+        Сохраняет результат доставки одному получателю ('sent', 'failed' или 'blocked').
+        Заблокировавшие бота пользователи исключаются из следующих рассылок.
+        """
+        async def _job(conn: aiosqlite.Connection):
+            await conn.execute(
+                'UPDATE broadcast_recipients SET state = ? WHERE broadcast_id = ? AND user_id = ?',
+                (state, broadcast_id, user_id)
+            )
+            if state == 'blocked':
+                await conn.execute('INSERT OR IGNORE INTO blocked_users (user_id) VALUES (?)', (user_id,))
+
+        await self.run_in_transaction(_job)
+
+    async def get_broadcast_counts(self, broadcast_id: int) -> dict[str, int]:
+        """Возвращает количество получателей рассылки по состояниям доставки."""
+        rows = await self.fetchall(
+            'SELECT state, COUNT(*) FROM broadcast_recipients WHERE broadcast_id = ? GROUP BY state',
+            (broadcast_id,)
+        )
+        return dict(rows)
+
+    async def finish_broadcast(self, broadcast_id: int):
+        """Помечает рассылку завершенной."""
+        await self.execute(
+            "UPDATE broadcasts SET status = 'done', finished_at = CURRENT_TIMESTAMP WHERE id = ?", (broadcast_id,)
+        )
+
+    # --- Хранилище FSM ---
+
+    async def get_fsm_record(self, key: str) -> tuple | None:
+        """Возвращает (state, data, updated_at) для ключа FSM или None."""
+        return await self.fetchone('SELECT state, data, updated_at FROM fsm_storage WHERE key = ?', (key,))
+
+    async def save_fsm_record(self, key: str, state: str | None, data: str, updated_at: float):
+        """Сохраняет состояние и данные FSM (data - JSON-строка)."""
+        await self.execute('''
+            INSERT INTO fsm_storage (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+            state = excluded.state,
+            data = excluded.data,
+            updated_at = excluded.updated_at
+        ''', (key, state, data, updated_at))
+
+    async def delete_fsm_record(self, key: str):
+        """Удаляет запись FSM (пустое состояние без данных)."""
+        await self.execute('DELETE FROM fsm_storage WHERE key = ?', (key,))
+
+    async def delete_expired_fsm_records(self, expire_before: float) -> int:
+        """Удаляет записи FSM, не обновлявшиеся с expire_before. Возвращает количество удаленных."""
+        cursor = await self.execute('DELETE FROM fsm_storage WHERE updated_at < ?', (expire_before,))
+        return cursor.rowcount
+
+    # --- Outbox уведомлений ---
+
+    async def claim_due_outbox(self, now: float, limit: int, lease: float) -> list[tuple]:
+        """
+        Забирает уведомления, которые пора отправить: (id, kind, chat_id, payload, attempts).
+        Строки откладываются на lease секунд, поэтому во время доставки не выдаются повторно;
+        если процесс упадет, не дождавшись результата, строка вернется после lease.
+        """
+        async def _job(conn: aiosqlite.Connection):
+            async with conn.execute('''
+                SELECT id, kind, chat_id, payload, attempts FROM notification_outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id LIMIT ?
+            ''', (now, limit)) as cursor:
+                rows = await cursor.fetchall()
+            await conn.executemany(
+                'UPDATE notification_outbox SET next_attempt_at = ? WHERE id = ?', [(now + lease, row[0]) for row in rows]
+            )
+            return rows
+
+        return await self.run_in_transaction(_job)
+
+    async def release_outbox(self, outbox_ids: list[int]):
+        """Возвращает недоставленные строки в очередь сразу (при остановке диспетчера)."""
+        await self.execute(
+            f'UPDATE notification_outbox SET next_attempt_at = 0 WHERE id IN ({", ".join("?" * len(outbox_ids))})',
+            tuple(outbox_ids)
+        )
+
+    async def complete_outbox(self, outbox_id: int):
+        """Удаляет доставленное уведомление."""
+        await self.execute('DELETE FROM notification_outbox WHERE id = ?', (outbox_id,))
+
+    async def retry_outbox(self, outbox_id: int, attempts: int, next_attempt_at: float, error: str,
+                           give_up: bool = False):
+        """Откладывает уведомление до следующей попытки или помечает его как недоставленное."""
+        await self.execute('''
+            UPDATE notification_outbox SET attempts = ?, next_attempt_at = ?, last_error = ?, status = ?
+            WHERE id = ?
+        ''', (attempts, next_attempt_at, error, 'failed' if give_up else 'pending', outbox_id))
+
+    # --- Локальное зеркало фотографий ---
+
+    async def get_photo_files(self, file_ids: list[str]) -> list[tuple]:
+        """Возвращает сохраненные локально фото: (file_id, sha256, path, last_access)."""
+        if not file_ids:
+            return []
+        placeholders = ", ".join("?" for _ in file_ids)
+        return await self.fetchall(f'''
+            SELECT f.file_id, b.sha256, b.path, b.last_access
+            FROM photo_files f JOIN photo_blobs b ON b.sha256 = f.sha256
+            WHERE f.file_id IN ({placeholders})
+        ''', tuple(file_ids))
+
+    async def save_photo_file(self, file_id: str, sha256: str, path: str, size: int, now: float) -> bool:
+        """
+        Сохраняет файл зеркала и привязывает к нему file_id.
+        Возвращает True, если файл с таким содержимым сохранен впервые.
+        """
+        async def _job(conn: aiosqlite.Connection):
+            cursor = await conn.execute(
+                'INSERT OR IGNORE INTO photo_blobs (sha256, path, size, last_access) VALUES (?, ?, ?, ?)',
+                (sha256, path, size, now)
+            )
+            is_new = cursor.rowcount == 1
+            await conn.execute(
+                'INSERT OR REPLACE INTO photo_files (file_id, sha256) VALUES (?, ?)', (file_id, sha256)
+            )
+            await conn.execute('DELETE FROM photo_evicted WHERE file_id = ?', (file_id,))
+            return is_new
+
+        return await self.run_in_transaction(_job)
+
+    async def touch_photo_blobs(self, hashes: list[str], now: float):
+        """Обновляет время последнего обращения к файлам зеркала (для вытеснения LRU)."""
+        async def _job(conn: aiosqlite.Connection):
+            await conn.executemany(
+                'UPDATE photo_blobs SET last_access = ? WHERE sha256 = ?', [(now, sha256) for sha256 in hashes]
+            )
+
+        await self.run_in_transaction(_job)
+
+    async def get_lru_photo_blobs(self, limit: int) -> list[tuple]:
+        """Возвращает давно не использованные файлы зеркала: (sha256, path, size)."""
+        return await self.fetchall(
+            'SELECT sha256, path, size FROM photo_blobs ORDER BY last_access LIMIT ?', (limit,)
+        )
+
+    async def delete_photo_blobs(self, hashes: list[str]):
+        """
+        Удаляет файлы зеркала из индекса вместе с привязанными к ним file_id.
+        Эти file_id запоминаются как вытесненные, чтобы их не копировали снова.
+        """
+        async def _job(conn: aiosqlite.Connection):
+            await conn.executemany(
+                'INSERT OR IGNORE INTO photo_evicted (file_id) SELECT file_id FROM photo_files WHERE sha256 = ?',
+                [(sha256,) for sha256 in hashes]
+            )
+            await conn.executemany('DELETE FROM photo_blobs WHERE sha256 = ?', [(sha256,) for sha256 in hashes])
+
+        await self.run_in_transaction(_job)
+
+    async def get_photo_storage_totals(self) -> tuple[int, int, int]:
+        """Возвращает (количество файлов, их суммарный размер, количество file_id) зеркала."""
+        blobs, size = await self.fetchone('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM photo_blobs')
+        files, = await self.fetchone('SELECT COUNT(*) FROM photo_files')
+        return blobs, size, files
+
+    # Фото заявок, которых нет в зеркале и которые не были из него вытеснены
+    UNMIRRORED_PHOTOS = '''
+        SELECT file_id FROM (
+            SELECT collection_photo_id AS file_id FROM participants
+            UNION
+            SELECT file_id FROM submission_receipts
+        )
+        WHERE file_id IS NOT NULL AND file_id NOT IN (SELECT file_id FROM photo_files)
+        AND file_id NOT IN (SELECT file_id FROM photo_evicted)
+    '''
+
+    async def get_unmirrored_photo_ids(self, limit: int) -> list[str]:
+        """Возвращает file_id фото заявок, которых еще нет в локальном зеркале (кроме вытесненных)."""
+        rows = await self.fetchall(f'{self.UNMIRRORED_PHOTOS} LIMIT ?', (limit,))
+        return [row[0] for row in rows]
+
+    async def count_unmirrored_photos(self) -> tuple[int, int]:
+        """Возвращает (сколько фото заявок еще не скопировано, сколько file_id вытеснено из зеркала)."""
+        unmirrored, = await self.fetchone(f'SELECT COUNT(*) FROM ({self.UNMIRRORED_PHOTOS})')
+        evicted, = await self.fetchone('SELECT COUNT(*) FROM photo_evicted')
+        return unmirrored, evicted
+
+    async def iter_participants(self, status: str | None = None, page_size: int = 500,
+                                campaign_id: int | None = None):
+        """
+        Асинхронно отдает участников кампании (по умолчанию текущей) страницами (списками кортежей)
+        для потоковой выгрузки. Использует keyset-пагинацию по id, поэтому соединение из пула
+        занято только на время одной страницы. Столбцы соответствуют PARTICIPANT_EXPORT_COLUMNS.
+        """
+        columns = ", ".join(self.EXPORT_COLUMN_SQL.get(column, column) for column in self.PARTICIPANT_EXPORT_COLUMNS)
+        campaign_id = campaign_id or await self.get_current_campaign_id()
+        status_filter = " AND status = ?" if status else ""
+        last_id = 0
+        while True:
+            params = (campaign_id, last_id, status, page_size) if status else (campaign_id, last_id, page_size)
+            rows = await self.fetchall(
+                f"SELECT {columns} FROM participants WHERE campaign_id = ? AND id > ?{status_filter} "
+                "ORDER BY id LIMIT ?", params
+            )
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+
+class SnapshotDatabase(Database):
+    """
+    Снимок базы (см. utils/backup.py) только для чтения: те же методы чтения, что у Database,
+    но без писателя. Файл снимка не меняется, поэтому открывается с immutable=1 - без блокировок и WAL.
+    Нужен, чтобы тяжелые выгрузки не нагружали рабочую базу.
+    """
+
+    async def connect(self):
+        if self._reader_pool is not None:
+            return
+        async with self._connect_lock:
+            if self._reader_pool is not None:
+                return
+            reader_pool = asyncio.Queue()
+            for _ in range(self.readers_count):
+                reader = await aiosqlite.connect(f"file:{self.db_name}?immutable=1", uri=True)
+                self._readers.append(reader)
+                reader_pool.put_nowait(reader)
+            self._reader_pool = reader_pool
+
+    async def close(self):
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+        self._reader_pool = None
+
+    async def run_in_transaction(self, func):
+        raise RuntimeError("Снимок базы доступен только для чтения.")
@@ -0,0 +1,132 @@
+# database/fsm_storage.py
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from config import FSM_CACHE_SIZE, FSM_STATE_TTL, FSM_SWEEP_INTERVAL
+from database.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class _Record:
+    """Состояние и данные FSM одного пользователя в кэше."""
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: str | None, data: dict, updated_at: float):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице fsm_storage базы проекта.
+    Переживает перезапуски бота. Записи дублируются в LRU-кэш процесса (write-through),
+    поэтому повторные чтения не обращаются к диску. Брошенные состояния старше TTL
+    считаются пустыми и периодически удаляются фоновой задачей.
+    """
+
+    def __init__(self, db: Database, cache_size: int = FSM_CACHE_SIZE, ttl: float = FSM_STATE_TTL,
+                 key_builder: KeyBuilder | None = None):
+        self.db = db
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache: OrderedDict[str, _Record] = OrderedDict()
+        self._sweeper: asyncio.Task | None = None
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def start_sweeper(self, interval: float = FSM_SWEEP_INTERVAL):
+        """Запускает периодическое удаление просроченных состояний."""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop(interval))
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        self._cache.clear()
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка при очистке устаревших состояний FSM: {e}")
+
+    async def sweep(self) -> int:
+        """Удаляет состояния, которые не менялись дольше TTL. Возвращает количество удаленных записей."""
+        expire_before = time.time() - self.ttl
+        for cache_key in [k for k, record in self._cache.items() if record.updated_at < expire_before]:
+            del self._cache[cache_key]
+        removed = await self.db.delete_expired_fsm_records(expire_before)
+        if removed:
+            logger.info(f"Удалено {removed} брошенных состояний FSM.")
+        return removed
+
+    def _remember(self, cache_key: str, record: _Record):
+        self._cache[cache_key] = record
+        self._cache.move_to_end(cache_key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, cache_key: str) -> _Record:
+        record = self._cache.get(cache_key)
+        if record is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(cache_key)
+        else:
+            self.cache_misses += 1
+            row = await self.db.get_fsm_record(cache_key)
+            if row is None:
+                record = _Record(None, {}, time.time())  # Пустые записи тоже кэшируем
+            else:
+                state, data, updated_at = row
+                record = _Record(state, json.loads(data) if data else {}, updated_at)
+            self._remember(cache_key, record)
+
+        if (record.state is not None or record.data) and record.updated_at < time.time() - self.ttl:
+            # Состояние брошено слишком давно - считаем его пустым
+            record.state, record.data = None, {}
+        return record
+
+    async def _save(self, cache_key: str, record: _Record):
+        record.updated_at = time.time()
+        self._remember(cache_key, record)
+        if record.state is None and not record.data:
+            await self.db.delete_fsm_record(cache_key)
+        else:
+            await self.db.save_fsm_record(cache_key, record.state, json.dumps(record.data, ensure_ascii=False),
+                                          record.updated_at)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        cache_key = self.key_builder.build(key)
+        record = await self._load(cache_key)
+        record.state = state.state if isinstance(state, State) else state
+        await self._save(cache_key, record)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._load(self.key_builder.build(key))).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise ValueError(f"Data must be a dict, got {type(data).__name__}")
+        cache_key = self.key_builder.build(key)
+        record = await self._load(cache_key)
+        record.data = data.copy()
+        await self._save(cache_key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._load(self.key_builder.build(key))).data.copy()
@@ -0,0 +1,688 @@
+# database/migrations.py
+
+import logging
+import time
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+async def _add_column_if_missing(conn: aiosqlite.Connection, table: str, column: str, definition: str):
+    """Добавляет колонку в таблицу, если ее там еще нет."""
+    async with conn.execute(f'PRAGMA table_info({table})') as cursor:
+        columns = [row[1] for row in await cursor.fetchall()]
+    if column not in columns:
+        await conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+async def _initial_schema(conn: aiosqlite.Connection):
+    """
+    Схема до появления миграций. Все запросы идемпотентны, поэтому миграция
+    подходит и для новой базы, и для базы, созданной прежними версиями бота.
+    """
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS participants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL UNIQUE,
+            username TEXT,
+            collection_photo_id TEXT,
+            receipt_photo_id TEXT,
+            status TEXT DEFAULT 'pending',
+            full_name TEXT,
+            address TEXT,
+            phone_number TEXT
+        )
+    ''')
+    # Колонки для поиска повторно присланных чеков
+    await _add_column_if_missing(conn, 'participants', 'receipt_unique_id', 'TEXT')
+    await _add_column_if_missing(conn, 'participants', 'receipt_phash', 'INTEGER')
+    await conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_participants_receipt_unique_id ON participants (receipt_unique_id)'
+    )
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS blocked_users (
+            user_id INTEGER PRIMARY KEY,
+            blocked_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            admin_chat_id INTEGER NOT NULL,
+            progress_message_id INTEGER,
+            total INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'running',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            finished_at TEXT
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL,
+            state TEXT DEFAULT 'pending',
+            PRIMARY KEY (broadcast_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage (updated_at)')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            chat_id INTEGER,
+            payload TEXT NOT NULL,
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL DEFAULT 0,
+            status TEXT DEFAULT 'pending',
+            last_error TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox (status, next_attempt_at)')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS photo_blobs (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_access REAL NOT NULL
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_photo_blobs_last_access ON photo_blobs (last_access)')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS photo_files (
+            file_id TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL REFERENCES photo_blobs(sha256) ON DELETE CASCADE
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_photo_files_sha256 ON photo_files (sha256)')
+
+
+async def _participant_timestamps_and_history(conn: aiosqlite.Connection):
+    """
+    Индекс по статусу, время создания/изменения заявки и история всех подач.
+    ALTER TABLE не позволяет задать DEFAULT CURRENT_TIMESTAMP, поэтому время
+    проставляет add_submission, а существующим строкам - время миграции.
+    """
+    await conn.execute('CREATE INDEX idx_participants_status ON participants (status)')
+    await conn.execute('ALTER TABLE participants ADD COLUMN created_at TEXT')
+    await conn.execute('ALTER TABLE participants ADD COLUMN updated_at TEXT')
+    await conn.execute('UPDATE participants SET created_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP')
+    await conn.execute('CREATE INDEX idx_participants_updated_at ON participants (updated_at)')
+
+    # Каждая подача заявки (в том числе повторная) добавляет строку; строки не изменяются
+    await conn.execute('''
+        CREATE TABLE submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id INTEGER NOT NULL REFERENCES participants(id),
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            collection_photo_id TEXT,
+            receipt_photo_id TEXT,
+            receipt_unique_id TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await conn.execute('CREATE INDEX idx_submissions_submission_id ON submissions (submission_id)')
+    # Прежние фото затерты при повторных подачах, поэтому история начинается с текущей версии заявок
+    await conn.execute('''
+        INSERT INTO submissions (submission_id, user_id, username, collection_photo_id, receipt_photo_id,
+                                 receipt_unique_id)
+        SELECT id, user_id, username, collection_photo_id, receipt_photo_id, receipt_unique_id FROM participants
+    ''')
+
+
+async def _moderation_versions(conn: aiosqlite.Connection):
+    """
+    Версия заявки для модерации compare-and-set: меняется при каждой подаче и решении админа.
+    admin_messages хранит сообщения с заявкой у каждого админа, чтобы обновить их после решения.
+    """
+    await conn.execute('ALTER TABLE participants ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    await conn.execute('''
+        CREATE TABLE admin_messages (
+            submission_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            PRIMARY KEY (submission_id, chat_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+async def _campaign_statistics(conn: aiosqlite.Connection):
+    """
+    Счетчики заявок по статусам и почасовые корзины подач/решений.
+    Обновляются триггерами в той же транзакции, что и сама запись, поэтому
+    /stats читает несколько строк вместо COUNT(*) по всей таблице.
+    """
+    await conn.execute('''
+        CREATE TABLE status_counters (
+            status TEXT PRIMARY KEY,
+            count INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    await conn.execute('''
+        CREATE TABLE hourly_stats (
+            hour TEXT PRIMARY KEY,
+            submissions INTEGER NOT NULL DEFAULT 0,
+            decisions INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_stats_insert AFTER INSERT ON participants
+        BEGIN
+            INSERT INTO status_counters (status, count) VALUES (NEW.status, 1)
+            ON CONFLICT(status) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_stats_update AFTER UPDATE OF status ON participants
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            UPDATE status_counters SET count = count - 1 WHERE status = OLD.status;
+            INSERT INTO status_counters (status, count) VALUES (NEW.status, 1)
+            ON CONFLICT(status) DO UPDATE SET count = count + 1;
+            INSERT INTO hourly_stats (hour, decisions)
+            SELECT strftime('%Y-%m-%d %H:00', 'now'), 1 WHERE NEW.status != 'pending'
+            ON CONFLICT(hour) DO UPDATE SET decisions = decisions + 1;
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_stats_delete AFTER DELETE ON participants
+        BEGIN
+            UPDATE status_counters SET count = count - 1 WHERE status = OLD.status;
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_submissions_stats_insert AFTER INSERT ON submissions
+        BEGIN
+            INSERT INTO hourly_stats (hour, submissions) VALUES (strftime('%Y-%m-%d %H:00', NEW.created_at), 1)
+            ON CONFLICT(hour) DO UPDATE SET submissions = submissions + 1;
+        END
+    ''')
+    await _rebuild_statistics_before_campaigns(conn)
+
+
+async def _draws(conn: aiosqlite.Connection):
+    """Розыгрыши: зерно и параметры для повторной проверки, победители по местам."""
+    await conn.execute('''
+        CREATE TABLE draws (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            seed TEXT NOT NULL,
+            winners_count INTEGER NOT NULL,
+            bonus_weight REAL NOT NULL,
+            eligible INTEGER NOT NULL,
+            input_hash TEXT NOT NULL,
+            admin_id INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE draw_winners (
+            draw_id INTEGER NOT NULL REFERENCES draws(id) ON DELETE CASCADE,
+            place INTEGER NOT NULL,
+            submission_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            PRIMARY KEY (draw_id, place)
+        ) WITHOUT ROWID
+    ''')
+
+
+async def _multiple_receipts(conn: aiosqlite.Connection):
+    """
+    Несколько фото чеков в одной заявке (альбом). participants.receipt_photo_id остается
+    первым чеком заявки, полный список - в submission_receipts. Поиск одинаковых чеков
+    идет по индексу file_unique_id всех чеков. В истории подач список хранится в JSON.
+    """
+    await conn.execute('''
+        CREATE TABLE submission_receipts (
+            submission_id INTEGER NOT NULL REFERENCES participants(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT,
+            PRIMARY KEY (submission_id, position)
+        ) WITHOUT ROWID
+    ''')
+    await conn.execute(
+        'CREATE INDEX idx_submission_receipts_file_unique_id ON submission_receipts (file_unique_id)'
+    )
+    await conn.execute('''
+        INSERT INTO submission_receipts (submission_id, position, file_id, file_unique_id)
+        SELECT id, 0, receipt_photo_id, receipt_unique_id FROM participants WHERE receipt_photo_id IS NOT NULL
+    ''')
+    await conn.execute('ALTER TABLE submissions ADD COLUMN receipt_photo_ids TEXT')
+
+
+async def _participant_search(conn: aiosqlite.Connection):
+    """
+    Полнотекстовый индекс FTS5 по username для /find и inline-поиска админов.
+    Индекс хранит только токены (external content) и обновляется триггерами
+    в той же транзакции, что и participants. Поиск по ID заявки и user_id идет по их индексам.
+    """
+    await conn.execute('''
+        CREATE VIRTUAL TABLE participants_fts USING fts5(
+            username, content='participants', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_fts_insert AFTER INSERT ON participants
+        BEGIN
+            INSERT INTO participants_fts (rowid, username) VALUES (NEW.id, NEW.username);
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_fts_update AFTER UPDATE OF username ON participants
+        WHEN OLD.username IS NOT NEW.username
+        BEGIN
+            INSERT INTO participants_fts (participants_fts, rowid, username) VALUES ('delete', OLD.id, OLD.username);
+            INSERT INTO participants_fts (rowid, username) VALUES (NEW.id, NEW.username);
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_fts_delete AFTER DELETE ON participants
+        BEGIN
+            INSERT INTO participants_fts (participants_fts, rowid, username) VALUES ('delete', OLD.id, OLD.username);
+        END
+    ''')
+    await conn.execute("INSERT INTO participants_fts (participants_fts) VALUES ('rebuild')")
+
+
+async def _campaigns(conn: aiosqlite.Connection):
+    """
+    Несколько розыгрышей (кампаний) в одной базе. Заявка принадлежит кампании,
+    уникальность user_id - в пределах кампании. Существующие заявки и розыгрыши
+    попадают в первую кампанию. Завершенные кампании переносятся в архив (utils/archive.py).
+    UNIQUE(user_id) нельзя убрать через ALTER TABLE, поэтому participants пересоздается.
+    Внешние ключи включены, а PRAGMA foreign_keys в транзакции не меняется: дочерние
+    таблицы тоже пересоздаются со ссылкой на новую таблицу, а RENAME переписывает ссылки.
+    """
+    await conn.execute('''
+        CREATE TABLE campaigns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'active',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            closed_at TEXT,
+            archived_at TEXT,
+            archive_path TEXT,
+            archive_sha256 TEXT,
+            archive_rows INTEGER
+        )
+    ''')
+    # Заявки принимает не больше одной кампании
+    await conn.execute("CREATE UNIQUE INDEX idx_campaigns_active ON campaigns (status) WHERE status = 'active'")
+    await conn.execute("INSERT INTO campaigns (id, name) VALUES (1, 'ChocoWow')")
+
+    sequences = {}
+    for table in ('participants', 'submissions'):
+        async with conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)) as cursor:
+            row = await cursor.fetchone()
+        sequences[table] = row[0] if row else 0
+
+    await conn.execute('''
+        CREATE TABLE participants_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            collection_photo_id TEXT,
+            receipt_photo_id TEXT,
+            status TEXT DEFAULT 'pending',
+            full_name TEXT,
+            address TEXT,
+            phone_number TEXT,
+            receipt_unique_id TEXT,
+            receipt_phash INTEGER,
+            created_at TEXT,
+            updated_at TEXT,
+            version INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (campaign_id, user_id)
+        )
+    ''')
+    await conn.execute('''
+        INSERT INTO participants_new (id, campaign_id, user_id, username, collection_photo_id, receipt_photo_id,
+                                      status, full_name, address, phone_number, receipt_unique_id, receipt_phash,
+                                      created_at, updated_at, version)
+        SELECT id, 1, user_id, username, collection_photo_id, receipt_photo_id, status, full_name, address,
+               phone_number, receipt_unique_id, receipt_phash, created_at, updated_at, version
+        FROM participants
+    ''')
+    await conn.execute('''
+        CREATE TABLE submissions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id INTEGER NOT NULL REFERENCES participants_new(id),
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            collection_photo_id TEXT,
+            receipt_photo_id TEXT,
+            receipt_unique_id TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            receipt_photo_ids TEXT
+        )
+    ''')
+    await conn.execute('''
+        INSERT INTO submissions_new (id, submission_id, user_id, username, collection_photo_id, receipt_photo_id,
+                                     receipt_unique_id, created_at, receipt_photo_ids)
+        SELECT id, submission_id, user_id, username, collection_photo_id, receipt_photo_id,
+               receipt_unique_id, created_at, receipt_photo_ids
+        FROM submissions
+    ''')
+    await conn.execute('''
+        CREATE TABLE submission_receipts_new (
+            submission_id INTEGER NOT NULL REFERENCES participants_new(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT,
+            PRIMARY KEY (submission_id, position)
+        ) WITHOUT ROWID
+    ''')
+    await conn.execute('INSERT INTO submission_receipts_new SELECT * FROM submission_receipts')
+
+    # Вместе с таблицами удаляются их индексы и триггеры (статистика, FTS)
+    for table in ('submission_receipts', 'submissions', 'participants'):
+        await conn.execute(f'DROP TABLE {table}')
+    for table in ('participants', 'submissions', 'submission_receipts'):
+        await conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+    for table, seq in sequences.items():
+        await conn.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+        await conn.execute(
+            f'INSERT INTO sqlite_sequence (name, seq) SELECT ?, MAX(?, COALESCE(MAX(id), 0)) FROM {table}',
+            (table, seq)
+        )
+
+    # Запросы бота читают одну кампанию: статус и id (rowid) идут в индексе после campaign_id
+    await conn.execute('CREATE INDEX idx_participants_campaign_status ON participants (campaign_id, status)')
+    await conn.execute('CREATE INDEX idx_participants_user_id ON participants (user_id)')
+    await conn.execute('CREATE INDEX idx_participants_updated_at ON participants (updated_at)')
+    await conn.execute(
+        'CREATE INDEX idx_participants_receipt_unique_id ON participants (receipt_unique_id)'
+    )
+    await conn.execute('CREATE INDEX idx_submissions_submission_id ON submissions (submission_id)')
+    await conn.execute(
+        'CREATE INDEX idx_submission_receipts_file_unique_id ON submission_receipts (file_unique_id)'
+    )
+
+    # Счетчики статусов - по кампаниям
+    await conn.execute('DROP TABLE status_counters')
+    await conn.execute('''
+        CREATE TABLE status_counters (
+            campaign_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (campaign_id, status)
+        ) WITHOUT ROWID
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_stats_insert AFTER INSERT ON participants
+        BEGIN
+            INSERT INTO status_counters (campaign_id, status, count) VALUES (NEW.campaign_id, NEW.status, 1)
+            ON CONFLICT(campaign_id, status) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_stats_update AFTER UPDATE OF status ON participants
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            UPDATE status_counters SET count = count - 1 WHERE campaign_id = OLD.campaign_id AND status = OLD.status;
+            INSERT INTO status_counters (campaign_id, status, count) VALUES (NEW.campaign_id, NEW.status, 1)
+            ON CONFLICT(campaign_id, status) DO UPDATE SET count = count + 1;
+            INSERT INTO hourly_stats (hour, decisions)
+            SELECT strftime('%Y-%m-%d %H:00', 'now'), 1 WHERE NEW.status != 'pending'
+            ON CONFLICT(hour) DO UPDATE SET decisions = decisions + 1;
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_stats_delete AFTER DELETE ON participants
+        BEGIN
+            UPDATE status_counters SET count = count - 1 WHERE campaign_id = OLD.campaign_id AND status = OLD.status;
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_submissions_stats_insert AFTER INSERT ON submissions
+        BEGIN
+            INSERT INTO hourly_stats (hour, submissions) VALUES (strftime('%Y-%m-%d %H:00', NEW.created_at), 1)
+            ON CONFLICT(hour) DO UPDATE SET submissions = submissions + 1;
+        END
+    ''')
+
+    # Индекс FTS5 (external content) ссылается на participants по имени - нужны только триггеры
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_fts_insert AFTER INSERT ON participants
+        BEGIN
+            INSERT INTO participants_fts (rowid, username) VALUES (NEW.id, NEW.username);
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_fts_update AFTER UPDATE OF username ON participants
+        WHEN OLD.username IS NOT NEW.username
+        BEGIN
+            INSERT INTO participants_fts (participants_fts, rowid, username) VALUES ('delete', OLD.id, OLD.username);
+            INSERT INTO participants_fts (rowid, username) VALUES (NEW.id, NEW.username);
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_fts_delete AFTER DELETE ON participants
+        BEGIN
+            INSERT INTO participants_fts (participants_fts, rowid, username) VALUES ('delete', OLD.id, OLD.username);
+        END
+    ''')
+    await conn.execute("INSERT INTO participants_fts (participants_fts) VALUES ('rebuild')")
+
+    await conn.execute('ALTER TABLE draws ADD COLUMN campaign_id INTEGER')
+    await conn.execute('UPDATE draws SET campaign_id = 1')
+    await _rebuild_status_counters(conn)
+
+
+async def _receipt_phashes(conn: aiosqlite.Connection):
+    """
+    Перцептивный хэш у каждого фото чека, а не только у первого (participants.receipt_phash
+    больше не используется). Уже посчитанные хэши первых чеков переносятся.
+    """
+    await conn.execute('ALTER TABLE submission_receipts ADD COLUMN phash INTEGER')
+    await conn.execute('''
+        UPDATE submission_receipts SET phash = (
+            SELECT p.receipt_phash FROM participants p
+            WHERE p.id = submission_receipts.submission_id AND p.receipt_photo_id = submission_receipts.file_id
+        )
+        WHERE position = 0
+    ''')
+
+
+async def _campaign_hourly_stats(conn: aiosqlite.Connection):
+    """
+    Почасовая статистика по кампаниям. Заявки архивированной кампании удаляются из рабочей
+    базы, поэтому пересчет статистики должен трогать только кампании, которые еще в ней.
+    Часы, которые не объясняются текущими заявками (история уже архивированных кампаний),
+    сохраняются с campaign_id = 0. Триггеры ссылаются на hourly_stats, поэтому удаляются
+    до замены таблицы и создаются заново.
+    """
+    await conn.execute('DROP TRIGGER trg_participants_stats_update')
+    await conn.execute('DROP TRIGGER trg_submissions_stats_insert')
+    await conn.execute('''
+        CREATE TABLE hourly_stats_new (
+            hour TEXT NOT NULL,
+            campaign_id INTEGER NOT NULL,
+            submissions INTEGER NOT NULL DEFAULT 0,
+            decisions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, campaign_id)
+        ) WITHOUT ROWID
+    ''')
+    await _fill_hourly_stats(conn, 'hourly_stats_new')
+    async with conn.execute("SELECT 1 FROM campaigns WHERE status IN ('archiving', 'archived') LIMIT 1") as cursor:
+        has_archived = await cursor.fetchone() is not None
+    if has_archived:
+        await conn.execute('''
+            INSERT INTO hourly_stats_new (hour, campaign_id, submissions, decisions)
+            SELECT * FROM (
+                SELECT o.hour, 0, MAX(o.submissions - COALESCE(SUM(n.submissions), 0), 0) AS submissions,
+                       MAX(o.decisions - COALESCE(SUM(n.decisions), 0), 0) AS decisions
+                FROM hourly_stats o LEFT JOIN hourly_stats_new n ON n.hour = o.hour
+                GROUP BY o.hour
+            ) WHERE submissions > 0 OR decisions > 0
+        ''')
+    await conn.execute('DROP TABLE hourly_stats')
+    await conn.execute('ALTER TABLE hourly_stats_new RENAME TO hourly_stats')
+    await conn.execute('''
+        CREATE TRIGGER trg_participants_stats_update AFTER UPDATE OF status ON participants
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            UPDATE status_counters SET count = count - 1 WHERE campaign_id = OLD.campaign_id AND status = OLD.status;
+            INSERT INTO status_counters (campaign_id, status, count) VALUES (NEW.campaign_id, NEW.status, 1)
+            ON CONFLICT(campaign_id, status) DO UPDATE SET count = count + 1;
+            INSERT INTO hourly_stats (hour, campaign_id, decisions)
+            SELECT strftime('%Y-%m-%d %H:00', 'now'), NEW.campaign_id, 1 WHERE NEW.status != 'pending'
+            ON CONFLICT(hour, campaign_id) DO UPDATE SET decisions = decisions + 1;
+        END
+    ''')
+    await conn.execute('''
+        CREATE TRIGGER trg_submissions_stats_insert AFTER INSERT ON submissions
+        BEGIN
+            INSERT INTO hourly_stats (hour, campaign_id, submissions)
+            SELECT strftime('%Y-%m-%d %H:00', NEW.created_at), campaign_id, 1 FROM participants
+            WHERE id = NEW.submission_id
+            ON CONFLICT(hour, campaign_id) DO UPDATE SET submissions = submissions + 1;
+        END
+    ''')
+
+
+async def _photo_mirror_evictions(conn: aiosqlite.Connection):
+    """
+    file_id фото, вытесненных из локального зеркала. Без них вытесненные фото снова
+    считались бы нескопированными, и /storage sync скачивал бы их по кругу.
+    """
+    await conn.execute('''
+        CREATE TABLE photo_evicted (
+            file_id TEXT PRIMARY KEY
+        ) WITHOUT ROWID
+    ''')
+
+
+async def _rebuild_statistics_before_campaigns(conn: aiosqlite.Connection) -> dict[str, tuple[int, int]]:
+    """
+    rebuild_statistics для схемы до миграции _campaigns (счетчики без campaign_id).
+    Пересчитывает счетчики статусов и почасовую статистику с нуля.
+    Время решений по старым заявкам неизвестно, для них берется updated_at.
+    Возвращает расхождения счетчиков: статус -> (было, стало).
+    """
+    async with conn.execute('SELECT status, count FROM status_counters') as cursor:
+        before = dict(await cursor.fetchall())
+    await conn.execute('DELETE FROM status_counters')
+    await conn.execute('''
+        INSERT INTO status_counters (status, count)
+        SELECT status, COUNT(*) FROM participants WHERE status IS NOT NULL GROUP BY status
+    ''')
+    async with conn.execute('SELECT status, count FROM status_counters') as cursor:
+        after = dict(await cursor.fetchall())
+
+    await conn.execute('DELETE FROM hourly_stats')
+    await conn.execute('''
+        INSERT INTO hourly_stats (hour, submissions)
+        SELECT strftime('%Y-%m-%d %H:00', created_at), COUNT(*) FROM submissions GROUP BY 1
+    ''')
+    await conn.execute('''
+        INSERT INTO hourly_stats (hour, decisions)
+        SELECT strftime('%Y-%m-%d %H:00', updated_at), COUNT(*) FROM participants
+        WHERE status != 'pending' AND updated_at IS NOT NULL GROUP BY 1
+        ON CONFLICT(hour) DO UPDATE SET decisions = excluded.decisions
+    ''')
+    return {status: (before.get(status, 0), after.get(status, 0))
+            for status in before.keys() | after.keys() if before.get(status, 0) != after.get(status, 0)}
+
+
+async def _rebuild_status_counters(conn: aiosqlite.Connection) -> dict[tuple[int, str], tuple[int, int]]:
+    """Пересчитывает счетчики статусов по кампаниям. Возвращает расхождения: (кампания, статус) -> (было, стало)."""
+    async with conn.execute('SELECT campaign_id, status, count FROM status_counters') as cursor:
+        before = {(campaign_id, status): count for campaign_id, status, count in await cursor.fetchall()}
+    await conn.execute('DELETE FROM status_counters')
+    await conn.execute('''
+        INSERT INTO status_counters (campaign_id, status, count)
+        SELECT campaign_id, status, COUNT(*) FROM participants WHERE status IS NOT NULL GROUP BY campaign_id, status
+    ''')
+    async with conn.execute('SELECT campaign_id, status, count FROM status_counters') as cursor:
+        after = {(campaign_id, status): count for campaign_id, status, count in await cursor.fetchall()}
+    return {key: (before.get(key, 0), after.get(key, 0))
+            for key in before.keys() | after.keys() if before.get(key, 0) != after.get(key, 0)}
+
+
+# Кампании, заявки которых целиком лежат в рабочей базе (перенос в архив удаляет их пачками)
+_LIVE_CAMPAIGNS = "SELECT id FROM campaigns WHERE status IN ('active', 'closed')"
+
+
+async def _fill_hourly_stats(conn: aiosqlite.Connection, table: str):
+    """
+    Считает почасовую статистику кампаний из _LIVE_CAMPAIGNS в таблицу table.
+    Время решений по старым заявкам неизвестно, для них берется updated_at.
+    """
+    await conn.execute(f'''
+        INSERT INTO {table} (hour, campaign_id, submissions)
+        SELECT strftime('%Y-%m-%d %H:00', s.created_at), p.campaign_id, COUNT(*) FROM submissions s
+        JOIN participants p ON p.id = s.submission_id
+        WHERE p.campaign_id IN ({_LIVE_CAMPAIGNS}) GROUP BY 1, 2
+    ''')
+    await conn.execute(f'''
+        INSERT INTO {table} (hour, campaign_id, decisions)
+        SELECT strftime('%Y-%m-%d %H:00', updated_at), campaign_id, COUNT(*) FROM participants
+        WHERE campaign_id IN ({_LIVE_CAMPAIGNS}) AND status != 'pending' AND updated_at IS NOT NULL GROUP BY 1, 2
+        ON CONFLICT(hour, campaign_id) DO UPDATE SET decisions = excluded.decisions
+    ''')
+
+
+async def rebuild_statistics(conn: aiosqlite.Connection) -> dict[tuple[int, str], tuple[int, int]]:
+    """
+    Пересчитывает счетчики статусов по кампаниям и почасовую статистику с нуля.
+    Почасовая статистика кампаний в архиве (и переносимых в него) не пересчитывается:
+    их заявок в рабочей базе уже нет, поэтому сохраняется то, что насчитали триггеры.
+    Возвращает расхождения счетчиков: (кампания, статус) -> (было, стало).
+    """
+    drift = await _rebuild_status_counters(conn)
+    await conn.execute(f'DELETE FROM hourly_stats WHERE campaign_id IN ({_LIVE_CAMPAIGNS})')
+    await _fill_hourly_stats(conn, 'hourly_stats')
+    return drift
+
+
+# Миграции применяются по порядку, номер версии схемы = позиция в списке (PRAGMA user_version).
+# Уже выпущенные миграции не изменяются - только добавляются новые в конец.
+MIGRATIONS = [
+    _initial_schema,
+    _participant_timestamps_and_history,
+    _moderation_versions,
+    _campaign_statistics,
+    _draws,
+    _multiple_receipts,
+    _participant_search,
+    _campaigns,
+    _receipt_phashes,
+    _campaign_hourly_stats,
+    _photo_mirror_evictions,
+]
+
+
+async def migrate(db) -> tuple[int, int]:
+    """
+    Применяет недостающие миграции одной транзакцией через писателя БД:
+    при ошибке схема и user_version остаются прежними.
+    Возвращает (версия до, версия после).
+    """
+    async def _job(conn: aiosqlite.Connection):
+        async with conn.execute('PRAGMA user_version') as cursor:
+            current, = await cursor.fetchone()
+        if current > len(MIGRATIONS):
+            raise RuntimeError(f"Версия схемы БД ({current}) новее, чем известно боту ({len(MIGRATIONS)}).")
+        for version, migration in enumerate(MIGRATIONS[current:], start=current + 1):
+            start = time.perf_counter()
+            await migration(conn)
+            logger.info(f"Миграция {version} ({migration.__name__}) применена за {time.perf_counter() - start:.2f} с")
+        await conn.execute(f'PRAGMA user_version = {len(MIGRATIONS)}')
+        return current, len(MIGRATIONS)
+
+    return await db.run_in_transaction(_job)
@@ -1,18 +1,32 @@
 # handlers/admin_handlers.py
 
 import asyncio
+import html
 import logging
+import os
 from aiogram import Router, F, Bot
-from aiogram.filters import Command, BaseFilter
-from aiogram.types import Message, CallbackQuery, InputMediaPhoto, BufferedInputFile  # Используем BufferedInputFile
-from aiogram.exceptions import TelegramBadRequest
-from datetime import datetime  # Импортируем datetime для даты/времени в имени файла
-
-from config import ADMIN_IDS
-from database.database import Database as DB
-from keyboards.inline import get_admin_keyboard
+from aiogram.filters import Command, CommandObject, BaseFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, CallbackQuery, InputMediaPhoto, FSInputFile, InlineKeyboardMarkup  # FSInputFile отправляет файл с диска
+from aiogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from datetime import datetime, timedelta, timezone  # Импортируем datetime для даты/времени в имени файла
+
+from config import ADMIN_IDS, QUEUE_PAGE_SIZE, SEARCH_PAGE_SIZE, SEARCH_INLINE_PAGE_SIZE, SEARCH_CACHE_TTL
+from database.database import Database as DB, SnapshotDatabase, receipt_photos
+from keyboards.inline import get_admin_keyboard, get_queue_keyboard, get_search_keyboard
 from utils.email_sender import send_email_with_photos
-from utils.export_data import generate_participants_csv  # Импортируем утилиту для генерации CSV
+from utils.broadcast import Broadcaster
+from utils.outbox import OutboxDispatcher
+from utils.metrics import metrics
+from utils.photo_mirror import photo_mirror
+from utils.receipt_hashes import receipt_index
+from utils.draw import run_draw
+from utils.backup import backup_manager
+from utils.archive import campaign_archiver
+from utils.search import participant_search, parse_query
+from utils.send_scheduler import send_priority, PRIORITY_BULK
+from utils.export_data import export_participants, parse_export_args  # Утилиты для потоковой выгрузки
 
 router = Router()
 
@@ -25,125 +39,784 @@ class IsAdmin(BaseFilter):
         return message.from_user.id in ADMIN_IDS
 
 
-# Функция для отправки заявки админам
-async def send_submission_to_admin(bot: Bot, submission_id: int, user_id: int, username: str, collection_photo: str,
-                                   receipt_photo: str):
+# Типы уведомлений о новой заявке, которые ставятся в outbox
+NOTIFY_ADMIN_SUBMISSION = "admin_submission"
+NOTIFY_SUBMISSION_EMAIL = "submission_email"
+NOTIFY_MIRROR_PHOTOS = "mirror_photos"
+NOTIFY_USER_DECISION = "user_decision"
+NOTIFY_DRAW_WINNER = "draw_winner"
+
+# Действия кнопок модерации -> статус заявки
+MODERATION_ACTIONS = {"approve": "approved", "bonus": "bonus", "reject": "rejected"}
+# Сообщение пользователю о решении по заявке
+USER_DECISION_TEXTS = {
+    "approved": "Вы стали участником розыгрыша!",
+    "bonus": "Поздравляем! Вам доступен гарантированный приз!",
+    "rejected": "Ваше участие не подтверждено. Попробуйте снова: /start",
+}
+STATUS_TITLES = {
+    "approved": "ПОДТВЕРЖДЕНА",
+    "bonus": "ПОДТВЕРЖДЕНА С БОНУСОМ",
+    "rejected": "ОТКЛОНЕНА",
+    "pending": "ожидает решения",
+}
+CAMPAIGN_STATUS_TITLES = {
+    "active": "принимает заявки",
+    "closed": "прием закрыт",
+    "archiving": "переносится в архив",
+    "archived": "в архиве",
+}
+
+
+def submission_notifications() -> list[tuple[str, int | None]]:
+    """Уведомления о новой заявке: копирование фото на диск, по одному на каждого админа и одно письмо."""
+    mirror = [(NOTIFY_MIRROR_PHOTOS, None)] if photo_mirror.enabled else []
+    return (mirror + [(NOTIFY_ADMIN_SUBMISSION, admin_id) for admin_id in ADMIN_IDS]
+            + [(NOTIFY_SUBMISSION_EMAIL, None)])
+
+
+def format_receipt_warnings(payload: dict, similar: list[tuple[int, int, int]]) -> str:
+    """Предупреждения о том, что такой же или похожий чек уже присылали другие участники."""
+    lines = []
+    duplicates = payload.get("duplicates") or []
+    duplicate_ids = {sub_id for sub_id, _ in duplicates}
+    for sub_id, dup_user_id in duplicates:
+        lines.append(f"⚠️ Этот же чек уже был в заявке №{sub_id} (ID: {dup_user_id})")
+    for sub_id, similar_user_id, distance in similar:
+        if sub_id not in duplicate_ids:
+            lines.append(f"⚠️ Похожий чек в заявке №{sub_id} (ID: {similar_user_id}), отличие {distance}/64")
+    return "".join(f"{line}\n" for line in lines)
+
+
+# Функция для отправки заявки админу (вызывается диспетчером outbox, ошибки приводят к повтору)
+async def send_submission_to_admin(bot: Bot, admin_id: int, payload: dict, db: DB, title: str | None = None,
+                                   save_message: bool = True):
+    submission_id, user_id, username = payload["submission_id"], payload["user_id"], payload["username"]
     caption_for_text_message = (
-        f"Новая заявка №{submission_id}\n"
+        f"{title or f'Новая заявка №{submission_id}'}\n"
         f"От: @{username} (ID: {user_id})\n"
+        f"{format_receipt_warnings(payload, await receipt_index.check_submission(payload))}"
         f"Выберите действие:"
     )
-    keyboard = get_admin_keyboard(submission_id, user_id)
+    keyboard = get_admin_keyboard(submission_id, user_id, payload.get("version"))
 
+    receipts = receipt_photos(payload)
     media_group = [
-        InputMediaPhoto(media=collection_photo, caption="Фото коллекции"),
-        InputMediaPhoto(media=receipt_photo, caption="Фото чеков")
-    ]
+        InputMediaPhoto(media=payload["collection_photo"], caption="Фото коллекции"),
+        InputMediaPhoto(media=receipts[0], caption="Фото чеков" if len(receipts) == 1 else f"Фото чеков ({len(receipts)})")
+    ] + [InputMediaPhoto(media=file_id) for file_id in receipts[1:]]
+
+    # В одном альбоме Telegram от 2 до 10 фото
+    for i in range(0, len(media_group), 10):
+        chunk = media_group[i:i + 10]
+        if len(chunk) == 1:
+            await bot.send_photo(admin_id, chunk[0].media, caption=chunk[0].caption)
+        else:
+            await bot.send_media_group(admin_id, media=chunk)
+    sent = await bot.send_message(admin_id, caption_for_text_message, reply_markup=keyboard)
+    # Запоминаем сообщение, чтобы убрать кнопки у всех админов после решения одного из них.
+    # Повторный показ (очередь, поиск) не сохраняется: он заменил бы исходное уведомление в admin_messages,
+    # и его кнопки остались бы активными. Устаревшие кнопки показа отклоняются по версии заявки.
+    if save_message:
+        await db.save_admin_message(submission_id, admin_id, sent.message_id)
+
+
+# Сообщаем пользователю о решении (вызывается диспетчером outbox)
+async def send_user_decision(bot: Bot, user_id: int, payload: dict):
+    if payload.get("bulk"):
+        send_priority.set(PRIORITY_BULK)  # Уведомления пакетной модерации не задерживают остальные ответы
+    try:
+        await bot.send_message(user_id, USER_DECISION_TEXTS[payload["status"]])
+    except (TelegramForbiddenError, TelegramBadRequest) as e:
+        # Повтор не поможет (бот заблокирован или чат не найден), сообщаем админу, принявшему решение
+        logger.error(f"Не удалось уведомить пользователя {user_id}: {e}")
+        await bot.send_message(payload["admin_id"], f"⚠️ Не удалось уведомить пользователя {user_id}: {e}")
 
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_media_group(admin_id, media=media_group)
-            await bot.send_message(admin_id, caption_for_text_message, reply_markup=keyboard)
-        except Exception as e:
-            logger.error(f"Не удалось отправить сообщение админу {admin_id}: {e}")
 
-    # Отправляем письмо с фото админам (если настроено)
+# Отправляем письмо с фото админам, если настроено (вызывается диспетчером outbox, ошибка SMTP приводит к повтору)
+async def send_submission_email(bot: Bot, _chat_id: None, payload: dict):
     await send_email_with_photos(
         bot=bot,
-        caption=f"Новая заявка №{submission_id} от @{username} (ID: {user_id})",
-        file_ids=[collection_photo, receipt_photo]
+        caption=f"Новая заявка №{payload['submission_id']} от @{payload['username']} (ID: {payload['user_id']})",
+        file_ids=[payload["collection_photo"], *receipt_photos(payload)]
     )
 
 
-@router.callback_query(F.data.startswith("admin:"))
-async def process_admin_action(callback: CallbackQuery, bot: Bot, db_instance: DB):
-    await callback.answer("Обрабатываю запрос...")
+# Сообщаем победителю розыгрыша (вызывается диспетчером outbox)
+async def send_draw_winner(bot: Bot, user_id: int, payload: dict):
+    send_priority.set(PRIORITY_BULK)  # Победителей может быть много, не задерживаем остальные ответы
+    try:
+        await bot.send_message(user_id, f"🎉 Поздравляем! Вы стали победителем розыгрыша (место {payload['place']}). "
+                                        f"Мы свяжемся с вами для вручения приза.")
+    except (TelegramForbiddenError, TelegramBadRequest) as e:
+        logger.error(f"Не удалось уведомить победителя {user_id} (розыгрыш №{payload['draw_id']}): {e}")
+        await bot.send_message(payload["admin_id"], f"⚠️ Не удалось уведомить победителя {user_id} "
+                                                    f"(место {payload['place']}): {e}")
+
+
+# Сохраняем фото заявки в локальное зеркало (ошибка скачивания приводит к повтору)
+async def mirror_submission_photos(bot: Bot, _chat_id: None, payload: dict):
+    if photo_mirror.started:
+        await photo_mirror.mirror_many([payload["collection_photo"], *receipt_photos(payload)])
 
+
+async def _edit_admin_message(bot: Bot, chat_id: int, message_id: int, text: str):
+    """Заменяет сообщение с заявкой у админа на итог модерации и убирает кнопки."""
+    try:
+        await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id, reply_markup=None)
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e):
+            logger.info(f"Сообщение админа {chat_id} уже было изменено или не требует изменений.")
+        else:
+            logger.error(f"Не удалось изменить сообщение админа {chat_id}: {e}")
+    except Exception as e:
+        logger.error(f"Неизвестная ошибка при редактировании сообщения админа {chat_id}: {e}")
+
+
+async def _finish_admin_messages(bot: Bot, db: DB, submission_id: int, status: str,
+                                 extra: tuple[int, int] | None = None):
+    """Показывает решение по заявке во всех сообщениях с ней у админов."""
+    text = f"✅ Заявка №{submission_id} {STATUS_TITLES[status]}."
+    messages = set(await db.get_admin_messages(submission_id))
+    if extra:
+        messages.add(extra)
+    await asyncio.gather(*(_edit_admin_message(bot, chat_id, message_id, text) for chat_id, message_id in messages))
+
+
+# Нажатия, которые обрабатываются прямо сейчас: (ID заявки, версия).
+# Одновременные нажатия на одну и ту же заявку не доходят до БД.
+_moderation_inflight: set[tuple[int, int | None]] = set()
+
+
+@router.callback_query(F.data.startswith("admin:"))
+async def process_admin_action(callback: CallbackQuery, bot: Bot, db_instance: DB, outbox: OutboxDispatcher):
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("У вас нет прав.", show_alert=True)
         return
 
-    _, action, sub_id, user_id_str = callback.data.split(":")
-    submission_id = int(sub_id)
-    user_id = int(user_id_str)
+    # admin:<действие>:<ID заявки>:<ID пользователя>[:<версия заявки>]
+    parts = callback.data.split(":")
+    action, submission_id = parts[1], int(parts[2])
+    version = int(parts[4]) if len(parts) > 4 else None
+    status = MODERATION_ACTIONS.get(action)
+    if status is None:
+        await callback.answer()
+        return
 
-    actions = {
-        "approve": ("approved", "Вы стали участником розыгрыша!"),
-        "bonus": ("bonus", "Поздравляем! Вам доступен гарантированный приз!"),
-        "reject": ("rejected", "Ваше участие не подтверждено. Попробуйте снова: /start")
-    }
+    key = (submission_id, version)
+    if key in _moderation_inflight:
+        await callback.answer("Заявка уже обрабатывается.")
+        return
+    _moderation_inflight.add(key)
+    try:
+        # Статус меняется, только если заявка не изменилась с момента показа кнопок;
+        # уведомление пользователю ставится в outbox той же транзакцией
+        won, row = await db_instance.moderate_submission(
+            submission_id, version, status,
+            notification=(NOTIFY_USER_DECISION, {"submission_id": submission_id, "status": status,
+                                                 "admin_id": callback.from_user.id})
+        )
+    finally:
+        _moderation_inflight.discard(key)
 
-    if action in actions:
-        status, text_for_user = actions[action]
-        await db_instance.update_status(user_id, status)
-        try:
-            await bot.send_message(user_id, text_for_user)
-        except Exception as e:
-            logger.error(f"Не удалось уведомить пользователя {user_id}: {e}")
-            await bot.send_message(callback.from_user.id, f"⚠️ Не удалось уведомить пользователя {user_id}: {e}")
+    if row is None:
+        await callback.answer("Заявка не найдена.", show_alert=True)
+        return
+    _, current_status, _ = row
+
+    if not won:
+        if current_status == "pending":
+            # Пользователь подал заявку заново, решение нужно принимать по новому сообщению
+            text = f"Заявка №{submission_id} была обновлена пользователем, смотрите новое сообщение."
+        else:
+            text = f"Заявка №{submission_id} уже {STATUS_TITLES[current_status]}."
+        await callback.answer(text, show_alert=True)
+        await _edit_admin_message(bot, callback.message.chat.id, callback.message.message_id, text)
+        return
 
-        status_text = {"approve": "ПОДТВЕРЖДЕНА", "bonus": "ПОДТВЕРЖДЕНА С БОНУСОМ", "reject": "ОТКЛОНЕНА"}
+    outbox.wake()
+    await callback.answer("Готово.")
+    # Только победившее решение обновляет сообщения с заявкой у всех админов
+    await _finish_admin_messages(bot, db_instance, submission_id, status,
+                                 extra=(callback.message.chat.id, callback.message.message_id))
+
+
+# --- КОМАНДА: ОЧЕРЕДЬ МОДЕРАЦИИ ---
+async def _render_queue(db: DB, state: FSMContext, after_id: int = 0,
+                        before_id: int | None = None) -> tuple[str, InlineKeyboardMarkup | None]:
+    """
+    Формирует страницу очереди. Показанные заявки (с версиями) и выбранные админом
+    хранятся в данных FSM админа, чтобы кнопки подтверждения работали с тем, что он видел.
+    """
+    rows, has_prev, has_next = await db.get_pending_page(after_id, before_id, QUEUE_PAGE_SIZE)
+    if not rows:
+        await state.update_data(queue_page=[], queue_after=0)
+        return "Очередь модерации пуста.", None
+
+    data = await state.get_data()
+    selected = {submission_id for submission_id, _ in data.get("queue_selected", [])}
+    await state.update_data(queue_page=[[row[0], row[3]] for row in rows], queue_after=rows[0][0] - 1)
+
+    lines = [f"<b>Очередь модерации</b>: {await db.count_pending()} заявок", ""]
+    for submission_id, user_id, username, _, created_at, duplicate in rows:
+        warning = " ⚠️ чек уже присылали" if duplicate else ""
+        lines.append(f"№{submission_id} @{username} (ID: {user_id}), {created_at or '—'}{warning}")
+    keyboard = get_queue_keyboard(
+        [(row[0], f"№{row[0]} @{row[2]}") for row in rows], selected,
+        first_id=rows[0][0], last_id=rows[-1][0], has_prev=has_prev, has_next=has_next
+    )
+    return "\n".join(lines), keyboard
 
-        try:
-            await callback.message.edit_text(
-                text=f"✅ Заявка №{submission_id} {status_text[action]}.",
-                reply_markup=None
-            )
-        except TelegramBadRequest as e:
-            if "message is not modified" in str(e):
-                logger.info(f"Сообщение админа уже было изменено или не требует изменений для заявки {submission_id}.")
-            else:
-                raise e
-        except Exception as e:
-            logger.error(f"Неизвестная ошибка при редактировании сообщения админа для заявки {submission_id}: {e}")
+
+async def _show_queue_page(callback: CallbackQuery, db: DB, state: FSMContext, after_id: int = 0,
+                           before_id: int | None = None):
+    text, keyboard = await _render_queue(db, state, after_id, before_id)
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+
+
+@router.message(Command("queue"), IsAdmin())
+async def cmd_queue(message: Message, db_instance: DB, state: FSMContext):
+    await state.update_data(queue_selected=[])
+    text, keyboard = await _render_queue(db_instance, state)
+    await message.answer(text, reply_markup=keyboard)
+
+
+@router.callback_query(F.data.startswith("queue:"), F.from_user.id.in_(ADMIN_IDS))
+async def process_queue_action(callback: CallbackQuery, bot: Bot, db_instance: DB, state: FSMContext,
+                               outbox: OutboxDispatcher):
+    action, _, argument = callback.data.removeprefix("queue:").partition(":")
+    data = await state.get_data()
+
+    if action == "page":
+        await callback.answer()
+        await _show_queue_page(callback, db_instance, state, after_id=int(argument))
+    elif action == "prev":
+        await callback.answer()
+        await _show_queue_page(callback, db_instance, state, before_id=int(argument))
+    elif action == "sel":
+        submission_id = int(argument)
+        selected = dict(data.get("queue_selected", []))
+        if submission_id in selected:
+            del selected[submission_id]
+        else:
+            page = dict(data.get("queue_page", []))
+            if submission_id not in page:
+                await callback.answer("Заявка уже не на этой странице.")
+                return
+            selected[submission_id] = page[submission_id]
+        await state.update_data(queue_selected=list(selected.items()))
+        await callback.answer()
+        await _show_queue_page(callback, db_instance, state, after_id=data.get("queue_after", 0))
+    elif action == "photos":
+        payload = await db_instance.get_submission(int(argument))
+        if payload is None:
+            await callback.answer("Заявка не найдена.", show_alert=True)
+            return
+        await callback.answer()
+        await send_submission_to_admin(bot, callback.from_user.id, payload, db_instance, save_message=False)
+    elif action in ("approve_page", "approve_selected"):
+        selected = dict(data.get("queue_selected", []))
+        items = list(selected.items()) if action == "approve_selected" else data.get("queue_page", [])
+        if not items:
+            await callback.answer("Нечего подтверждать.")
+            return
+        # Все заявки подтверждаются одной транзакцией (compare-and-set по версии, которую видел админ),
+        # уведомления пользователям уходят через outbox с лимитами отправки
+        approved = await db_instance.moderate_submissions(
+            [tuple(item) for item in items], "approved",
+            notification=(NOTIFY_USER_DECISION, {"status": "approved", "admin_id": callback.from_user.id,
+                                                 "bulk": True})
+        )
+        outbox.wake()
+        skipped = len(items) - len(approved)
+        for submission_id, _ in items:
+            selected.pop(submission_id, None)
+        await state.update_data(queue_selected=list(selected.items()))
+        await callback.answer(f"Подтверждено: {len(approved)}" + (f", уже изменены: {skipped}" if skipped else ""))
+        await _show_queue_page(callback, db_instance, state, after_id=data.get("queue_after", 0))
+        await asyncio.gather(*(_finish_admin_messages(bot, db_instance, submission_id, "approved")
+                               for submission_id in approved))
+    else:
+        await callback.answer()
 
 
 # --- КОМАНДА: ЭКСПОРТ БАЗЫ ДАННЫХ ---
 @router.message(Command("get_users_db"), IsAdmin())
-async def cmd_get_users_db(message: Message, bot: Bot, db_instance: DB):
+async def cmd_get_users_db(message: Message, bot: Bot, db_instance: DB, command: CommandObject):
+    # Необязательные параметры: /get_users_db status=approved format=csv.gz campaign=2
+    try:
+        status, fmt, campaign_id = parse_export_args(command.args)
+    except ValueError as e:
+        await message.answer(str(e))
+        return
+    campaign = await db_instance.get_campaign(campaign_id) if campaign_id else None
+    if campaign_id and campaign is None:
+        await message.answer(f"Кампания №{campaign_id} не найдена. Список кампаний: /campaign")
+        return
+
     await message.answer("Подготовка данных пользователей...")
 
+    if campaign and campaign["status"] == "archived":
+        # Завершенная кампания читается из своего архива
+        try:
+            async with campaign_archiver.open_archive(campaign) as archive_db:
+                await _send_export(message, bot, archive_db, status, fmt, campaign_id,
+                                   f"\nАрхив кампании №{campaign_id} «{html.escape(campaign['name'])}»")
+        except Exception as e:
+            await message.answer(f"Не удалось открыть архив кампании: {e}")
+            logger.error(f"Ошибка при чтении архива кампании №{campaign_id}: {e}")
+        return
+
+    # С EXPORT_FROM_SNAPSHOT выгрузка читает последний снимок (см. /backup), а не рабочую базу
+    snapshot_path = backup_manager.latest_snapshot()
+    source = SnapshotDatabase(snapshot_path, readers=1) if snapshot_path else db_instance
+    note = ""
+    if snapshot_path:
+        snapshot_time = datetime.fromtimestamp(os.path.getmtime(snapshot_path))
+        note = f"\nДанные снимка от {snapshot_time.strftime('%d.%m.%Y %H:%M')}"
     try:
-        # Получаем данные из БД (уже без address, phone, full_name благодаря изменению в database.py)
-        column_names, rows = await db_instance.get_all_participants_data()
+        await _send_export(message, bot, source, status, fmt, campaign_id, note)
+    finally:
+        if source is not db_instance:
+            await source.close()
 
-        if not rows:
+
+async def _send_export(message: Message, bot: Bot, source: DB, status: str | None, fmt: str,
+                       campaign_id: int | None, note: str):
+    file_path = None
+    try:
+        # Потоково выгружаем участников во временный файл (без address, phone, full_name)
+        file_path, rows_count = await export_participants(source, bot, status=status, fmt=fmt,
+                                                          campaign_id=campaign_id)
+
+        if not rows_count:
             await message.answer("В базе данных пока нет участников.")
             return
 
-        # Генерируем CSV-файл в памяти, передавая объект bot для получения file_path
-        csv_buffer = await generate_participants_csv(column_names, rows, bot)
-
         # Формируем имя файла с датой и временем
         now = datetime.now()
         # Пример: "11 07 2025 16_53" (день месяц год часы_минуты)
         filename_timestamp = now.strftime("%d %m %Y %H_%M")
-        file_name = f"participants_{filename_timestamp}.csv"
+        status_suffix = f"_{status}" if status else ""
+        campaign_suffix = f"_campaign{campaign_id}" if campaign_id else ""
+        file_name = f"participants{campaign_suffix}{status_suffix}_{filename_timestamp}.{fmt}"
 
         await bot.send_document(
             chat_id=message.chat.id,
-            document=BufferedInputFile(csv_buffer.getvalue(), filename=file_name),
-            # Используем BufferedInputFile и новое имя файла
-            caption="Вот база данных всех участников:"
+            document=FSInputFile(file_path, filename=file_name),  # Файл отправляется с диска частями
+            caption=f"Вот база данных участников ({rows_count} шт.):{note}"
         )
         await message.answer("База данных пользователей отправлена.")
 
     except Exception as e:
         await message.answer(f"Произошла ошибка при получении данных: {e}")
         logger.error(f"Ошибка при экспорте данных: {e}")
+    finally:
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
 
 
 @router.message(Command("sendreminder"), IsAdmin())
-async def cmd_send_reminder(message: Message, bot: Bot, db_instance: DB):
-    users = await db_instance.get_approved_users()
+async def cmd_send_reminder(message: Message, broadcaster: Broadcaster):
     text = "Напоминаем, что уже сегодня пройдет розыгрыш призов! 🏆"
-    count = 0
-    for user_id in users:
+    # Рассылка идет в фоне, прогресс отображается в отдельном сообщении
+    broadcast_id, total = await broadcaster.start(text, message.chat.id)
+    if not total:
+        await message.answer("Нет подтвержденных участников для рассылки.")
+        return
+    await message.answer(f"Рассылка №{broadcast_id} запущена: {total} получателей.")
+
+
+# --- КОМАНДА: СТАТИСТИКА ---
+SPARK_BARS = "▁▂▃▄▅▆▇█"
+
+
+def _sparkline(values: list[int]) -> str:
+    peak = max(values, default=0)
+    if not peak:
+        return SPARK_BARS[0] * len(values)
+    return "".join(SPARK_BARS[round(value / peak * (len(SPARK_BARS) - 1))] for value in values)
+
+
+@router.message(Command("stats"), IsAdmin())
+async def cmd_stats(message: Message, db_instance: DB, command: CommandObject):
+    # /stats rebuild - пересчитать счетчики с нуля и показать расхождения
+    if (command.args or "").strip().lower() == "rebuild":
+        drift = await db_instance.rebuild_stats()
+        if drift:
+            details = ", ".join(f"№{campaign_id} {status}: {before} → {after}"
+                                for (campaign_id, status), (before, after) in sorted(drift.items()))
+            await message.answer(f"Статистика пересчитана, исправлены расхождения: {details}")
+        else:
+            await message.answer("Статистика пересчитана, расхождений нет.")
+        return
+
+    # Счетчики и почасовые корзины обновляются триггерами, поэтому запросы не зависят от размера базы
+    campaign_id = await db_instance.get_current_campaign_id()
+    campaign = await db_instance.get_campaign(campaign_id) if campaign_id else None
+    counters = await db_instance.get_status_counters(campaign_id)
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    hours = [(now - timedelta(hours=i)).strftime("%Y-%m-%d %H:00") for i in range(23, -1, -1)]
+    buckets = {hour: (submissions, decisions)
+               for hour, submissions, decisions in await db_instance.get_hourly_stats(hours[0])}
+    submissions = [buckets.get(hour, (0, 0))[0] for hour in hours]
+    decisions = [buckets.get(hour, (0, 0))[1] for hour in hours]
+
+    lines = [
+        f"<b>Статистика розыгрыша</b>: {_campaign_line(campaign) if campaign else 'нет текущей кампании'}",
+        f"Всего заявок: {sum(counters.values())}",
+        f"⏳ На рассмотрении: {counters.get('pending', 0)}",
+        f"✅ Подтверждено: {counters.get('approved', 0)}",
+        f"🎁 С доп. призом: {counters.get('bonus', 0)}",
+        f"❌ Отклонено: {counters.get('rejected', 0)}",
+        "",
+        f"<b>Последние 24 ч (UTC)</b>: подач {sum(submissions)}, решений {sum(decisions)}",
+        f"Подачи:  <code>{_sparkline(submissions)}</code>",
+        f"Решения: <code>{_sparkline(decisions)}</code>",
+    ]
+    if any(submissions):
+        peak = max(range(len(hours)), key=submissions.__getitem__)
+        lines.append(f"Пик подач: {hours[peak][11:]} — {submissions[peak]}")
+    await message.answer("\n".join(lines))
+
+
+# --- КОМАНДА: РОЗЫГРЫШ ---
+async def _answer_lines(message: Message, lines: list[str], chunk: int = 50):
+    """Отправляет длинный список несколькими сообщениями (лимит Telegram - 4096 символов)."""
+    for i in range(0, len(lines), chunk):
+        await message.answer("\n".join(lines[i:i + chunk]))
+
+
+async def _verify_draw(message: Message, db: DB, draw_id: int):
+    draw = await db.get_draw(draw_id)
+    if draw is None:
+        await message.answer(f"Розыгрыш №{draw_id} не найден.")
+        return
+    seed, winners_count, bonus_weight, eligible, input_hash, created_at, campaign_id = draw
+    saved = [(submission_id, user_id, status)
+             for _, submission_id, user_id, status, _ in await db.get_draw_winners(draw_id)]
+    campaign = await db.get_campaign(campaign_id)
+    if campaign and campaign["status"] == "archived":
+        # Участники завершенной кампании есть только в ее архиве
+        async with campaign_archiver.open_archive(campaign) as archive_db:
+            result = await run_draw(archive_db, winners_count, seed, bonus_weight, campaign_id=campaign_id)
+    else:
+        result = await run_draw(db, winners_count, seed, bonus_weight, campaign_id=campaign_id)
+    lines = [f"<b>Проверка розыгрыша №{draw_id}</b> от {created_at}", f"Зерно: <code>{seed}</code>"]
+    if result.input_hash != input_hash:
+        lines.append(f"⚠️ Список участников изменился с момента розыгрыша "
+                     f"(было {eligible}, сейчас {result.eligible}), повторить результат нельзя.")
+    elif result.winners == saved:
+        lines.append(f"✅ Список участников ({eligible}) не изменился, результат совпадает с сохраненным.")
+    else:
+        lines.append("❌ Результат НЕ совпадает с сохраненным!")
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("draw"), IsAdmin())
+async def cmd_draw(message: Message, db_instance: DB, command: CommandObject, outbox: OutboxDispatcher):
+    # /draw N [зерно] - выбрать N победителей, /draw verify ID - повторить розыгрыш по сохраненному зерну
+    args = (command.args or "").split()
+    if len(args) == 2 and args[0].lower() == "verify" and args[1].isdigit():
+        await _verify_draw(message, db_instance, int(args[1]))
+        return
+    if not args or not args[0].isdigit() or int(args[0]) < 1 or len(args) > 2:
+        await message.answer("Использование: /draw N [зерно] — выбрать N победителей среди подтвержденных участников\n"
+                             "/draw verify ID — проверить проведенный розыгрыш")
+        return
+
+    # Розыгрыш и его запись относятся к одной кампании, даже если тем временем начнется следующая
+    campaign_id = await db_instance.get_current_campaign_id()
+    result = await run_draw(db_instance, int(args[0]), args[1] if len(args) == 2 else None, campaign_id=campaign_id)
+    if not result.winners:
+        await message.answer("Нет подтвержденных участников для розыгрыша.")
+        return
+    draw_id = await db_instance.save_draw(result.seed, result.bonus_weight, result.eligible, result.input_hash,
+                                          message.from_user.id, result.winners,
+                                          (NOTIFY_DRAW_WINNER, {"admin_id": message.from_user.id}), campaign_id)
+    outbox.wake()
+
+    usernames = {submission_id: username
+                 for _, submission_id, _, _, username in await db_instance.get_draw_winners(draw_id)}
+    lines = [
+        f"<b>Розыгрыш №{draw_id}</b> (кампания №{campaign_id}): участников {result.eligible}, "
+        f"победителей {len(result.winners)}",
+        f"Зерно: <code>{result.seed}</code> (вес bonus: {result.bonus_weight:g})",
+        f"Проверка: /draw verify {draw_id}",
+        "",
+    ]
+    lines += [f"{place}. @{usernames.get(submission_id)} (ID: {user_id}), заявка №{submission_id}"
+              + (" 🎁" if status == "bonus" else "")
+              for place, (submission_id, user_id, status) in enumerate(result.winners, start=1)]
+    await _answer_lines(message, lines)
+
+
+# --- КОМАНДА: ПРОИЗВОДИТЕЛЬНОСТЬ ---
+@router.message(Command("perf"), IsAdmin())
+async def cmd_perf(message: Message, db_instance: DB):
+    uptime = metrics.uptime()
+    updates = sum(metrics.counters.get("bot_updates_total", {}).values())
+    lines = [
+        f"Аптайм: {uptime / 3600:.1f} ч, апдейтов: {updates} ({updates / uptime:.2f}/с)",
+        f"Отброшено защитой от флуда: {sum(metrics.counters.get('bot_updates_dropped_total', {}).values())}",
+        "",
+        "<b>Хендлеры</b> (p50 / p95 / p99, мс, кол-во):",
+    ]
+
+    def _format(histograms: dict) -> list[str]:
+        rows = []
+        for name, histogram in sorted(histograms.items(), key=lambda item: -item[1].count):
+            rows.append(
+                f"<code>{name}</code>: {histogram.percentile(0.5) * 1000:.0f} / "
+                f"{histogram.percentile(0.95) * 1000:.0f} / {histogram.percentile(0.99) * 1000:.0f}, "
+                f"{histogram.count}"
+            )
+        return rows or ["нет данных"]
+
+    lines += _format(metrics.histograms.get("bot_handler_seconds", {}))
+    lines += ["", "<b>База данных</b>:"] + _format(metrics.histograms.get("db_query_seconds", {}))
+    db_stats = db_instance.get_stats()
+    lines.append(f"Очередь записи: {db_stats['queue_depth']}, средняя пачка: {db_stats['avg_batch_size']}")
+    lines += ["", "<b>Bot API</b>:"] + _format(metrics.histograms.get("telegram_api_seconds", {}))
+    for section, title in (("email_seconds", "Email"), ("export_seconds", "Экспорт"),
+                           ("backup_seconds", "Снимки базы"), ("archive_seconds", "Архив кампаний")):
+        if section in metrics.histograms:
+            lines += ["", f"<b>{title}</b>:"] + _format(metrics.histograms[section])
+    await message.answer("\n".join(lines))
+
+
+# --- КОМАНДА: ЛОКАЛЬНОЕ ХРАНИЛИЩЕ ФОТО ---
+@router.message(Command("storage"), IsAdmin())
+async def cmd_storage(message: Message, command: CommandObject):
+    if not photo_mirror.started:
+        await message.answer("Локальное зеркало фото отключено (PHOTO_MIRROR_ENABLED=0).")
+        return
+    # /storage sync - скопировать фото заявок, поданных до включения зеркала
+    if (command.args or "").strip().lower() == "sync":
+        started = photo_mirror.start_backfill()
+        await message.answer("Копирование фото старых заявок запущено." if started
+                             else "Копирование уже идет.")
+        return
+
+    summary = await photo_mirror.get_summary()
+    mb = 1024 * 1024
+    limit = f"{photo_mirror.max_bytes / mb:.0f} МБ" if photo_mirror.max_bytes else "без лимита"
+    lines = [
+        "<b>Зеркало фото</b>",
+        f"Файлов: {summary['blobs']}, file_id: {summary['files']}",
+        f"Размер: {summary['total_bytes'] / mb:.1f} МБ из {limit}, свободно на диске: {summary['disk_free'] / mb:.0f} МБ",
+        f"Скачано: {summary['downloaded']}, дубликатов: {summary['deduplicated']}, "
+        f"вытеснено: {summary['evicted']}, ошибок: {summary['failed']}",
+        f"Не скопировано фото заявок: {summary['unmirrored']}"
+        + (" (идет копирование)" if summary["backfill_running"] else " (/storage sync)" if summary["unmirrored"] else ""),
+        f"Вытеснено из зеркала фото заявок: {summary['evicted_files']}",
+    ]
+    await message.answer("\n".join(lines))
+
+
+# --- КОМАНДА: РЕЗЕРВНАЯ КОПИЯ БАЗЫ ---
+@router.message(Command("backup"), IsAdmin())
+async def cmd_backup(message: Message, command: CommandObject):
+    mb = 1024 * 1024
+    # /backup list - снимки на диске с проверкой контрольных сумм
+    if (command.args or "").strip().lower() == "list":
+        snapshots = backup_manager.list_snapshots()
+        if not snapshots:
+            await message.answer("Снимков базы пока нет.")
+            return
+        checks = await asyncio.gather(*(asyncio.to_thread(backup_manager.verify, path) for path in snapshots))
+        lines = [f"<b>Снимки базы</b> ({backup_manager.directory}):"]
+        lines += [f"{os.path.basename(path)}: {os.path.getsize(path) / mb:.1f} МБ, "
+                  + ("контрольная сумма верна" if ok else "⚠️ контрольная сумма не совпадает")
+                  for path, ok in zip(reversed(snapshots), reversed(checks))]
+        await _answer_lines(message, lines)
+        return
+
+    await message.answer("Создаю снимок базы...")
+    try:
+        info = await backup_manager.create()
+    except Exception as e:
+        logger.error(f"Ошибка при создании снимка базы: {e}")
+        await message.answer(f"Не удалось создать снимок базы: {e}")
+        return
+    await message.answer(
+        f"Снимок создан: <code>{os.path.basename(info.path)}</code>\n"
+        f"Размер: {info.db_size / mb:.1f} МБ, сжатый {info.size / mb:.1f} МБ, за {info.seconds:.1f} с\n"
+        f"SHA-256: <code>{info.sha256}</code>"
+    )
+
+# --- КОМАНДА: КАМПАНИИ ---
+CAMPAIGN_USAGE = (
+    "/campaign — список кампаний\n"
+    "/campaign N — заявки кампании N (в том числе из архива)\n"
+    "/campaign new Название — начать прием заявок в новую кампанию\n"
+    "/campaign close — закрыть прием заявок в текущей\n"
+    "/campaign archive N — перенести закрытую кампанию в архив\n"
+    "Выгрузка любой кампании: /get_users_db campaign=N"
+)
+
+
+def _campaign_line(campaign: dict) -> str:
+    line = (f"№{campaign['id']} «{html.escape(campaign['name'])}» — {CAMPAIGN_STATUS_TITLES[campaign['status']]}, "
+            f"с {campaign['created_at'][:10]}")
+    if campaign["closed_at"]:
+        line += f" по {campaign['closed_at'][:10]}"
+    if campaign["status"] == "archived":
+        line += f", {campaign['archive_rows']} заявок"
+    return line
+
+
+async def _show_campaign(message: Message, db: DB, campaign: dict):
+    if campaign["status"] == "archived":
+        async with campaign_archiver.open_archive(campaign) as archive_db:
+            counters = await archive_db.get_status_counters(campaign["id"])
+        size = os.path.getsize(campaign["archive_path"]) / 1024 / 1024
+        source = f"архив <code>{os.path.basename(campaign['archive_path'])}</code> ({size:.1f} МБ)"
+    else:
+        counters = await db.get_status_counters(campaign["id"])
+        source = "рабочая база"
+    lines = [f"<b>Кампания</b> {_campaign_line(campaign)}", f"Данные: {source}",
+             f"Всего заявок: {sum(counters.values())}"]
+    lines += [f"{STATUS_TITLES.get(status, status)}: {count}" for status, count in sorted(counters.items())]
+    lines.append(f"Выгрузка: /get_users_db campaign={campaign['id']}")
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("campaign"), IsAdmin())
+async def cmd_campaign(message: Message, db_instance: DB, command: CommandObject):
+    action, _, argument = (command.args or "").strip().partition(" ")
+    argument = argument.strip()
+    if not action:
+        lines = ["<b>Кампании</b>"] + [_campaign_line(campaign) for campaign in await db_instance.get_campaigns()]
+        await _answer_lines(message, lines + ["", CAMPAIGN_USAGE])
+    elif action.isdigit():
+        campaign = await db_instance.get_campaign(int(action))
+        if campaign is None:
+            await message.answer(f"Кампания №{action} не найдена.")
+            return
+        try:
+            await _show_campaign(message, db_instance, campaign)
+        except Exception as e:
+            logger.error(f"Ошибка при чтении архива кампании №{action}: {e}")
+            await message.answer(f"Не удалось открыть архив кампании: {e}")
+    elif action == "new" and argument:
+        campaign_id = await db_instance.start_campaign(argument)
+        if campaign_id is None:
+            await message.answer("Прием заявок уже идет. Сначала закройте текущую кампанию: /campaign close")
+            return
+        await message.answer(f"Начат прием заявок в кампанию №{campaign_id} «{html.escape(argument)}».")
+    elif action == "close":
+        campaign_id = await db_instance.close_campaign()
+        if campaign_id is None:
+            await message.answer("Нет кампании, которая принимает заявки.")
+            return
+        await message.answer(f"Прием заявок в кампанию №{campaign_id} закрыт. Модерация и розыгрыш доступны "
+                             f"до переноса в архив: /campaign archive {campaign_id}")
+    elif action == "archive" and argument.isdigit():
+        await message.answer(f"Переношу кампанию №{argument} в архив...")
         try:
-            await bot.send_message(user_id, text)
-            count += 1
-            await asyncio.sleep(0.1)
+            campaign = await campaign_archiver.archive(db_instance, int(argument))
         except Exception as e:
-            logger.warning(f"Не удалось отправить напоминание пользователю {user_id}: {e}")
-            pass
-    await message.answer(f"Рассылка завершена. Отправлено {count} сообщений.")
\ No newline at end of file
+            logger.error(f"Ошибка при переносе кампании №{argument} в архив: {e}")
+            await message.answer(f"Не удалось перенести кампанию в архив: {e}")
+            return
+        await message.answer(
+            f"Кампания №{campaign['id']} в архиве: {campaign['archive_rows']} заявок, "
+            f"<code>{os.path.basename(campaign['archive_path'])}</code> "
+            f"({os.path.getsize(campaign['archive_path']) / 1024 / 1024:.1f} МБ)\n"
+            f"SHA-256: <code>{campaign['archive_sha256']}</code>"
+        )
+    else:
+        await message.answer(CAMPAIGN_USAGE)
+
+
+# --- КОМАНДА: ПОИСК УЧАСТНИКОВ ---
+def _search_row_details(row: tuple) -> str:
+    _, user_id, _, status, updated_at = row
+    return f"ID: {user_id}, {STATUS_TITLES.get(status, status)}" + (f", {updated_at}" if updated_at else "")
+
+
+async def _render_search(db: DB, query: str, before_id: int | None = None) -> tuple[str, InlineKeyboardMarkup | None]:
+    rows, has_next = await participant_search.search(db, query, before_id, SEARCH_PAGE_SIZE)
+    if not rows:
+        return f"По запросу «{html.escape(query)}» ничего не найдено.", None
+    lines = [f"<b>Поиск</b>: {html.escape(query)}", ""] + [f"№{row[0]} @{row[2]}, {_search_row_details(row)}" for row in rows]
+    keyboard = get_search_keyboard([(row[0], f"№{row[0]} @{row[2]}") for row in rows],
+                                   has_prev=before_id is not None, has_next=has_next, last_id=rows[-1][0])
+    return "\n".join(lines), keyboard
+
+
+async def _open_submission(bot: Bot, admin_id: int, db: DB, submission_id: int) -> bool:
+    """Присылает админу фото заявки и кнопки модерации (решение можно изменить). False - заявки нет."""
+    payload = await db.get_submission(submission_id)
+    if payload is None:
+        return False
+    await send_submission_to_admin(bot, admin_id, payload, db,
+                                   title=f"Заявка №{submission_id} ({STATUS_TITLES[payload['status']]})",
+                                   save_message=False)
+    return True
+
+
+@router.message(Command("find"), IsAdmin())
+async def cmd_find(message: Message, bot: Bot, db_instance: DB, command: CommandObject, state: FSMContext):
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer("Использование: /find &lt;username, ID пользователя или №заявки&gt;\n"
+                             "Искать можно и прямо в поле ввода: @имя_бота запрос")
+        return
+    _, number, submission_only = parse_query(query)
+    # /find #123 (так же выглядит выбранный inline-результат) сразу открывает заявку
+    if submission_only:
+        if not await _open_submission(bot, message.from_user.id, db_instance, number):
+            await message.answer(f"Заявка №{number} не найдена.")
+        return
+    await state.update_data(find_query=query)
+    text, keyboard = await _render_search(db_instance, query)
+    await message.answer(text, reply_markup=keyboard)
+
+
+@router.callback_query(F.data.startswith("find:"), F.from_user.id.in_(ADMIN_IDS))
+async def process_find_action(callback: CallbackQuery, bot: Bot, db_instance: DB, state: FSMContext):
+    action, _, argument = callback.data.removeprefix("find:").partition(":")
+    if action == "open":
+        if not await _open_submission(bot, callback.from_user.id, db_instance, int(argument)):
+            await callback.answer("Заявка не найдена.", show_alert=True)
+            return
+        await callback.answer()
+    elif action == "page":
+        query = (await state.get_data()).get("find_query")
+        if not query:
+            await callback.answer("Повторите поиск: /find", show_alert=True)
+            return
+        await callback.answer()
+        text, keyboard = await _render_search(db_instance, query, int(argument) or None)
+        try:
+            await callback.message.edit_text(text, reply_markup=keyboard)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
+    else:
+        await callback.answer()
+
+
+@router.inline_query(F.from_user.id.in_(ADMIN_IDS))
+async def inline_find(inline_query: InlineQuery, db_instance: DB):
+    # Inline-режим включается в @BotFather (/setinline). Выбранный результат отправляет /find #ID
+    before_id = int(inline_query.offset) if inline_query.offset.isdigit() else None
+    rows, has_next = await participant_search.search(db_instance, inline_query.query, before_id,
+                                                     SEARCH_INLINE_PAGE_SIZE)
+    results = [
+        InlineQueryResultArticle(
+            id=str(row[0]),
+            title=f"№{row[0]} @{row[2]}",
+            description=_search_row_details(row),
+            input_message_content=InputTextMessageContent(message_text=f"/find #{row[0]}"),
+        )
+        for row in rows
+    ]
+    await inline_query.answer(results, cache_time=int(SEARCH_CACHE_TTL), is_personal=True,
+                              next_offset=str(rows[-1][0]) if has_next else "")
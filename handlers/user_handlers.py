@@ -7,8 +7,10 @@ from aiogram.types import Message, CallbackQuery, ContentType
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from database.database import Database as DB
-from handlers.admin_handlers import send_submission_to_admin  # Если эта функция импортируется
+from database.database import Database as DB, CampaignClosed
+from handlers.admin_handlers import submission_notifications
+from middlewares.antiflood import AntiFloodMiddleware
+from utils.outbox import OutboxDispatcher
 
 from keyboards.inline import get_start_keyboard, get_cancel_keyboard
 
@@ -38,9 +40,15 @@ async def cmd_start(message: Message, state: FSMContext):
     )
 
 
+CAMPAIGN_CLOSED_TEXT = "Прием заявок на розыгрыш завершен. Следите за новостями ChocoWow — скоро будет новый!"
+
+
 @router.callback_query(F.data == "submit_application")
-async def start_submission(callback: CallbackQuery, state: FSMContext):
+async def start_submission(callback: CallbackQuery, state: FSMContext, db_instance: DB):
     await callback.answer()  # Отвечаем на колбэк, чтобы убрать "часики"
+    if await db_instance.get_active_campaign() is None:
+        await callback.message.edit_text(CAMPAIGN_CLOSED_TEXT)
+        return
     await callback.message.edit_text(
         "Отлично! Сначала отправь мне фото своей коллекции ChocoWow игрушек.",
         reply_markup=get_cancel_keyboard()
@@ -65,8 +73,15 @@ async def process_collection_photo_invalid(message: Message):
 
 
 @router.message(SubmissionStates.waiting_for_receipt_photo, F.photo)
-async def process_receipt_photo(message: Message, state: FSMContext, bot: Bot, db_instance: DB):
-    receipt_photo_id = message.photo[-1].file_id
+async def process_receipt_photo(message: Message, state: FSMContext, db_instance: DB, outbox: OutboxDispatcher,
+                                antiflood: AntiFloodMiddleware, album: list[Message] | None = None):
+    # Два фото чека подряд обрабатываются параллельно и оба видят это состояние: заявку создает только первое
+    if not antiflood.debounce_submission(message.from_user.id):
+        return
+    # Альбом приходит одним вызовом (MediaGroupMiddleware): все фото чеков попадают в одну заявку
+    photos = [m.photo[-1] for m in album or [message] if m.photo]
+    receipt_photo_ids = [photo.file_id for photo in photos]
+    receipt_unique_ids = [photo.file_unique_id for photo in photos]  # Одинаковы для одного файла у всех пользователей
     user_data = await state.get_data()
     collection_photo_id = user_data.get("collection_photo_id")
 
@@ -74,23 +89,24 @@ async def process_receipt_photo(message: Message, state: FSMContext, bot: Bot, d
     username = message.from_user.username if message.from_user.username else f"id_{user_id}"
 
     try:
-        submission_id = await db_instance.add_submission(
-            user_id, username, collection_photo_id, receipt_photo_id
+        # Заявка и уведомления админам записываются одной транзакцией,
+        # а рассылает их админам фоновый диспетчер outbox
+        await db_instance.add_submission(
+            user_id, username, collection_photo_id, receipt_photo_ids,
+            notifications=submission_notifications(), receipt_unique_ids=receipt_unique_ids
         )
+        outbox.wake()
         await message.answer("Спасибо! Ваша заявка принята и будет рассмотрена администратором.")
         await state.clear()
 
-        await send_submission_to_admin(
-            bot=bot,
-            submission_id=submission_id,
-            user_id=user_id,
-            username=username,
-            collection_photo=collection_photo_id,
-            receipt_photo=receipt_photo_id
-        )
+    except CampaignClosed:
+        # Кампанию закрыли, пока пользователь присылал фото
+        await message.answer(CAMPAIGN_CLOSED_TEXT)
+        await state.clear()
 
     except Exception as e:
         logger.error(f"Ошибка при добавлении заявки в БД для пользователя {user_id}: {e}")
+        antiflood.release_submission(user_id)  # Повторная отправка сразу после ошибки не должна пропасть
         await message.answer("Произошла ошибка при обработке вашей заявки. Пожалуйста, попробуйте снова: /start")
         await state.clear()
 
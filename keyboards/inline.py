@@ -18,11 +18,61 @@ def get_cancel_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_admin_keyboard(submission_id: int, user_id: int) -> InlineKeyboardMarkup:
-    """Создает инлайн-клавиатуру для админа."""
+def get_admin_keyboard(submission_id: int, user_id: int, version: int | None = None) -> InlineKeyboardMarkup:
+    """
+    Создает инлайн-клавиатуру для админа.
+    version - версия заявки: нажатие кнопки устаревшей версии не изменит статус.
+    """
+    suffix = f"{submission_id}:{user_id}" if version is None else f"{submission_id}:{user_id}:{version}"
     buttons = [
-        [InlineKeyboardButton(text="✅ Подтвердить", callback_data=f"admin:approve:{submission_id}:{user_id}")],
-        [InlineKeyboardButton(text="🎁 С доп. призом", callback_data=f"admin:bonus:{submission_id}:{user_id}")],
-        [InlineKeyboardButton(text="❌ Отклонить", callback_data=f"admin:reject:{submission_id}:{user_id}")],
+        [InlineKeyboardButton(text="✅ Подтвердить", callback_data=f"admin:approve:{suffix}")],
+        [InlineKeyboardButton(text="🎁 С доп. призом", callback_data=f"admin:bonus:{suffix}")],
+        [InlineKeyboardButton(text="❌ Отклонить", callback_data=f"admin:reject:{suffix}")],
     ]
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
\ No newline at end of file
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_queue_keyboard(items: list[tuple[int, str]], selected: set[int], first_id: int, last_id: int,
+                       has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    """
+    Клавиатура страницы очереди модерации.
+    items - (ID заявки, подпись) для кнопок выбора и просмотра фото.
+    """
+    buttons = [
+        [
+            InlineKeyboardButton(text=f"{'☑️' if submission_id in selected else '⬜'} {label}",
+                                 callback_data=f"queue:sel:{submission_id}"),
+            InlineKeyboardButton(text="📷", callback_data=f"queue:photos:{submission_id}"),
+        ]
+        for submission_id, label in items
+    ]
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(text="⬅️", callback_data=f"queue:prev:{first_id}"))
+    navigation.append(InlineKeyboardButton(text="🔄", callback_data=f"queue:page:{first_id - 1}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="➡️", callback_data=f"queue:page:{last_id}"))
+    buttons.append(navigation)
+    buttons.append([InlineKeyboardButton(text="✅ Подтвердить страницу", callback_data="queue:approve_page")])
+    if selected:
+        buttons.append([InlineKeyboardButton(text=f"✅ Подтвердить выбранные ({len(selected)})",
+                                             callback_data="queue:approve_selected")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_search_keyboard(items: list[tuple[int, str]], has_prev: bool, has_next: bool,
+                        last_id: int) -> InlineKeyboardMarkup:
+    """
+    Клавиатура страницы результатов /find.
+    items - (ID заявки, подпись): кнопка открывает фото заявки и кнопки модерации.
+    """
+    buttons = [[InlineKeyboardButton(text=f"📷 {label}", callback_data=f"find:open:{submission_id}")]
+               for submission_id, label in items]
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(text="⏮ В начало", callback_data="find:page:0"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="➡️", callback_data=f"find:page:{last_id}"))
+    if navigation:
+        buttons.append(navigation)
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -1,16 +1,216 @@
 import asyncio
 import logging
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from functools import partial
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
-from config import BOT_TOKEN # Убедитесь, что BOT_TOKEN определен в config.py
+from config import (BOT_TOKEN, BOT_MODE, METRICS_HOST, METRICS_PORT, JOURNAL_ENABLED, JOURNAL_DIR, DB_NAME,
+                    BOT_WORKERS, BOT_IPC_DIR, SEND_GLOBAL_RATE) # Убедитесь, что BOT_TOKEN определен в config.py
 from database.database import Database # Импортируем КЛАСС Database
+from database.fsm_storage import SQLiteStorage
 from handlers import user_handlers, admin_handlers
+from handlers.admin_handlers import (NOTIFY_ADMIN_SUBMISSION, NOTIFY_SUBMISSION_EMAIL, NOTIFY_MIRROR_PHOTOS,
+                                     NOTIFY_USER_DECISION, NOTIFY_DRAW_WINNER, send_submission_to_admin,
+                                     send_submission_email, mirror_submission_photos, send_user_decision,
+                                     send_draw_winner)
+from middlewares.antiflood import AntiFloodMiddleware
+from middlewares.ingress import IngressMiddleware
+from middlewares.journal import UpdateJournalMiddleware
+from middlewares.media_group import MediaGroupMiddleware
+from middlewares.metrics import ApiMetricsMiddleware, HandlerMetricsMiddleware, UpdateMetricsMiddleware
+from utils.archive import campaign_archiver
+from utils.backup import backup_manager
+from utils.broadcast import Broadcaster
+from utils.cluster import Ingress, serve_worker
+from utils.email_sender import email_worker
+from utils.journal import UpdateJournal, update_journal
+from utils.outbox import OutboxDispatcher
+from utils.photo_mirror import photo_mirror
+from utils.receipt_hashes import receipt_index
+from utils.metrics import metrics, start_metrics_server
+from utils.search import participant_search
+from utils.send_scheduler import SendSchedulerMiddleware, send_scheduler
+from utils.webhook import run_webhook
 
 # Настройка логирования для всего приложения
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+def create_dispatcher(db_instance: Database, journal: UpdateJournal | None = None, sweeper: bool = True) -> Dispatcher:
+    """
+    Создает диспетчер с хранилищем FSM, роутерами и middleware метрик (используется и в бенчмарках).
+    journal - журнал, в который записываются все входящие апдейты.
+    sweeper - удалять устаревшие состояния FSM (в многопроцессном режиме - только в процессе админов).
+    """
+    # Состояния FSM хранятся в той же базе и не теряются при перезапуске
+    storage = SQLiteStorage(db_instance)
+    if sweeper:
+        storage.start_sweeper()
+    # FSM-middleware регистрируется вручную, чтобы защита от флуда отбрасывала апдейты до чтения состояния
+    dp = Dispatcher(storage=storage, disable_fsm=True)
+
+    # Регистрация роутеров и middleware метрик
+    dp.include_router(user_handlers.router)
+    dp.include_router(admin_handlers.router)
+    if journal is not None:
+        dp.update.outer_middleware(UpdateJournalMiddleware(journal))
+    dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+    dp.update.outer_middleware(AntiFloodMiddleware(metrics))
+    dp.update.outer_middleware(dp.fsm)
+    dp.message.outer_middleware(MediaGroupMiddleware())
+    dp.message.middleware(HandlerMetricsMiddleware(metrics))
+    dp.callback_query.middleware(HandlerMetricsMiddleware(metrics))
+    return dp
+
+
+def create_outbox(db_instance: Database, bot: Bot) -> OutboxDispatcher:
+    """Создает диспетчер outbox с обработчиками всех типов уведомлений."""
+    return OutboxDispatcher(db_instance, bot, handlers={
+        NOTIFY_ADMIN_SUBMISSION: partial(send_submission_to_admin, db=db_instance),
+        NOTIFY_SUBMISSION_EMAIL: send_submission_email,
+        NOTIFY_MIRROR_PHOTOS: mirror_submission_photos,
+        NOTIFY_USER_DECISION: send_user_decision,
+        NOTIFY_DRAW_WINNER: send_draw_winner,
+    })
+
+
+def create_bot(api_url: str | None = None) -> Bot:
+    """Создает бота с планировщиком отправок. api_url - другой сервер Bot API (в бенчмарках - фейковый)."""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    bot = Bot(
+        token=BOT_TOKEN,
+        session=session,
+        default=DefaultBotProperties(parse_mode="HTML")
+    )
+    # Все отправки сообщений проходят через общий планировщик с лимитами Telegram
+    bot.session.middleware(SendSchedulerMiddleware(send_scheduler))
+    bot.session.middleware(ApiMetricsMiddleware(metrics))
+    return bot
+
+
+def used_update_types() -> list[str]:
+    """Типы апдейтов, на которые есть хендлеры (их и запрашиваем у Telegram)."""
+    return sorted(set(user_handlers.router.resolve_used_update_types())
+                  | set(admin_handlers.router.resolve_used_update_types()))
+
+
+@asynccontextmanager
+async def bot_services(db_instance: Database, bot: Bot, background: bool = True, metrics_port: int = METRICS_PORT):
+    """
+    Запускает службы бота и отдает workflow_data для диспетчера.
+    background=False - без фоновых задач (outbox, письма, зеркало фото, рассылки): в многопроцессном
+    режиме их выполняет только процесс админов, иначе уведомления отправлялись бы несколько раз.
+    """
+    # Метрики
+    metrics.register_gauge("db_writer", db_instance.get_stats)
+    metrics.register_gauge("send_scheduler", send_scheduler.get_stats)
+    metrics.register_gauge("email_worker", email_worker.get_stats)
+    metrics.register_gauge("photo_mirror", photo_mirror.get_stats)
+    metrics.register_gauge("backup", backup_manager.get_stats)
+    metrics.register_gauge("search_cache", participant_search.get_stats)
+    metrics.register_gauge("campaign_archive", campaign_archiver.get_stats)
+    metrics_runner = await start_metrics_server(metrics, METRICS_HOST, metrics_port) if metrics_port else None
+
+    # Запуск зеркала фото, фоновой отправки писем и уведомлений, возобновление прерванных рассылок
+    outbox = create_outbox(db_instance, bot)
+    broadcaster = Broadcaster(db_instance, bot)
+    if background:
+        await photo_mirror.start(db_instance, bot)
+        await receipt_index.start(db_instance, bot)
+        email_worker.start(bot)
+        outbox.start()
+        await broadcaster.resume()
+        backup_manager.start(db_instance.db_name)
+        campaign_archiver.start(db_instance)
+    if JOURNAL_ENABLED:
+        update_journal.start()
+
+    # Самое важное: передаем объект db_instance в контекст диспетчера.
+    # Теперь он будет доступен в хендлерах как аргумент с тем же именем.
+    try:
+        yield dict(db_instance=db_instance, broadcaster=broadcaster, outbox=outbox)
+    finally:
+        await outbox.stop() # Неотправленные уведомления останутся в outbox до следующего запуска
+        await broadcaster.stop() # Недоставленные сообщения рассылок будут отправлены после перезапуска
+        await email_worker.stop() # Досылаем письма из очереди, пока сессия бота еще открыта
+        await photo_mirror.stop()
+        await backup_manager.stop() # Прерванный снимок не сохраняется, временные файлы удаляются
+        await campaign_archiver.stop() # Прерванный перенос в архив продолжится после перезапуска
+        if JOURNAL_ENABLED:
+            await update_journal.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+
+
+async def run_bot(dp: Dispatcher, bot: Bot, allowed_updates: list[str] | None = None, handle_as_tasks: bool = True,
+                  **workflow_data):
+    """Получает апдейты через вебхук или polling (в зависимости от BOT_MODE)."""
+    allowed_updates = allowed_updates or dp.resolve_used_update_types()
+    if BOT_MODE == "webhook":
+        logging.info("Запускаем бота %s в режиме вебхука", await bot.get_me())
+        await run_webhook(dp, bot, allowed_updates=allowed_updates, **workflow_data)
+    else:
+        logging.info("Запускаем опрос бота %s", await bot.get_me())
+        await bot.delete_webhook() # Polling не работает, пока установлен вебхук
+        await dp.start_polling(bot, allowed_updates=allowed_updates, handle_as_tasks=handle_as_tasks, **workflow_data)
+
+
+async def run_ingress():
+    """
+    Многопроцессный режим: этот процесс только принимает апдейты и раскладывает их
+    по процессам-обработчикам по ID пользователя (см. utils/cluster.py).
+    """
+    bot = create_bot()
+    ingress = Ingress(BOT_WORKERS, worker_process, BOT_IPC_DIR or tempfile.mkdtemp(prefix="chocowow-"),
+                      send_rate=SEND_GLOBAL_RATE / (BOT_WORKERS + 1))
+    await ingress.start()
+    dp = Dispatcher(disable_fsm=True)
+    dp.update.outer_middleware(IngressMiddleware(ingress))
+    try:
+        # Апдейты передаются по одному и по порядку, backpressure обработчиков замедляет прием
+        await run_bot(dp, bot, allowed_updates=used_update_types(), handle_as_tasks=False)
+    finally:
+        await ingress.stop()
+        await bot.session.close()
+
+
+def worker_process(index: int, socket_path: str, service: bool, db_name: str = DB_NAME, api_url: str | None = None,
+                   send_rate: float | None = None, per_chat_rate: float | None = None, log_level: int = logging.INFO):
+    """Точка входа процесса-обработчика (запускается Ingress в отдельном процессе)."""
+    logging.getLogger().setLevel(log_level)
+    asyncio.run(run_worker(index, socket_path, service, db_name, api_url, send_rate, per_chat_rate))
+
+
+async def run_worker(index: int, socket_path: str, service: bool, db_name: str = DB_NAME, api_url: str | None = None,
+                     send_rate: float | None = None, per_chat_rate: float | None = None):
+    """
+    Процесс-обработчик: свой диспетчер и соединения с общей базой (WAL).
+    service - процесс админов, он же выполняет фоновые задачи.
+    """
+    db_instance = Database(db_name)
+    await db_instance.connect() # Схему уже обновил процесс приема
+    if send_rate:
+        send_scheduler.set_rates(send_rate, per_chat_rate) # Лимит Telegram общий на бота, делим между процессами
+    bot = create_bot(api_url)
+    if JOURNAL_ENABLED:
+        update_journal.directory = os.path.join(JOURNAL_DIR, f"worker-{index}")
+    dp = create_dispatcher(db_instance, update_journal if JOURNAL_ENABLED else None, sweeper=service)
+    # Метрики процесса админов - на METRICS_PORT, процессов пользователей - на следующих портах
+    metrics_port = (METRICS_PORT if service else METRICS_PORT + 1 + index) if METRICS_PORT else 0
+    try:
+        async with bot_services(db_instance, bot, background=service, metrics_port=metrics_port) as workflow_data:
+            await serve_worker(socket_path, dp, bot, service=service, **workflow_data)
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        await db_instance.close()
+
+
 async def main():
     # 1. Инициализация базы данных: создаем экземпляр и настраиваем таблицы
     db_instance = Database() # Создаем объект базы данных
@@ -18,27 +218,23 @@ async def main():
     await db_instance.setup_database() # Создаем таблицы, если их нет
     logging.info("База данных инициализирована: таблица 'participants' проверена/создана.")
 
-    # 2. Инициализация бота и диспетчера
-    bot = Bot(
-        token=BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode="HTML")
-    )
-    dp = Dispatcher()
+    if BOT_WORKERS > 0:
+        await db_instance.close() # Обработчики открывают свои соединения
+        await run_ingress()
+        return
 
-    # 3. Регистрация роутеров
-    dp.include_router(user_handlers.router)
-    dp.include_router(admin_handlers.router)
+    # 2. Инициализация бота и диспетчера
+    bot = create_bot()
+    dp = create_dispatcher(db_instance, update_journal if JOURNAL_ENABLED else None)
 
-    # 4. Запуск бота
+    # 3. Службы бота и запуск
     try:
-        logging.info("Запускаем опрос бота %s", await bot.get_me())
-        # Самое важное: передаем объект db_instance в контекст диспетчера.
-        # Теперь он будет доступен в хендлерах как аргумент с тем же именем.
-        await dp.start_polling(bot, db_instance=db_instance)
+        async with bot_services(db_instance, bot) as workflow_data:
+            await run_bot(dp, bot, **workflow_data)
     finally:
         # Убедимся, что соединение с сессией бота и с базой данных закрываются
         await bot.session.close()
         await db_instance.close() # Закрываем соединение с базой данных при завершении работы
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+# middlewares/antiflood.py
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject, Update
+
+from config import ADMIN_IDS, FLOOD_RATE, FLOOD_BURST, FLOOD_TRACKED_USERS, SUBMISSION_DEBOUNCE_SECONDS
+from utils.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+FLOOD_WARNING = "Слишком много сообщений подряд, подождите несколько секунд."
+
+
+class _Bucket:
+    """Токены одного пользователя и отметки для склейки альбомов и повторных заявок."""
+    __slots__ = ("tokens", "updated_at", "media_group_id", "warned", "submitted_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+        self.media_group_id: str | None = None
+        self.warned = False
+        self.submitted_at = 0.0
+
+
+class AntiFloodMiddleware(BaseMiddleware):
+    """
+    Outer-middleware для dp.update, стоит до FSM: лишние апдейты пользователя отбрасываются
+    раньше, чем читается его состояние и выбирается хендлер.
+    У каждого пользователя - token bucket (FLOOD_BURST апдейтов подряд, дальше FLOOD_RATE в секунду).
+    Фото одного альбома расходуют один токен. Бакеты лежат в LRU ограниченного размера:
+    вытесненный пользователь просто начинает с полного бакета. Админы не ограничиваются.
+    Сам middleware передается хендлерам как antiflood (для debounce_submission).
+    """
+
+    def __init__(self, registry: Metrics, rate: float = FLOOD_RATE, burst: int = FLOOD_BURST,
+                 max_users: int = FLOOD_TRACKED_USERS, debounce: float = SUBMISSION_DEBOUNCE_SECONDS):
+        self.registry = registry
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.debounce = debounce
+        self._buckets: OrderedDict[int, _Bucket] = OrderedDict()
+        self.dropped = 0
+
+    def _bucket(self, user_id: int, now: float) -> _Bucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = _Bucket(self.burst, now)
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+            bucket.updated_at = now
+        return bucket
+
+    def allow(self, user_id: int, media_group_id: str | None = None, now: float | None = None) -> bool:
+        """Расходует токен пользователя. False - апдейт нужно отбросить."""
+        bucket = self._bucket(user_id, time.monotonic() if now is None else now)
+        if media_group_id is not None and media_group_id == bucket.media_group_id:
+            return True  # Остальные фото того же альбома
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        bucket.media_group_id = media_group_id
+        bucket.warned = False
+        return True
+
+    def debounce_submission(self, user_id: int, now: float | None = None) -> bool:
+        """
+        Отмечает подачу заявки. False - пользователь уже подал заявку в последние
+        SUBMISSION_DEBOUNCE_SECONDS секунд (двойная отправка фото), повтор нужно пропустить.
+        """
+        now = time.monotonic() if now is None else now
+        bucket = self._bucket(user_id, now)
+        if now - bucket.submitted_at < self.debounce:
+            self.registry.inc("bot_updates_dropped_total", "duplicate_submission")
+            self.dropped += 1
+            return False
+        bucket.submitted_at = now
+        return True
+
+    def release_submission(self, user_id: int):
+        """Снимает отметку debounce_submission, если заявка не записалась: повтор не будет пропущен."""
+        bucket = self._buckets.get(user_id)
+        if bucket is not None:
+            bucket.submitted_at = 0.0
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: dict[str, Any],
+    ) -> Any:
+        data["antiflood"] = self
+        user = data.get("event_from_user")
+        if self.rate <= 0 or user is None or user.id in ADMIN_IDS:
+            return await handler(event, data)
+
+        media_group_id = event.message.media_group_id if event.message else None
+        if self.allow(user.id, media_group_id):
+            return await handler(event, data)
+
+        self.dropped += 1
+        self.registry.inc("bot_updates_dropped_total", event.event_type)
+        bucket = self._buckets[user.id]
+        if not bucket.warned:
+            # Предупреждаем один раз за серию, остальные лишние апдейты отбрасываются молча
+            bucket.warned = True
+            await self._warn(data["bot"], event, user.id)
+        return None
+
+    @staticmethod
+    async def _warn(bot: Bot, event: Update, user_id: int):
+        try:
+            if event.callback_query:
+                await event.callback_query.answer(FLOOD_WARNING)
+            elif event.message:
+                await bot.send_message(user_id, FLOOD_WARNING)
+        except Exception as e:
+            logger.warning(f"Не удалось предупредить пользователя {user_id} о флуде: {e}")
+
+    def get_stats(self) -> dict:
+        return {"dropped": self.dropped, "tracked_users": len(self._buckets)}
@@ -0,0 +1,27 @@
+# middlewares/ingress.py
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from utils.cluster import Ingress
+
+
+class IngressMiddleware(BaseMiddleware):
+    """
+    Outer-middleware для dp.update процесса приема в многопроцессном режиме:
+    не обрабатывает апдейт, а передает его процессу-обработчику пользователя.
+    """
+
+    def __init__(self, ingress: Ingress):
+        self.ingress = ingress
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: dict[str, Any],
+    ) -> Any:
+        await self.ingress.dispatch(event.model_dump(mode="json", exclude_none=True, exclude_unset=True, by_alias=True))
+        return None
@@ -0,0 +1,33 @@
+# middlewares/journal.py
+
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from utils.journal import UpdateJournal
+
+
+class UpdateJournalMiddleware(BaseMiddleware):
+    """
+    Outer-middleware для dp.update, стоит первым: пишет в журнал каждый входящий апдейт
+    (в том числе отброшенные защитой от флуда) вместе со временем получения и обработки.
+    """
+
+    def __init__(self, journal: UpdateJournal):
+        self.journal = journal
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: dict[str, Any],
+    ) -> Any:
+        received_at = time.time()
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.journal.record(event.model_dump(mode="json", exclude_none=True, exclude_unset=True, by_alias=True),
+                                received_at, time.perf_counter() - start)
@@ -0,0 +1,60 @@
+# middlewares/media_group.py
+
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+from config import MEDIA_GROUP_WAIT
+
+
+class _Album:
+    """Накопленные сообщения одного альбома и время прихода последнего из них."""
+    __slots__ = ("messages", "last_seen")
+
+    def __init__(self, message: Message, last_seen: float):
+        self.messages = [message]
+        self.last_seen = last_seen
+
+
+class MediaGroupMiddleware(BaseMiddleware):
+    """
+    Outer-middleware для dp.message: склеивает альбом в один вызов хендлера.
+    Telegram присылает каждое фото альбома отдельным апдейтом. Первое сообщение альбома
+    ждет, пока остальные не перестанут приходить дольше MEDIA_GROUP_WAIT секунд,
+    и вызывает хендлер один раз, передав все сообщения в album (по порядку).
+    Остальные сообщения альбома до хендлеров не доходят.
+    Апдейты обрабатываются параллельно (polling и webhook в фоне), поэтому ожидание
+    первого сообщения не задерживает остальные.
+    """
+
+    def __init__(self, wait: float = MEDIA_GROUP_WAIT):
+        self.wait = wait
+        self._albums: dict[tuple[int, str], _Album] = {}
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: Message,
+            data: dict[str, Any],
+    ) -> Any:
+        if event.media_group_id is None:
+            return await handler(event, data)
+
+        loop = asyncio.get_running_loop()
+        key = (event.chat.id, event.media_group_id)
+        album = self._albums.get(key)
+        if album is not None:
+            album.messages.append(event)
+            album.last_seen = loop.time()
+            return None
+
+        album = self._albums[key] = _Album(event, loop.time())
+        try:
+            while (delay := album.last_seen + self.wait - loop.time()) > 0:
+                await asyncio.sleep(delay)
+        finally:
+            del self._albums[key]
+        data["album"] = sorted(album.messages, key=lambda message: message.message_id)
+        return await handler(event, data)
@@ -0,0 +1,82 @@
+# middlewares/metrics.py
+
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject, Update
+
+from utils.metrics import Metrics
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Outer-middleware для dp.update: считает апдейты и полное время их обработки
+    (фильтры, FSM, хендлер) по типу события.
+    """
+
+    def __init__(self, registry: Metrics):
+        self.registry = registry
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: dict[str, Any],
+    ) -> Any:
+        event_type = event.event_type
+        self.registry.inc("bot_updates_total", event_type)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.registry.inc("bot_update_errors_total", event_type)
+            raise
+        finally:
+            self.registry.observe("bot_update_seconds", event_type, time.perf_counter() - start)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner-middleware для message/callback_query: к этому моменту хендлер уже выбран,
+    поэтому задержка записывается с его именем (process_receipt_photo, cmd_get_users_db и т.д.).
+    """
+
+    def __init__(self, registry: Metrics):
+        self.registry = registry
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.registry.observe("bot_handler_seconds", name, time.perf_counter() - start)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: время HTTP-запросов к Bot API по методам.
+    Регистрируется после SendSchedulerMiddleware, поэтому ожидание лимитов сюда не входит.
+    """
+
+    def __init__(self, registry: Metrics):
+        self.registry = registry
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        with self.registry.timer("telegram_api_seconds", type(method).__name__):
+            return await make_request(bot, method)
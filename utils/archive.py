@@ -0,0 +1,216 @@
+# utils/archive.py
+
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from config import ARCHIVE_DIR, ARCHIVE_AFTER_DAYS, ARCHIVE_DELETE_BATCH
+from database.database import SnapshotDatabase
+from utils.backup import file_sha256, gunzip_file, gzip_file
+from utils.metrics import metrics
+from utils.receipt_hashes import receipt_index
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 3600  # Как часто искать кампании для архивации, сек
+
+# Что попадает в архив кампании: таблица -> запрос к рабочей базе (src) с параметром campaign_id.
+# Столбцы те же, что в рабочей базе, поэтому архив читают обычные методы Database.
+ARCHIVE_TABLES = {
+    "campaigns": "SELECT * FROM src.campaigns WHERE id = ?",
+    "participants": "SELECT * FROM src.participants WHERE campaign_id = ?",
+    "submission_receipts": "SELECT r.* FROM src.submission_receipts r "
+                           "JOIN src.participants p ON p.id = r.submission_id WHERE p.campaign_id = ?",
+    "submissions": "SELECT s.* FROM src.submissions s "
+                   "JOIN src.participants p ON p.id = s.submission_id WHERE p.campaign_id = ?",
+    "status_counters": "SELECT * FROM src.status_counters WHERE campaign_id = ?",
+    "draws": "SELECT * FROM src.draws WHERE campaign_id = ?",
+    "draw_winners": "SELECT w.* FROM src.draw_winners w JOIN src.draws d ON d.id = w.draw_id WHERE d.campaign_id = ?",
+}
+ARCHIVE_INDEXES = (
+    "CREATE INDEX idx_participants_campaign_status ON participants (campaign_id, status, id)",
+    "CREATE INDEX idx_participants_id ON participants (id)",
+    "CREATE INDEX idx_submission_receipts_submission_id ON submission_receipts (submission_id, position)",
+    "CREATE INDEX idx_submissions_submission_id ON submissions (submission_id)",
+    "CREATE INDEX idx_draws_id ON draws (id)",
+    "CREATE INDEX idx_draw_winners_draw_id ON draw_winners (draw_id, place)",
+)
+
+
+class CampaignArchiver:
+    """
+    Перенос завершенных кампаний из рабочей базы в холодное хранилище.
+    Архив кампании - отдельная база SQLite с ее заявками, историей подач, чеками, счетчиками
+    и розыгрышами, сжатая gzip (directory/campaign-N.db.gz и файл .sha256).
+    Порядок: кампания переводится в 'archiving' (модерация ее больше не меняет), копируется
+    одной транзакцией чтения, архив сохраняется и проверяется, затем заявки удаляются из рабочей
+    базы пачками по delete_batch (писатель не занят надолго) и кампания становится 'archived'.
+    Прерванный перенос продолжается при следующем запуске с того же шага.
+    Кампании, закрытые больше after_days дней назад, архивируются автоматически.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR, after_days: float = ARCHIVE_AFTER_DAYS,
+                 delete_batch: int = ARCHIVE_DELETE_BATCH):
+        self.directory = directory
+        self.after_days = after_days
+        self.delete_batch = max(1, delete_batch)
+        self.db = None
+        self._task: asyncio.Task | None = None
+        self._running: dict[int, asyncio.Task] = {}
+
+        self.archived = 0
+        self.failed = 0
+
+    def start(self, db):
+        """Запускает поиск кампаний для архивации (в том числе прерванных)."""
+        self.db = db
+        os.makedirs(self.directory, exist_ok=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._schedule_loop())
+
+    async def stop(self):
+        tasks = [task for task in (self._task, *self._running.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._running.clear()
+
+    async def _schedule_loop(self):
+        while True:
+            if self.after_days > 0:
+                closed_before = datetime.now(timezone.utc) - timedelta(days=self.after_days)
+                closed_before = closed_before.strftime("%Y-%m-%d %H:%M:%S")  # Формат CURRENT_TIMESTAMP
+            else:
+                closed_before = ""  # Только прерванные переносы
+            for campaign_id in await self.db.get_campaigns_to_archive(closed_before):
+                try:
+                    await self.archive(self.db, campaign_id)
+                except Exception as e:
+                    logger.error(f"Кампания №{campaign_id} не перенесена в архив: {e}")
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    async def archive(self, db, campaign_id: int) -> dict:
+        """
+        Переносит закрытую кампанию в архив и возвращает ее запись (Database.get_campaign).
+        Если перенос уже идет, ждет его. ValueError - кампании нет или она еще принимает заявки.
+        """
+        task = self._running.get(campaign_id)
+        if task is None or task.done():
+            task = self._running[campaign_id] = asyncio.create_task(self._archive(db, campaign_id))
+        return await asyncio.shield(task)
+
+    @metrics.timed("archive_seconds")
+    async def _archive(self, db, campaign_id: int) -> dict:
+        try:
+            campaign = await db.get_campaign(campaign_id)
+            if campaign is None:
+                raise ValueError(f"Кампания №{campaign_id} не найдена.")
+            if campaign["status"] == "archived":
+                return campaign
+            if campaign["status"] == "active":
+                raise ValueError(f"Кампания №{campaign_id} еще принимает заявки: сначала /campaign close.")
+            if campaign["status"] == "closed" and not await db.begin_campaign_archive(campaign_id):
+                raise ValueError(f"Статус кампании №{campaign_id} изменился, повторите команду.")
+
+            if campaign["archive_path"] is None:
+                path, sha256, rows = await asyncio.to_thread(self._export_sync, db.db_name, campaign_id)
+                await db.save_campaign_archive(campaign_id, path, sha256, rows)
+                logger.info(f"Архив кампании №{campaign_id}: {rows} заявок, "
+                            f"{os.path.getsize(path) / 1024 / 1024:.1f} МБ")
+            elif not os.path.exists(campaign["archive_path"]):
+                # Часть заявок уже удалена: архив нельзя собрать заново из рабочей базы
+                raise RuntimeError(f"Файл архива {campaign['archive_path']} пропал, нужен снимок базы (/backup list).")
+
+            deleted = 0
+            while count := await db.delete_campaign_rows(campaign_id, self.delete_batch):
+                deleted += count
+            await db.finish_campaign_archive(campaign_id)
+            receipt_index.discard_campaign(campaign_id)  # Чеки архива больше не считаются повторами
+        except Exception:
+            self.failed += 1
+            raise
+        self.archived += 1
+        logger.info(f"Кампания №{campaign_id} перенесена в архив, из рабочей базы удалено {deleted} заявок")
+        return await db.get_campaign(campaign_id)
+
+    def archive_path(self, campaign_id: int) -> str:
+        return os.path.join(self.directory, f"campaign-{campaign_id}.db.gz")
+
+    def _export_sync(self, db_name: str, campaign_id: int) -> tuple[str, str, int]:
+        """Копирует кампанию в отдельную базу и сжимает ее. Возвращает (путь, SHA-256, число заявок)."""
+        path = self.archive_path(campaign_id)
+        name = os.path.basename(path)[:-3]
+        raw_path = os.path.join(self.directory, f".{name}.tmp")
+        gz_path = f"{path}.tmp"
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+            conn = sqlite3.connect(raw_path, isolation_level=None, uri=True)
+            try:
+                conn.execute("ATTACH DATABASE ? AS src", (f"file:{db_name}?mode=ro",))
+                conn.execute("PRAGMA busy_timeout = 5000")
+                # Одна транзакция: все таблицы читаются из одной версии рабочей базы
+                conn.execute("BEGIN")
+                for table, query in ARCHIVE_TABLES.items():
+                    conn.execute(f"CREATE TABLE main.{table} AS {query}", (campaign_id,))
+                for statement in ARCHIVE_INDEXES:
+                    conn.execute(statement)
+                conn.execute("UPDATE main.campaigns SET status = 'archived', archived_at = CURRENT_TIMESTAMP")
+                rows, = conn.execute("SELECT COUNT(*) FROM main.participants").fetchone()
+                conn.execute("COMMIT")
+                conn.execute("DETACH DATABASE src")
+                check = conn.execute("PRAGMA quick_check").fetchone()[0]
+                if check != "ok":
+                    raise RuntimeError(f"Архив не прошел проверку: {check}")
+            finally:
+                conn.close()
+            sha256 = gzip_file(raw_path, gz_path, name)
+            with open(f"{path}.sha256", "w", encoding="utf-8") as f:
+                f.write(f"{sha256}  {os.path.basename(path)}\n")
+            os.replace(gz_path, path)
+        finally:
+            for tmp in (raw_path, gz_path):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        return path, sha256, rows
+
+    @asynccontextmanager
+    async def open_archive(self, campaign: dict):
+        """
+        Открывает архив кампании для чтения: проверяет контрольную сумму, распаковывает
+        во временный файл и отдает SnapshotDatabase. Файл удаляется после выхода из блока.
+        """
+        path = campaign["archive_path"]
+        if not path or not os.path.exists(path):
+            raise FileNotFoundError(f"Архив кампании №{campaign['id']} не найден: {path}")
+        if await asyncio.to_thread(file_sha256, path) != campaign["archive_sha256"]:
+            raise RuntimeError(f"Контрольная сумма архива {path} не совпадает.")
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".campaign-{campaign['id']}-", suffix=".db", dir=self.directory)
+        os.close(fd)
+        archive_db = None
+        try:
+            await asyncio.to_thread(gunzip_file, path, tmp_path)
+            archive_db = SnapshotDatabase(tmp_path, readers=1)
+            yield archive_db
+        finally:
+            if archive_db is not None:
+                await archive_db.close()
+            os.remove(tmp_path)
+
+    def get_stats(self) -> dict:
+        return {
+            "archived": self.archived,
+            "failed": self.failed,
+            "running": sum(not task.done() for task in self._running.values()),
+        }
+
+
+# Общий экземпляр, который запускается в main.py
+campaign_archiver = CampaignArchiver()
@@ -0,0 +1,256 @@
+# utils/backup.py
+
+import asyncio
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Callable
+
+from config import (DB_NAME, BACKUP_DIR, BACKUP_INTERVAL_HOURS, BACKUP_KEEP, BACKUP_STEP_PAGES,
+                    BACKUP_STEP_PAUSE_MS, EXPORT_FROM_SNAPSHOT)
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+RETRY_DELAY = 300  # Пауза перед повтором неудачного планового снимка, сек
+LATEST_NAME = "latest.db"  # Несжатая копия последнего снимка для выгрузок (EXPORT_FROM_SNAPSHOT)
+
+
+class BackupCancelled(Exception):
+    """Снимок прерван остановкой бота."""
+
+
+class BackupInfo:
+    """Результат снимка: сжатый файл, его размер и контрольная сумма."""
+    __slots__ = ("path", "size", "db_size", "sha256", "seconds", "created_at")
+
+    def __init__(self, path: str, size: int, db_size: int, sha256: str, seconds: float, created_at: float):
+        self.path = path
+        self.size = size
+        self.db_size = db_size
+        self.sha256 = sha256
+        self.seconds = seconds
+        self.created_at = created_at
+
+
+class _HashingWriter:
+    """Файл для записи, который по пути считает SHA-256 записанных (сжатых) данных."""
+
+    def __init__(self, f):
+        self._file = f
+        self.hash = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.hash.update(data)
+        return self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def gzip_file(source: str, target: str, name: str, cancelled: Callable[[], bool] = lambda: False) -> str:
+    """
+    Сжимает source в target (gzip, внутри - файл name) и сбрасывает его на диск.
+    Возвращает SHA-256 сжатого файла. cancelled() проверяется между блоками (BackupCancelled).
+    """
+    with open(source, "rb") as src, open(target, "wb") as raw:
+        writer = _HashingWriter(raw)
+        with gzip.GzipFile(filename=name, mode="wb", fileobj=writer, compresslevel=6) as gz:
+            while chunk := src.read(CHUNK_SIZE):
+                if cancelled():
+                    raise BackupCancelled()
+                gz.write(chunk)
+        raw.flush()
+        os.fsync(raw.fileno())
+    return writer.hash.hexdigest()
+
+
+def gunzip_file(source: str, target: str):
+    """Распаковывает сжатый gzip_file файл source в target."""
+    with gzip.open(source, "rb") as src, open(target, "wb") as dst:
+        while chunk := src.read(CHUNK_SIZE):
+            dst.write(chunk)
+
+
+class BackupManager:
+    """
+    Резервные копии рабочей базы без остановки бота.
+    Копирование идет через online backup API SQLite шагами по step_pages страниц с паузой
+    между шагами в отдельном потоке. Источник держит одну транзакцию чтения, поэтому
+    снимок согласован и не начинается заново при каждой записи, а в режиме WAL
+    чтение не блокирует add_submission и другие записи.
+    Снимок проверяется (quick_check), сжимается gzip в directory и получает файл .sha256
+    (формат sha256sum). Хранятся keep последних снимков.
+    Восстановление: остановить бота и распаковать снимок на место DB_NAME (gunzip -c ... > promo.db).
+    """
+
+    def __init__(self, db_name: str = DB_NAME, directory: str = BACKUP_DIR,
+                 interval: float = BACKUP_INTERVAL_HOURS * 3600, keep: int = BACKUP_KEEP,
+                 step_pages: int = BACKUP_STEP_PAGES, step_pause: float = BACKUP_STEP_PAUSE_MS / 1000,
+                 keep_latest: bool = EXPORT_FROM_SNAPSHOT):
+        self.db_name = db_name
+        self.directory = directory
+        self.interval = interval
+        self.keep = max(1, keep)
+        self.step_pages = max(1, step_pages)
+        self.step_pause = step_pause
+        self.keep_latest = keep_latest
+        self._task: asyncio.Task | None = None
+        self._running: asyncio.Task | None = None
+        self._cancelled = False
+
+        self.backups = 0
+        self.failed = 0
+        self.last: BackupInfo | None = None
+
+    @property
+    def prefix(self) -> str:
+        return os.path.splitext(os.path.basename(self.db_name))[0]
+
+    def start(self, db_name: str | None = None):
+        """Запускает плановые снимки (interval > 0). db_name - база, если не DB_NAME."""
+        self.db_name = db_name or self.db_name
+        os.makedirs(self.directory, exist_ok=True)
+        self._cancelled = False
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._schedule_loop())
+
+    async def stop(self):
+        self._cancelled = True  # Поток копирования прервется на следующем шаге
+        for task in (self._task, self._running):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = None
+        self._running = None
+
+    async def _schedule_loop(self):
+        while True:
+            snapshots = self.list_snapshots()
+            age = time.time() - os.path.getmtime(snapshots[-1]) if snapshots else self.interval
+            await asyncio.sleep(max(0.0, self.interval - age))
+            try:
+                await self.create()
+            except Exception as e:
+                logger.error(f"Плановый снимок базы не создан: {e}")
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def create(self) -> BackupInfo:
+        """Создает снимок. Если снимок уже создается, ждет его и возвращает его результат."""
+        if self._running is None or self._running.done():
+            self._running = asyncio.create_task(self._create())
+        return await asyncio.shield(self._running)
+
+    @metrics.timed("backup_seconds")
+    async def _create(self) -> BackupInfo:
+        try:
+            info = await asyncio.to_thread(self._create_sync)
+        except Exception:
+            self.failed += 1
+            raise
+        self.backups += 1
+        self.last = info
+        logger.info(f"Снимок базы {info.path}: {info.db_size / 1024 / 1024:.1f} МБ -> "
+                    f"{info.size / 1024 / 1024:.1f} МБ за {info.seconds:.1f} с")
+        return info
+
+    def _create_sync(self) -> BackupInfo:
+        started = time.perf_counter()
+        created_at = time.time()
+        name = f"{self.prefix}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(created_at))}.db.gz"
+        path = os.path.join(self.directory, name)
+        raw_path = os.path.join(self.directory, f".{name[:-3]}.tmp")
+        gz_path = f"{path}.tmp"
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            self._copy(raw_path)
+            db_size = os.path.getsize(raw_path)
+            sha256 = gzip_file(raw_path, gz_path, name[:-3], lambda: self._cancelled)
+            with open(f"{path}.sha256", "w", encoding="utf-8") as f:
+                f.write(f"{sha256}  {name}\n")
+            os.replace(gz_path, path)
+            if self.keep_latest:
+                os.replace(raw_path, os.path.join(self.directory, LATEST_NAME))  # Открытые выгрузки дочитают старый
+        finally:
+            for tmp in (raw_path, gz_path):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        self._rotate()
+        return BackupInfo(path, os.path.getsize(path), db_size, sha256, time.perf_counter() - started, created_at)
+
+    def _copy(self, target: str):
+        """Копирует рабочую базу в target шагами backup API и проверяет копию."""
+        source = sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True, isolation_level=None)
+        dest = sqlite3.connect(target, isolation_level=None)
+        try:
+            source.execute("PRAGMA busy_timeout = 5000")
+            # Транзакция чтения фиксирует версию базы на все время копирования
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+            def _progress(_status, _remaining, _total):
+                if self._cancelled:
+                    raise BackupCancelled()
+                if self.step_pause:
+                    time.sleep(self.step_pause)
+
+            source.backup(dest, pages=self.step_pages, progress=_progress)
+            source.execute("ROLLBACK")
+            dest.execute("PRAGMA journal_mode = DELETE")  # Снимок - обычный файл без -wal
+            check = dest.execute("PRAGMA quick_check").fetchone()[0]
+            if check != "ok":
+                raise RuntimeError(f"Снимок не прошел проверку: {check}")
+        finally:
+            dest.close()
+            source.close()
+
+    def _rotate(self):
+        for old in self.list_snapshots()[:-self.keep]:
+            for path in (old, f"{old}.sha256"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def list_snapshots(self) -> list[str]:
+        """Сжатые снимки от старых к новым (в имени - время создания)."""
+        return sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-*.db.gz")))
+
+    @staticmethod
+    def verify(path: str) -> bool:
+        """Сверяет снимок с его файлом .sha256."""
+        try:
+            with open(f"{path}.sha256", encoding="utf-8") as f:
+                expected = f.read().split()[0]
+        except (FileNotFoundError, IndexError):
+            return False
+        return file_sha256(path) == expected
+
+    def latest_snapshot(self) -> str | None:
+        """Несжатая копия последнего снимка для выгрузок или None."""
+        path = os.path.join(self.directory, LATEST_NAME)
+        return path if self.keep_latest and os.path.exists(path) else None
+
+    def get_stats(self) -> dict:
+        return {
+            "backups": self.backups,
+            "failed": self.failed,
+            "running": int(self._running is not None and not self._running.done()),
+            "last_size": self.last.size if self.last else 0,
+            "last_seconds": round(self.last.seconds, 3) if self.last else 0,
+        }
+
+
+# Общий экземпляр, который запускается в main.py
+backup_manager = BackupManager()
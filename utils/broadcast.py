@@ -0,0 +1,122 @@
+# utils/broadcast.py
+
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from config import BROADCAST_CONCURRENCY, BROADCAST_PAGE_SIZE, BROADCAST_PROGRESS_INTERVAL
+from database.database import Database as DB
+from utils.send_scheduler import send_priority, PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+
+class Broadcaster:
+    """
+    Возобновляемые рассылки. Список получателей и состояние доставки каждому
+    хранятся в БД, поэтому после перезапуска бота рассылка продолжается с того же места.
+    Отправки идут параллельно, темп задает общий планировщик отправок.
+    Прогресс показывается в одном сообщении админу, которое периодически редактируется.
+    """
+
+    def __init__(self, db: DB, bot: Bot, concurrency: int = BROADCAST_CONCURRENCY,
+                 page_size: int = BROADCAST_PAGE_SIZE, progress_interval: float = BROADCAST_PROGRESS_INTERVAL):
+        self.db = db
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self.page_size = page_size
+        self.progress_interval = progress_interval
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    async def start(self, text: str, admin_chat_id: int) -> tuple[int, int]:
+        """Создает рассылку и запускает ее в фоне. Возвращает (ID рассылки, количество получателей)."""
+        broadcast_id, total = await self.db.create_broadcast(text, admin_chat_id)
+        if not total:
+            await self.db.finish_broadcast(broadcast_id)
+            return broadcast_id, 0
+
+        progress_message = await self.bot.send_message(admin_chat_id, f"Рассылка №{broadcast_id}: 0 из {total}")
+        await self.db.set_broadcast_progress_message(broadcast_id, progress_message.message_id)
+        self._launch(broadcast_id, text, admin_chat_id, progress_message.message_id)
+        return broadcast_id, total
+
+    async def resume(self):
+        """Продолжает рассылки, прерванные перезапуском бота."""
+        for broadcast_id, text, admin_chat_id, progress_message_id in await self.db.get_running_broadcasts():
+            logger.info(f"Возобновляем рассылку №{broadcast_id}")
+            self._launch(broadcast_id, text, admin_chat_id, progress_message_id)
+
+    async def stop(self):
+        """Останавливает активные рассылки. Недоставленные получатели останутся в БД для возобновления."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _launch(self, broadcast_id: int, text: str, admin_chat_id: int, progress_message_id: int | None):
+        task = asyncio.create_task(self._run(broadcast_id, text, admin_chat_id, progress_message_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def _run(self, broadcast_id: int, text: str, admin_chat_id: int, progress_message_id: int | None):
+        send_priority.set(PRIORITY_BULK)  # Рассылка не должна задерживать ответы пользователям и админам
+        semaphore = asyncio.Semaphore(self.concurrency)
+        reporter = asyncio.create_task(self._report_progress(broadcast_id, admin_chat_id, progress_message_id))
+        try:
+            last_user_id = 0
+            while True:
+                user_ids = await self.db.get_pending_broadcast_recipients(broadcast_id, last_user_id, self.page_size)
+                if not user_ids:
+                    break
+                last_user_id = user_ids[-1]
+                await asyncio.gather(*(self._deliver(broadcast_id, user_id, text, semaphore) for user_id in user_ids))
+            await self.db.finish_broadcast(broadcast_id)
+        except Exception as e:
+            logger.error(f"Рассылка №{broadcast_id} прервана ошибкой: {e}")
+        finally:
+            reporter.cancel()
+        await self._update_progress(broadcast_id, admin_chat_id, progress_message_id, finished=True)
+
+    async def _deliver(self, broadcast_id: int, user_id: int, text: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                await self.bot.send_message(user_id, text)
+                state = 'sent'
+            except TelegramForbiddenError:
+                state = 'blocked'  # Пользователь заблокировал бота
+            except Exception as e:
+                logger.warning(f"Не удалось отправить рассылку пользователю {user_id}: {e}")
+                state = 'failed'
+            # Состояние сохраняется сразу (чекпоинт), запись группируется писателем БД
+            await self.db.mark_broadcast_recipient(broadcast_id, user_id, state)
+
+    async def _report_progress(self, broadcast_id: int, admin_chat_id: int, progress_message_id: int | None):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            await self._update_progress(broadcast_id, admin_chat_id, progress_message_id)
+
+    async def _update_progress(self, broadcast_id: int, admin_chat_id: int, progress_message_id: int | None,
+                               finished: bool = False):
+        counts = await self.db.get_broadcast_counts(broadcast_id)
+        total = sum(counts.values())
+        done = total - counts.get('pending', 0)
+        header = f"Рассылка №{broadcast_id} завершена" if finished and not counts.get('pending') \
+            else f"Рассылка №{broadcast_id}"
+        text = (
+            f"{header}: {done} из {total}\n"
+            f"Доставлено: {counts.get('sent', 0)}, "
+            f"заблокировали бота: {counts.get('blocked', 0)}, "
+            f"ошибки: {counts.get('failed', 0)}"
+        )
+        try:
+            if progress_message_id:
+                await self.bot.edit_message_text(text=text, chat_id=admin_chat_id, message_id=progress_message_id)
+            elif finished:
+                await self.bot.send_message(admin_chat_id, text)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.warning(f"Не удалось обновить прогресс рассылки №{broadcast_id}: {e}")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс рассылки №{broadcast_id}: {e}")
@@ -0,0 +1,264 @@
+# utils/cluster.py
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from collections.abc import Callable
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+
+from config import ADMIN_IDS, WORKER_MAX_UPDATES
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 60  # Сколько ждать запуска процесса-обработчика, сек
+STOP_TIMEOUT = 30  # Сколько ждать, пока обработчик доработает принятые апдейты, сек
+# Служебная строка в сокете: в заявке появились уведомления, outbox процесса админов нужно разбудить
+WAKE_OUTBOX = b"wake\n"
+
+
+def update_user_id(update: dict) -> int | None:
+    """ID пользователя, от которого пришел апдейт (from в message, callback_query, inline_query и т.д.)."""
+    for key, value in update.items():
+        if key != "update_id" and isinstance(value, dict):
+            user = value.get("from") or value.get("user")
+            return user.get("id") if user else None
+    return None
+
+
+def shard_for(update: dict, workers: int) -> int:
+    """
+    Номер обработчика для апдейта. Все апдейты одного пользователя попадают в один процесс,
+    поэтому его переходы FSM, альбомы и лимиты флуда обрабатываются в одном месте и по порядку.
+    Апдейты админов уходят в отдельный процесс с номером workers (тяжелые выгрузки и фоновые задачи).
+    """
+    user_id = update_user_id(update)
+    if user_id in ADMIN_IDS:
+        return workers
+    return user_id % workers if user_id is not None else 0
+
+
+class _WorkerLink:
+    """Процесс-обработчик и соединение с ним."""
+    __slots__ = ("index", "socket_path", "process", "writer", "ready", "inflight", "sent", "reader_task")
+
+    def __init__(self, index: int, socket_path: str):
+        self.index = index
+        self.socket_path = socket_path
+        self.process: multiprocessing.Process | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.ready = asyncio.Event()
+        self.inflight = 0
+        self.sent = 0
+        self.reader_task: asyncio.Task | None = None
+
+
+class Ingress:
+    """
+    Прием апдейтов в многопроцессном режиме (BOT_WORKERS > 0).
+    Запускает workers процессов для пользователей и еще один для админов (он же выполняет
+    фоновые задачи: outbox, письма, рассылки) и передает им апдейты по Unix-сокетам -
+    строка JSON на апдейт. Обработчик подтверждает каждый обработанный апдейт пустой строкой.
+    Строку WAKE_OUTBOX от процесса пользователей Ingress передает процессу админов, чтобы
+    уведомления о новой заявке уходили сразу, а не при следующем опросе outbox.
+    Запись в сокет ждет, пока обработчик не вычитает данные, поэтому перегруженный
+    процесс замедляет прием (backpressure). Упавший процесс перезапускается.
+    target(index, socket_path, service, **worker_kwargs) - функция процесса-обработчика.
+    """
+
+    def __init__(self, workers: int, target: Callable[..., None], socket_dir: str, **worker_kwargs: Any):
+        self.workers = workers
+        self.target = target
+        self.worker_kwargs = worker_kwargs
+        self._context = multiprocessing.get_context("spawn")
+        self._links = [_WorkerLink(index, os.path.join(socket_dir, f"worker-{index}.sock"))
+                       for index in range(workers + 1)]
+        self._stopping = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.lost = 0
+
+    async def start(self):
+        await asyncio.gather(*(self._spawn(link) for link in self._links))
+        logger.info(f"Запущено {self.workers} обработчиков пользователей и обработчик админов")
+
+    async def _spawn(self, link: _WorkerLink):
+        if os.path.exists(link.socket_path):
+            os.remove(link.socket_path)
+        link.process = self._context.Process(
+            target=self.target, name=f"bot-worker-{link.index}", daemon=False,
+            args=(link.index, link.socket_path, link.index == self.workers), kwargs=self.worker_kwargs,
+        )
+        link.process.start()
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            try:
+                reader, link.writer = await asyncio.open_unix_connection(link.socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if not link.process.is_alive() or time.monotonic() > deadline:
+                    raise RuntimeError(f"Обработчик {link.index} не запустился (код {link.process.exitcode})")
+                await asyncio.sleep(0.1)
+        link.reader_task = asyncio.create_task(self._read_acks(link, reader))
+        link.ready.set()
+
+    async def _read_acks(self, link: _WorkerLink, reader: asyncio.StreamReader):
+        try:
+            while line := await reader.readline():
+                if line == WAKE_OUTBOX:
+                    self._wake_service()
+                    continue
+                link.inflight -= 1
+                self._check_idle()
+        except ConnectionError:
+            pass
+        if self._stopping:
+            return
+        # Соединение оборвалось без команды остановки - процесс упал
+        link.ready.clear()
+        self.lost += link.inflight
+        logger.error(f"Обработчик {link.index} завершился (код {link.process.exitcode}), "
+                     f"потеряно апдейтов в обработке: {link.inflight}. Перезапускаем.")
+        link.inflight = 0
+        self._check_idle()
+        await asyncio.to_thread(link.process.join)
+        await self._spawn(link)
+
+    def _wake_service(self):
+        link = self._links[self.workers]
+        if not self._stopping and link.ready.is_set() and not link.writer.is_closing():
+            link.writer.write(WAKE_OUTBOX)
+
+    def _check_idle(self):
+        if all(link.inflight == 0 for link in self._links):
+            self._idle.set()
+
+    async def dispatch(self, update: dict):
+        """Передает апдейт обработчику его пользователя."""
+        link = self._links[shard_for(update, self.workers)]
+        if not link.ready.is_set():
+            await link.ready.wait()
+        link.inflight += 1
+        link.sent += 1
+        self._idle.clear()
+        link.writer.write(json.dumps(update, ensure_ascii=False, separators=(",", ":")).encode() + b"\n")
+        await link.writer.drain()
+
+    async def wait_idle(self):
+        """Ждет, пока обработчики не подтвердят все переданные апдейты."""
+        await self._idle.wait()
+
+    async def stop(self):
+        """Закрывает передачу апдейтов: обработчики дорабатывают принятые апдейты и завершаются."""
+        self._stopping = True
+        for link in self._links:
+            if link.writer is not None and link.ready.is_set():
+                link.writer.write_eof()  # Подтверждения от обработчика продолжают приходить
+        await asyncio.gather(*(self._join(link) for link in self._links))
+
+    async def _join(self, link: _WorkerLink):
+        if link.process is None:
+            return
+        await asyncio.to_thread(link.process.join, STOP_TIMEOUT)
+        if link.process.is_alive():
+            logger.warning(f"Обработчик {link.index} не завершился за {STOP_TIMEOUT} с, останавливаем принудительно")
+            link.process.terminate()
+            await asyncio.to_thread(link.process.join)
+        if link.reader_task is not None:
+            await asyncio.gather(link.reader_task, return_exceptions=True)
+        if link.writer is not None:
+            link.writer.close()
+
+    def get_stats(self) -> dict:
+        stats = {f"worker_{link.index}_inflight": link.inflight for link in self._links}
+        stats |= {f"worker_{link.index}_sent": link.sent for link in self._links}
+        return stats | {"lost": self.lost}
+
+
+async def serve_worker(socket_path: str, dp: Dispatcher, bot: Bot, service: bool = False,
+                       max_updates: int = WORKER_MAX_UPDATES, **workflow_data: Any):
+    """
+    Цикл процесса-обработчика: принимает апдейты от Ingress и обрабатывает их параллельно
+    (не больше max_updates одновременно, апдейты одного пользователя - по порядку), подтверждая каждый. Когда Ingress закрывает
+    соединение, дожидается обработки принятых апдейтов и возвращается.
+    service - процесс админов: WAKE_OUTBOX от Ingress будит его outbox. В процессах пользователей
+    outbox не запущен, и его wake() передается через Ingress процессу админов.
+    """
+    outbox = workflow_data.get("outbox")
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Остановкой управляет Ingress
+    done = asyncio.Event()
+    slots = asyncio.Semaphore(max_updates)
+    tasks: set[asyncio.Task] = set()
+    # Апдейты одного пользователя обрабатываются по очереди: user_id -> (последний апдейт,
+    # альбом, апдейт перед альбомом). Части одного альбома ждут одного и того же
+    # предыдущего апдейта и идут параллельно - их склеивает MediaGroupMiddleware,
+    # а следующий апдейт ждет первую часть, которая и вызывает хендлер.
+    chains: dict[int, tuple[asyncio.Task, str | None, asyncio.Task | None]] = {}
+
+    def _previous(user_id: int | None, group: str | None) -> tuple[asyncio.Task | None, bool]:
+        """Апдейт, которого нужно дождаться, и признак продолжения уже начатого альбома."""
+        if user_id not in chains:
+            return None, False
+        last, last_group, before_group = chains[user_id]
+        if group is not None and group == last_group:
+            return before_group, True
+        return last, False
+
+    def _release(user_id: int, task: asyncio.Task):
+        if user_id in chains and chains[user_id][0] is task:
+            del chains[user_id]
+
+    async def _feed(update: dict, writer: asyncio.StreamWriter, previous: asyncio.Task | None):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await dp.feed_raw_update(bot, update, **workflow_data)
+        except Exception as e:
+            logger.exception(f"Ошибка обработки апдейта {update.get('update_id')}: {e}")
+        finally:
+            slots.release()
+            if not writer.is_closing():
+                writer.write(b"\n")
+
+    def _send_wake(writer: asyncio.StreamWriter):
+        if not writer.is_closing():
+            writer.write(WAKE_OUTBOX)
+
+    async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if outbox is not None and not service:
+            outbox.forward_wake(lambda: _send_wake(writer))
+        try:
+            while line := await reader.readline():
+                if line == WAKE_OUTBOX:
+                    if outbox is not None:
+                        outbox.wake()
+                    continue
+                await slots.acquire()  # Пока все слоты заняты, сокет не читается: Ingress ждет
+                update = json.loads(line)
+                user_id = update_user_id(update)
+                group = (update.get("message") or {}).get("media_group_id")
+                previous, continues_album = _previous(user_id, group)
+                task = asyncio.create_task(_feed(update, writer, previous))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if user_id is not None and not continues_album:
+                    chains[user_id] = (task, group, previous)
+                    task.add_done_callback(lambda done_task, user_id=user_id: _release(user_id, done_task))
+            await asyncio.gather(*tasks)
+        finally:
+            if outbox is not None and not service:
+                outbox.forward_wake(None)
+            writer.close()
+            done.set()
+
+    server = await asyncio.start_unix_server(_handle, path=socket_path)
+    try:
+        await done.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
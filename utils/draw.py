@@ -0,0 +1,68 @@
+# utils/draw.py
+
+import hashlib
+import heapq
+import math
+import random
+import secrets
+
+from config import DRAW_BONUS_WEIGHT, DRAW_PAGE_SIZE
+
+DRAW_STATUSES = ("approved", "bonus")  # Участвуют в розыгрыше, порядок задает порядок чтения из БД
+
+
+class DrawResult:
+    """Итог розыгрыша: победители по местам и данные для его проверки."""
+
+    __slots__ = ("seed", "bonus_weight", "eligible", "input_hash", "winners")
+
+    def __init__(self, seed: str, bonus_weight: float, eligible: int, input_hash: str,
+                 winners: list[tuple[int, int, str]]):
+        self.seed = seed
+        self.bonus_weight = bonus_weight
+        self.eligible = eligible
+        self.input_hash = input_hash
+        self.winners = winners  # [(submission_id, user_id, status)], первое место первым
+
+
+def new_seed() -> str:
+    return secrets.token_hex(16)
+
+
+def status_weight(status: str, bonus_weight: float) -> float:
+    return bonus_weight if status == "bonus" else 1.0
+
+
+async def draw_winners(pages, count: int, seed: str, bonus_weight: float = DRAW_BONUS_WEIGHT) -> DrawResult:
+    """
+    Взвешенная выборка без возвращения (Efraimidis-Spirakis, A-Res) из потока участников.
+    pages - асинхронный итератор страниц [(id, user_id, status)]. Каждому участнику
+    присваивается ключ u^(1/w), в памяти держится только куча из count лучших ключей,
+    поэтому память O(count), а не O(участников). Генератор случайных чисел инициализирован
+    seed, и при том же порядке участников результат воспроизводится.
+    Заодно считается SHA-256 входного списка, чтобы при проверке убедиться, что он не изменился.
+    """
+    rng = random.Random(seed)
+    digest = hashlib.sha256()
+    heap: list[tuple[float, int, int, str]] = []
+    eligible = 0
+    async for rows in pages:
+        digest.update("".join(f"{row_id}:{user_id}:{status};" for row_id, user_id, status in rows).encode())
+        for row_id, user_id, status in rows:
+            eligible += 1
+            # log(u) / w - монотонное преобразование u^(1/w), без потери точности на малых u
+            key = math.log(1.0 - rng.random()) / status_weight(status, bonus_weight)
+            item = (key, row_id, user_id, status)
+            if len(heap) < count:
+                heapq.heappush(heap, item)
+            elif key > heap[0][0]:
+                heapq.heapreplace(heap, item)
+    winners = [(row_id, user_id, status) for _, row_id, user_id, status in sorted(heap, reverse=True)]
+    return DrawResult(seed, bonus_weight, eligible, digest.hexdigest(), winners)
+
+
+async def run_draw(db, count: int, seed: str | None = None, bonus_weight: float = DRAW_BONUS_WEIGHT,
+                   page_size: int = DRAW_PAGE_SIZE, campaign_id: int | None = None) -> DrawResult:
+    """Проводит розыгрыш по участникам кампании (по умолчанию текущей) в базе (без сохранения)."""
+    return await draw_winners(db.iter_eligible(DRAW_STATUSES, page_size, campaign_id), count, seed or new_seed(),
+                              bonus_weight)
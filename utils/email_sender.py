@@ -1,65 +1,249 @@
 # utils/email_sender.py
 
+import asyncio
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
+from email.mime.text import MIMEText
 from email import encoders
 import logging
 from aiogram import Bot
 import io
 
+from utils.file_links import file_link_resolver
+from utils.metrics import metrics
+from utils.photo_mirror import photo_mirror
+
 # ИМПОРТИРУЕМ ПЕРЕМЕННЫЕ ИЗ ВАШЕГО CONFIG.PY
-from config import SMTP_EMAIL, SMTP_PASSWORD, RECEIVER_EMAIL, EMAIL_SMTP_SERVER, EMAIL_SMTP_PORT
+from config import (SMTP_EMAIL, SMTP_PASSWORD, RECEIVER_EMAIL, EMAIL_SMTP_SERVER, EMAIL_SMTP_PORT,
+                    EMAIL_SMTP_STARTTLS, EMAIL_DIGEST_MAX, EMAIL_MAX_RETRIES, EMAIL_RETRY_DELAY)
 
 logger = logging.getLogger(__name__)
 
 
-async def send_email_with_photos(bot: Bot, caption: str, file_ids: list[str]):
+class _SmtpSession:
     """
-    Отправляет email с прикрепленными фотографиями.
-    Фотографии загружаются из Telegram по их file_id.
+    Одно долгоживущее SMTP-соединение с выполненными STARTTLS и login.
+    Методы синхронные и вызываются из отдельного потока через asyncio.to_thread.
     """
-    # Проверяем, настроены ли все необходимые переменные для отправки email
-    # Используем ваши имена переменных из config.py
-    if not all([SMTP_EMAIL, SMTP_PASSWORD, RECEIVER_EMAIL, EMAIL_SMTP_SERVER, EMAIL_SMTP_PORT]):
-        logger.warning("Настройки email не полностью указаны в config.py. Отправка email пропущена.")
-        return
-
-    msg = MIMEMultipart()
-    msg['From'] = SMTP_EMAIL  # Используем вашу переменную
-    msg['To'] = RECEIVER_EMAIL  # Используем вашу переменную
-    msg['Subject'] = f"Новая заявка на ChocoWow: {caption}"
-
-    # Добавляем текстовое содержимое письма
-    msg.attach(MIMEBase('text', 'plain', charset='utf-8', _payload=caption))
-
-    # Прикрепляем фотографии
-    for i, file_id in enumerate(file_ids):
+
+    def __init__(self, host: str, port: int, email: str | None, password: str | None, starttls: bool):
+        self.host = host
+        self.port = port
+        self.email = email
+        self.password = password
+        self.starttls = starttls
+        self.server: smtplib.SMTP | None = None
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            server.starttls()  # Для шифрованного соединения
+        if self.email and self.password:
+            server.login(self.email, self.password)
+        self.server = server
+
+    def send(self, msg: MIMEMultipart):
+        """Отправляет письмо, переподключаясь, если сервер успел закрыть соединение."""
+        if self.server is None:
+            self._connect()
         try:
-            # Получаем File объект из Telegram
-            file_info = await bot.get_file(file_id)
-            # Скачиваем файл в BytesIO буфер
-            file_buffer = io.BytesIO()
-            await bot.download_file(file_info.file_path, destination=file_buffer)
-            file_buffer.seek(0)  # Переводим указатель в начало буфера
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.server = None
+            self._connect()
+            self.server.send_message(msg)
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+        self.server = None
+
+
+class EmailWorker:
+    """
+    Фоновая отправка писем о заявках. Заявки кладутся в очередь (submit ждет отправки письма,
+    enqueue - нет), а воркер скачивает фото параллельно, держит одно авторизованное SMTP-соединение,
+    при накоплении очереди объединяет несколько заявок в одно письмо-дайджест
+    и повторяет неудачные отправки с экспоненциальной задержкой.
+    """
+
+    def __init__(self, host: str = EMAIL_SMTP_SERVER, port: int = EMAIL_SMTP_PORT,
+                 sender: str = SMTP_EMAIL, password: str = SMTP_PASSWORD, receiver: str = RECEIVER_EMAIL,
+                 starttls: bool = EMAIL_SMTP_STARTTLS, digest_max: int = EMAIL_DIGEST_MAX,
+                 max_retries: int = EMAIL_MAX_RETRIES, retry_delay: float = EMAIL_RETRY_DELAY):
+        self.sender = sender
+        self.receiver = receiver
+        self.digest_max = max(1, digest_max)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.enabled = all([host, port, sender, receiver])
+        self._smtp = _SmtpSession(host, port, sender, password, starttls)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self._bot: Bot | None = None
+
+        self.sent_emails = 0
+        self.sent_submissions = 0
+        self.failed_submissions = 0
+
+    def start(self, bot: Bot):
+        """Запускает фоновую задачу отправки."""
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Отправляет все, что осталось в очереди, и останавливает воркер."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        await asyncio.to_thread(self._smtp.close)
 
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(file_buffer.read())
-            encoders.encode_base64(part)
+    def enqueue(self, caption: str, file_ids: list[str]):
+        """Ставит заявку в очередь на отправку и сразу возвращает управление."""
+        if not self.enabled:
+            logger.warning("Настройки email не полностью указаны в config.py. Отправка email пропущена.")
+            return
+        self._queue.put_nowait((caption, list(file_ids), None))
 
+    async def submit(self, caption: str, file_ids: list[str]):
+        """
+        Ставит заявку в очередь и ждет, пока письмо (или дайджест с ней) будет отправлено.
+        Если отправить не удалось и после повторов, пробрасывает ошибку SMTP.
+        """
+        if not self.enabled:
+            logger.warning("Настройки email не полностью указаны в config.py. Отправка email пропущена.")
+            return
+        if self._task is None or self._task.done():
+            raise RuntimeError("Воркер отправки email не запущен")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((caption, list(file_ids), future))
+        await future
+
+    def get_stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "sent_emails": self.sent_emails,
+            "sent_submissions": self.sent_submissions,
+            "failed_submissions": self.failed_submissions,
+        }
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Если очередь накопилась, объединяем заявки в один дайджест
+            while len(batch) < self.digest_max and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await self._send_batch(batch)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке email: {e}")
+                error = e
+            else:
+                error = None
+            # Сообщаем результат тем, кто ждет отправки (submit)
+            for _, _, future in batch:
+                if future is None or future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    async def _download(self, file_id: str) -> tuple[bytes, str] | None:
+        """Берет фото из локального зеркала или скачивает из Telegram. Возвращает (содержимое, расширение) или None."""
+        try:
+            local = await photo_mirror.read(file_id)
+            if local is not None:
+                return local
+            # Получаем путь к файлу в Telegram (из кэша, если он уже запрашивался)
+            file_path = await file_link_resolver.get_file_path(self._bot, file_id)
+            file_buffer = io.BytesIO()
+            await self._bot.download_file(file_path, destination=file_buffer)
             # Определяем расширение файла, если возможно, или используем общее
-            file_extension = file_info.file_path.split('.')[-1] if '.' in file_info.file_path else 'jpg'
-            part.add_header('Content-Disposition', f'attachment; filename=photo_{i + 1}.{file_extension}')
-            msg.attach(part)
+            file_extension = file_path.split('.')[-1] if '.' in file_path else 'jpg'
+            return file_buffer.getvalue(), file_extension
         except Exception as e:
             logger.error(f"Не удалось прикрепить фото {file_id} к email: {e}")
+            return None
 
-    # Отправляем письмо
-    try:
-        with smtplib.SMTP(EMAIL_SMTP_SERVER, EMAIL_SMTP_PORT) as server:  # Используем ваши переменные
-            server.starttls()  # Для шифрованного соединения
-            server.login(SMTP_EMAIL, SMTP_PASSWORD)  # Используем ваши переменные
-            server.send_message(msg)
-        logger.info(f"Email с заявкой отправлен на {RECEIVER_EMAIL}")  # Используем вашу переменную
-    except Exception as e:
-        logger.error(f"Ошибка при отправке email: {e}")
\ No newline at end of file
+    def _build_message(self, batch: list[tuple], attachments: list) -> MIMEMultipart:
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = self.receiver
+        if len(batch) == 1:
+            msg['Subject'] = f"Новая заявка на ChocoWow: {batch[0][0]}"
+        else:
+            msg['Subject'] = f"Новые заявки на ChocoWow ({len(batch)} шт.)"
+
+        # Добавляем текстовое содержимое письма
+        msg.attach(MIMEText("\n".join(caption for caption, _, _ in batch), 'plain', 'utf-8'))
+
+        # Прикрепляем фотографии
+        attachment_iter = iter(attachments)
+        for submission_number, (_, file_ids, _) in enumerate(batch, start=1):
+            for i in range(len(file_ids)):
+                attachment = next(attachment_iter)
+                if attachment is None:
+                    continue
+                payload, file_extension = attachment
+                part = MIMEBase('application', 'octet-stream')
+                part.set_payload(payload)
+                encoders.encode_base64(part)
+                prefix = f"submission_{submission_number}_" if len(batch) > 1 else ""
+                part.add_header('Content-Disposition', f'attachment; filename={prefix}photo_{i + 1}.{file_extension}')
+                msg.attach(part)
+        return msg
+
+    @metrics.timed("email_seconds")
+    async def _send_batch(self, batch: list[tuple]):
+        # Скачиваем все фото пачки параллельно
+        attachments = await asyncio.gather(*(self._download(fid) for _, file_ids, _ in batch for fid in file_ids))
+        # Кодирование в base64 и сборка письма занимают CPU, поэтому выполняются в отдельном потоке
+        msg = await asyncio.to_thread(self._build_message, batch, attachments)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.timer("email_seconds", "smtp_send"):
+                    await asyncio.to_thread(self._smtp.send, msg)
+                self.sent_emails += 1
+                self.sent_submissions += len(batch)
+                logger.info(f"Email с {len(batch)} заявк(ами) отправлен на {self.receiver}")
+                return
+            except Exception as e:
+                await asyncio.to_thread(self._smtp.close)
+                if attempt == self.max_retries:
+                    self.failed_submissions += len(batch)
+                    logger.error(f"Ошибка при отправке email после {attempt + 1} попыток: {e}")
+                    raise
+                delay = self.retry_delay * 2 ** attempt
+                logger.warning(f"Ошибка при отправке email (попытка {attempt + 1}), повтор через {delay} с: {e}")
+                await asyncio.sleep(delay)
+
+
+# Общий воркер, который запускается в main.py
+email_worker = EmailWorker()
+
+
+async def send_email_with_photos(bot: Bot, caption: str, file_ids: list[str]):
+    """
+    Отправляет email с прикрепленными фотографиями через фоновый воркер и ждет отправки.
+    Фотографии загружаются из Telegram по их file_id уже в воркере. Ошибка SMTP
+    пробрасывается, чтобы outbox повторил отправку позже.
+    """
+    await email_worker.submit(caption, file_ids)
@@ -1,86 +1,150 @@
 # utils/export_data.py
 
 import csv
-import io
+import gzip
+import os
 import asyncio
-from datetime import datetime
+import tempfile
 from aiogram import Bot  # Импортируем Bot для получения информации о файлах
 
-# Базовый URL для скачивания файлов Telegram.
-# BOT_TOKEN будет добавлен динамически в функции.
-TELEGRAM_FILE_BASE_URL = "https://api.telegram.org/file/bot"
+from config import EXPORT_PAGE_SIZE
+from utils.file_links import file_link_resolver
+from utils.metrics import metrics
+from utils.photo_mirror import photo_mirror
 
+try:
+    from openpyxl import Workbook  # Необязательная зависимость, нужна только для format=xlsx
+except ImportError:
+    Workbook = None
 
-async def generate_participants_csv(
-        column_names: list[str],
-        data: list[tuple],
-        bot: Bot  # Добавляем аргумент bot
-) -> io.BytesIO:
-    """
-    Генерирует CSV-файл из предоставленных данных, заменяя ID фото на URL-ссылки,
-    и возвращает его в виде BytesIO объекта.
-    Эта операция выполняется в отдельном потоке, чтобы не блокировать основной асинхронный цикл.
-    """
+PHOTO_COLUMNS = {
+    "collection_photo_id": "collection_photo_url",
+    "receipt_photo_ids": "receipt_photo_urls",  # Несколько file_id через пробел, ссылки - по одной в строке
+}
+EXPORT_STATUSES = ("pending", "approved", "bonus", "rejected")
+EXPORT_FORMATS = ("csv", "csv.gz", "xlsx")
 
-    bot_token = bot.token
-    telegram_file_url_prefix = f"{TELEGRAM_FILE_BASE_URL}{bot_token}/"
 
-    # Подготавливаем данные: заменяем ID фото на их URL
-    processed_data = []
+def parse_export_args(args: str | None) -> tuple[str | None, str, int | None]:
+    """
+    Разбирает аргументы команды вида "status=approved format=csv.gz campaign=2".
+    Возвращает (status, format, campaign_id). При неверных значениях выбрасывает ValueError.
+    """
+    status, fmt, campaign_id = None, "csv", None
+    for part in (args or "").split():
+        key, _, value = part.partition("=")
+        key, value = key.strip().lower(), value.strip().lower()
+        if key == "status":
+            if value not in EXPORT_STATUSES:
+                raise ValueError(f"Неизвестный статус '{value}'. Доступны: {', '.join(EXPORT_STATUSES)}")
+            status = value
+        elif key == "format":
+            if value not in EXPORT_FORMATS:
+                raise ValueError(f"Неизвестный формат '{value}'. Доступны: {', '.join(EXPORT_FORMATS)}")
+            fmt = value
+        elif key == "campaign":
+            if not value.isdigit():
+                raise ValueError(f"Номер кампании должен быть числом: '{value}'. Список кампаний: /campaign")
+            campaign_id = int(value)
+        else:
+            raise ValueError(f"Неизвестный параметр '{part}'. Пример: status=approved format=csv.gz")
+    if fmt == "xlsx" and Workbook is None:
+        raise ValueError("Для формата xlsx нужно установить пакет openpyxl.")
+    return status, fmt, campaign_id
+
+
+def _photo_link(bot: Bot, file_id: str, local_paths: dict[str, str], file_paths: dict[str, str]) -> str:
+    if file_id in local_paths:
+        return photo_mirror.build_link(local_paths[file_id])
+    file_path = file_paths.get(file_id)
+    if file_path is None:
+        return f"Не удалось получить ссылку: {file_id}"  # Обработка ошибок
+    return file_link_resolver.build_url(bot, file_path)
+
+
+@metrics.timed("export_seconds")
+async def resolve_photo_links(column_names: list[str], rows: list[tuple], bot: Bot) -> list[list]:
+    """
+    Заменяет ID фото в строках на ссылки.
+    Фото из локального зеркала получают постоянную ссылку на копию (если задан PHOTO_PUBLIC_URL), для остальных
+    ссылки Telegram получаются параллельно через общий FileLinkResolver с кэшем.
+    """
     # Определяем индексы для фотоколонок, чтобы знать, какие данные заменять
-    collection_photo_idx = -1
-    receipt_photo_idx = -1
-    try:
-        collection_photo_idx = column_names.index("collection_photo_id")
-    except ValueError:
-        pass
+    photo_indexes = [column_names.index(col) for col in PHOTO_COLUMNS if col in column_names]
+    file_ids = [fid for row in rows for idx in photo_indexes for fid in (row[idx] or "").split()]
+
+    # Если зеркало раздается по PHOTO_PUBLIC_URL, берем ссылки на него, остальные запрашиваем у Telegram одним пакетом
+    local_paths = await photo_mirror.get_local_paths(file_ids) if photo_mirror.public_url else {}
+    file_paths = await file_link_resolver.resolve_many(bot, (fid for fid in file_ids if fid not in local_paths))
+
+    processed = []
+    for row_tuple in rows:
+        row_list = list(row_tuple)
+        for idx in photo_indexes:
+            if row_list[idx]:
+                row_list[idx] = "\n".join(_photo_link(bot, file_id, local_paths, file_paths)
+                                           for file_id in row_list[idx].split())
+        processed.append(row_list)
+    return processed
+
+
+class _ExportWriter:
+    """Построчная запись выгрузки в файл выбранного формата."""
+
+    def __init__(self, path: str, fmt: str):
+        self.fmt = fmt
+        self.path = path
+        if fmt == "xlsx":
+            self._workbook = Workbook(write_only=True)  # write_only не держит все строки в памяти
+            self._sheet = self._workbook.create_sheet("participants")
+        else:
+            opener = gzip.open if fmt == "csv.gz" else open
+            self._file = opener(path, "wt", newline="", encoding="utf-8")
+            self._csv = csv.writer(self._file)
+
+    def write_rows(self, rows):
+        if self.fmt == "xlsx":
+            for row in rows:
+                self._sheet.append(row)
+        else:
+            self._csv.writerows(rows)
+
+    def close(self):
+        if self.fmt == "xlsx":
+            self._workbook.save(self.path)
+        else:
+            self._file.close()
+
+
+@metrics.timed("export_seconds")
+async def export_participants(db, bot: Bot, status: str | None = None, fmt: str = "csv",
+                              page_size: int = EXPORT_PAGE_SIZE, campaign_id: int | None = None) -> tuple[str, int]:
+    """
+    Потоково выгружает участников кампании (по умолчанию текущей) во временный файл: читает БД страницами,
+    получает ссылки на фото для каждой страницы и сразу дописывает ее в файл.
+    В памяти одновременно находится только одна страница.
+    Возвращает (путь к файлу, количество строк). Файл удаляет вызывающий код.
+    """
+    column_names = db.PARTICIPANT_EXPORT_COLUMNS
+    # Изменяем названия столбцов для вывода в файл
+    display_column_names = [PHOTO_COLUMNS.get(col, col) for col in column_names]
+
+    fd, path = tempfile.mkstemp(prefix="participants_", suffix=f".{fmt}")
+    os.close(fd)
+    writer = None
+    count = 0
     try:
-        receipt_photo_idx = column_names.index("receipt_photo_id")
-    except ValueError:
-        pass
-
-    for row_tuple in data:
-        row_list = list(row_tuple)  # Копируем в список для изменения
-
-        # Получаем file_path и формируем URL для фото коллекции
-        if collection_photo_idx != -1 and row_list[collection_photo_idx]:
-            file_id = row_list[collection_photo_idx]
-            try:
-                file_info = await bot.get_file(file_id)
-                row_list[collection_photo_idx] = f"{telegram_file_url_prefix}{file_info.file_path}"
-            except Exception:
-                row_list[collection_photo_idx] = f"Не удалось получить ссылку: {file_id}"  # Обработка ошибок
-
-        # Получаем file_path и формируем URL для фото чека
-        if receipt_photo_idx != -1 and row_list[receipt_photo_idx]:
-            file_id = row_list[receipt_photo_idx]
-            try:
-                file_info = await bot.get_file(file_id)
-                row_list[receipt_photo_idx] = f"{telegram_file_url_prefix}{file_info.file_path}"
-            except Exception:
-                row_list[receipt_photo_idx] = f"Не удалось получить ссылку: {file_id}"  # Обработка ошибок
-
-        processed_data.append(tuple(row_list))  # Добавляем обработанную строку обратно как кортеж
-
-    # Изменяем названия столбцов для вывода в CSV
-    display_column_names = [col for col in column_names]
-    if collection_photo_idx != -1:
-        display_column_names[collection_photo_idx] = "collection_photo_url"
-    if receipt_photo_idx != -1:
-        display_column_names[receipt_photo_idx] = "receipt_photo_url"
-
-    # Теперь генерируем CSV в отдельном потоке
-    # (Эта функция должна быть синхронной, так как она вызывается через asyncio.to_thread)
-    def _generate_sync_csv():
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        writer.writerow(display_column_names)  # Записываем измененные заголовки
-        for row in processed_data:  # Записываем уже обработанные данные
-            writer.writerow(row)
-
-        return output.getvalue().encode('utf-8')
-
-    csv_bytes = await asyncio.to_thread(_generate_sync_csv)
-
-    return io.BytesIO(csv_bytes)
\ No newline at end of file
+        # Запись в файл выполняется в отдельном потоке, чтобы не блокировать основной асинхронный цикл
+        writer = await asyncio.to_thread(_ExportWriter, path, fmt)
+        await asyncio.to_thread(writer.write_rows, [display_column_names])
+        async for rows in db.iter_participants(status=status, page_size=page_size, campaign_id=campaign_id):
+            processed = await resolve_photo_links(column_names, rows, bot)
+            await asyncio.to_thread(writer.write_rows, processed)
+            count += len(processed)
+        await asyncio.to_thread(writer.close)
+    except BaseException:
+        if writer is not None and writer.fmt != "xlsx":
+            writer.close()
+        os.remove(path)
+        raise
+    return path, count
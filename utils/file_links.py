@@ -0,0 +1,107 @@
+# utils/file_links.py
+
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+
+from config import FILE_LINK_CONCURRENCY, FILE_LINK_TTL
+
+logger = logging.getLogger(__name__)
+
+# Базовый URL для скачивания файлов Telegram.
+TELEGRAM_FILE_BASE_URL = "https://api.telegram.org/file/bot"
+
+
+class FileLinkResolver:
+    """
+    Получает file_path для file_id через bot.get_file с ограничением параллельности
+    и кэширует результат. Telegram гарантирует работу ссылки примерно час,
+    поэтому TTL кэша по умолчанию чуть меньше часа.
+    """
+
+    def __init__(self, concurrency: int = FILE_LINK_CONCURRENCY, ttl: float = FILE_LINK_TTL):
+        self.concurrency = max(1, concurrency)
+        self.ttl = ttl
+        self._cache: dict[str, tuple[str, float]] = {}  # file_id -> (file_path, время истечения)
+        self._inflight: dict[str, asyncio.Future] = {}  # Запросы, которые уже выполняются
+        self._semaphore: asyncio.Semaphore | None = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def _get_cached(self, file_id: str) -> str | None:
+        cached = self._cache.get(file_id)
+        if cached is None:
+            return None
+        file_path, expires_at = cached
+        if expires_at < time.monotonic():
+            del self._cache[file_id]
+            return None
+        return file_path
+
+    def _prune(self):
+        """Удаляет из кэша просроченные записи."""
+        now = time.monotonic()
+        for file_id in [fid for fid, (_, expires_at) in self._cache.items() if expires_at < now]:
+            del self._cache[file_id]
+
+    async def get_file_path(self, bot: Bot, file_id: str) -> str:
+        """Возвращает file_path для file_id, используя кэш. Ошибки get_file пробрасываются."""
+        file_path = self._get_cached(file_id)
+        if file_path is not None:
+            self.hits += 1
+            return file_path
+
+        # Если этот же file_id уже запрашивается, ждем тот же результат
+        inflight = self._inflight.get(file_id)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        if len(self._cache) > 100_000:
+            self._prune()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[file_id] = future
+        try:
+            async with self._get_semaphore():
+                file_info = await bot.get_file(file_id)
+            self._cache[file_id] = (file_info.file_path, time.monotonic() + self.ttl)
+            future.set_result(file_info.file_path)
+            return file_info.file_path
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Помечаем исключение как полученное, если других ожидающих нет
+            raise
+        finally:
+            del self._inflight[file_id]
+
+    async def resolve_many(self, bot: Bot, file_ids) -> dict[str, str | None]:
+        """
+        Параллельно получает file_path для набора file_id.
+        Возвращает словарь file_id -> file_path (None, если получить путь не удалось).
+        """
+        unique_ids = list(dict.fromkeys(fid for fid in file_ids if fid))
+
+        async def _resolve(file_id: str):
+            try:
+                return file_id, await self.get_file_path(bot, file_id)
+            except Exception as e:
+                logger.warning(f"Не удалось получить file_path для {file_id}: {e}")
+                return file_id, None
+
+        return dict(await asyncio.gather(*(_resolve(fid) for fid in unique_ids)))
+
+    def build_url(self, bot: Bot, file_path: str) -> str:
+        """Формирует прямую ссылку на файл Telegram."""
+        return f"{TELEGRAM_FILE_BASE_URL}{bot.token}/{file_path}"
+
+
+# Общий экземпляр, чтобы экспорт и отправка писем использовали один кэш
+file_link_resolver = FileLinkResolver()
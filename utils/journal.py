@@ -0,0 +1,172 @@
+# utils/journal.py
+
+import asyncio
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+from config import JOURNAL_DIR, JOURNAL_ROTATE_MB, JOURNAL_KEEP, JOURNAL_SCRUB_PII
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1.0  # Как часто накопленные записи сбрасываются на диск, сек
+NAME_FIELDS = {"first_name", "last_name", "username", "title"}
+PRIVATE_FIELDS = {"phone_number", "contact", "location", "venue", "bio"}
+TEXT_FIELDS = {"text", "caption"}
+
+
+def _pseudonym(value: str) -> str:
+    """Одинаковые значения заменяются одинаково, чтобы повтор шел по тем же веткам кода."""
+    return "p" + hashlib.sha256(value.encode()).hexdigest()[:10]
+
+
+def scrub(value):
+    """
+    Убирает персональные данные из апдейта: имена и username заменяются псевдонимами,
+    телефон, контакт и геопозиция удаляются, в тексте остается только команда,
+    остальное заменяется звездочками той же длины. ID пользователей и file_id сохраняются -
+    без них повтор не воспроизведет сценарии (админы, заявки, фото).
+    """
+    if isinstance(value, list):
+        return [scrub(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    result = {}
+    for key, item in value.items():
+        if key in PRIVATE_FIELDS:
+            continue
+        if key in NAME_FIELDS and isinstance(item, str):
+            result[key] = _pseudonym(item)
+        elif key in TEXT_FIELDS and isinstance(item, str):
+            command, separator, rest = item.partition(" ") if item.startswith("/") else ("", "", item)
+            result[key] = command + separator + "*" * len(rest)
+        else:
+            result[key] = scrub(item)
+    return result
+
+
+def update_label(update: dict) -> str:
+    """Короткая метка апдейта для сравнения задержек: команда, тип сообщения или префикс колбэка."""
+    if "callback_query" in update:
+        return "callback:" + (update["callback_query"].get("data") or "").split(":")[0]
+    message = update.get("message")
+    if message is None:
+        return next((key for key in update if key != "update_id"), "unknown")
+    text = message.get("text") or ""
+    if text.startswith("/"):
+        return "message:" + text.split()[0].split("@")[0]
+    kind = next((key for key in ("photo", "document", "video", "sticker", "contact", "text") if key in message),
+                "other")
+    return "message:" + kind
+
+
+class UpdateJournal:
+    """
+    Журнал входящих апдейтов для воспроизведения нагрузки (benchmarks/replay.py).
+    Каждая запись - строка JSON {"t": время получения, "ms": время обработки, "l": метка, "u": апдейт}
+    в gzip-файле. Записи копятся в памяти и раз в секунду дописываются в файл в отдельном потоке.
+    Файл меняется, когда в него записано JOURNAL_ROTATE_MB несжатых данных, хранятся JOURNAL_KEEP последних.
+    """
+
+    def __init__(self, directory: str = JOURNAL_DIR, rotate_bytes: int = JOURNAL_ROTATE_MB * 1024 * 1024,
+                 keep: int = JOURNAL_KEEP, scrub_pii: bool = JOURNAL_SCRUB_PII):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.keep = keep
+        self.scrub_pii = scrub_pii
+        self._pending: list[str] = []
+        self._file: gzip.GzipFile | None = None
+        self._written = 0
+        self._task: asyncio.Task | None = None
+        self.records = 0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self._write, self._take())
+        await asyncio.to_thread(self._close)
+
+    def record(self, update: dict, received_at: float, duration: float):
+        label = update_label(update)
+        if self.scrub_pii:
+            update = scrub(update)
+        self._pending.append(json.dumps(
+            {"t": round(received_at, 4), "ms": round(duration * 1000, 2), "l": label, "u": update},
+            ensure_ascii=False, separators=(",", ":")
+        ))
+        self.records += 1
+
+    def _take(self) -> list[str]:
+        lines, self._pending = self._pending, []
+        return lines
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            lines = self._take()
+            if not lines:
+                continue
+            try:
+                await asyncio.to_thread(self._write, lines)
+            except Exception as e:
+                logger.error(f"Не удалось записать {len(lines)} апдейтов в журнал: {e}")
+
+    def _write(self, lines: list[str]):
+        if not lines:
+            return
+        if self._file is None or self._written >= self.rotate_bytes:
+            self._rotate()
+        data = ("\n".join(lines) + "\n").encode()
+        self._file.write(data)
+        self._file.flush()  # Сжатый блок попадает на диск, оборванный файл читается до последнего сброса
+        self._written += len(data)
+
+    def _rotate(self):
+        self._close()
+        name = time.strftime("updates-%Y%m%d-%H%M%S", time.localtime())
+        path = os.path.join(self.directory, f"{name}.jsonl.gz")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{name}-{suffix}.jsonl.gz")
+            suffix += 1
+        self._file = gzip.open(path, "ab")
+        self._written = 0
+        for old in journal_files(self.directory)[:-self.keep]:
+            os.remove(old)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def journal_files(directory: str) -> list[str]:
+    """Файлы журнала в порядке записи."""
+    return sorted(glob.glob(os.path.join(directory, "updates-*.jsonl.gz")), key=os.path.getmtime)
+
+
+def read_journal(paths: list[str]):
+    """Отдает записи журнала по порядку. Оборванный последний блок (падение процесса) пропускается."""
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if line.endswith("\n"):
+                        yield json.loads(line)
+            except (EOFError, gzip.BadGzipFile):
+                logger.warning(f"Файл журнала {path} оборван, прочитан до последней целой записи")
+
+
+# Общий журнал, который включается в main.py (JOURNAL_ENABLED=1)
+update_journal = UpdateJournal()
@@ -0,0 +1,145 @@
+# utils/metrics.py
+
+import functools
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, сек
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными корзинами, как в Prometheus."""
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # Последняя корзина - +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def percentile(self, q: float) -> float:
+        """Оценивает перцентиль линейной интерполяцией внутри корзины."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if i == len(LATENCY_BUCKETS):
+                    return LATENCY_BUCKETS[-1]
+                lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+                return lower + (LATENCY_BUCKETS[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return LATENCY_BUCKETS[-1]
+
+
+class Metrics:
+    """
+    Реестр метрик процесса: гистограммы задержек по имени и метке,
+    счетчики и gauges, которые вычисляются при чтении.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.histograms: dict[str, dict[str, Histogram]] = {}
+        self.counters: dict[str, dict[str, int]] = {}
+        self._gauges: dict[str, object] = {}  # имя -> функция, возвращающая {метка: значение}
+
+    def observe(self, name: str, label: str, seconds: float):
+        labels = self.histograms.setdefault(name, {})
+        histogram = labels.get(label)
+        if histogram is None:
+            histogram = labels[label] = Histogram()
+        histogram.observe(seconds)
+
+    def inc(self, name: str, label: str = "", value: int = 1):
+        labels = self.counters.setdefault(name, {})
+        labels[label] = labels.get(label, 0) + value
+
+    def register_gauge(self, name: str, func):
+        """Регистрирует gauge: func() возвращает словарь {метка: значение}."""
+        self._gauges[name] = func
+
+    @contextmanager
+    def timer(self, name: str, label: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, label, time.perf_counter() - start)
+
+    def timed(self, name: str, label: str | None = None):
+        """Декоратор для корутин: записывает время выполнения в гистограмму name."""
+        def decorator(func):
+            metric_label = label or func.__name__
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(name, metric_label, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def render_prometheus(self) -> str:
+        """Формирует метрики в текстовом формате Prometheus."""
+        lines = []
+        for name, labels in self.histograms.items():
+            lines.append(f"# TYPE {name} histogram")
+            for label, histogram in labels.items():
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{name="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{name="{label}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{name="{label}"}} {histogram.count}')
+        for name, labels in self.counters.items():
+            lines.append(f"# TYPE {name} counter")
+            for label, value in labels.items():
+                lines.append(f'{name}{{name="{label}"}} {value}')
+        for name, func in self._gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            try:
+                values = func()
+            except Exception as e:
+                logger.warning(f"Не удалось вычислить gauge {name}: {e}")
+                continue
+            for label, value in values.items():
+                lines.append(f'{name}{{name="{label}"}} {value}')
+        lines.append("# TYPE bot_uptime_seconds gauge")
+        lines.append(f"bot_uptime_seconds {self.uptime():.3f}")
+        return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(registry: "Metrics", host: str, port: int) -> web.AppRunner:
+    """Запускает HTTP-сервер, отдающий /metrics в формате Prometheus."""
+    async def _handle(_request: web.Request) -> web.Response:
+        return web.Response(text=registry.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики Prometheus доступны на http://{host}:{port}/metrics")
+    return runner
+
+
+# Общий реестр метрик процесса
+metrics = Metrics()
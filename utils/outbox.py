@@ -0,0 +1,130 @@
+# utils/outbox.py
+
+import asyncio
+import json
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+from aiogram import Bot
+
+from config import (OUTBOX_BATCH_SIZE, OUTBOX_LEASE_SECONDS, OUTBOX_MAX_ATTEMPTS, OUTBOX_POLL_INTERVAL,
+                    OUTBOX_RETRY_DELAY)
+from database.database import Database as DB
+
+logger = logging.getLogger(__name__)
+
+# Обработчик уведомления: (bot, chat_id, payload) -> None. Исключение означает, что нужен повтор.
+OutboxHandler = Callable[[Bot, int | None, dict], Awaitable[None]]
+
+
+class OutboxDispatcher:
+    """
+    Фоновая доставка уведомлений из таблицы notification_outbox.
+    Строки попадают в outbox в той же транзакции, что и сама заявка, поэтому
+    уведомление не теряется при падении бота. Каждая строка доставляется отдельной
+    задачей (не больше batch_size одновременно): медленная доставка, например письмо,
+    которое ждет SMTP, не задерживает остальные уведомления. Выданная строка занята
+    на время lease, при ошибке она откладывается с экспоненциальной задержкой.
+    """
+
+    def __init__(self, db: DB, bot: Bot, handlers: dict[str, OutboxHandler],
+                 batch_size: int = OUTBOX_BATCH_SIZE, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 retry_delay: float = OUTBOX_RETRY_DELAY, poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 lease: float = OUTBOX_LEASE_SECONDS):
+        self.db = db
+        self.bot = bot
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._deliveries: dict[asyncio.Task, int] = {}  # Задача доставки -> id строки
+        self._forward_wake: Callable[[], None] | None = None
+
+        self.delivered = 0
+        self.failed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает доставку. Неотправленные строки останутся в БД до следующего запуска."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._deliveries:
+            unfinished = [outbox_id for task, outbox_id in self._deliveries.items() if not task.done()]
+            for task in list(self._deliveries):
+                task.cancel()
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+            self._deliveries.clear()
+            if unfinished:
+                # Прерванные доставки не ждут окончания lease после перезапуска
+                await self.db.release_outbox(unfinished)
+
+    def wake(self):
+        """Будит диспетчер сразу после появления новых строк, не дожидаясь опроса."""
+        self._wakeup.set()
+        if self._task is None and self._forward_wake is not None:
+            self._forward_wake()
+
+    def forward_wake(self, callback: Callable[[], None] | None):
+        """
+        Для процесса, где диспетчер не запущен (многопроцессный режим): wake() вызывает callback,
+        который будит диспетчер процесса, доставляющего уведомления.
+        """
+        self._forward_wake = callback
+
+    async def _run(self):
+        while True:
+            # Сбрасываем до чтения: wake() во время чтения вызовет еще один проход
+            self._wakeup.clear()
+            free = self.batch_size - len(self._deliveries)
+            if free > 0:
+                try:
+                    rows = await self.db.claim_due_outbox(time.time(), free, self.lease)
+                except Exception as e:
+                    logger.error(f"Не удалось прочитать outbox: {e}")
+                    rows = []
+                for row in rows:
+                    task = asyncio.create_task(self._deliver(*row))
+                    self._deliveries[task] = row[0]
+                    task.add_done_callback(self._delivery_done)
+            # Ждем новых строк, освободившегося места или следующего опроса
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _delivery_done(self, task: asyncio.Task):
+        if self._deliveries.pop(task, None) is not None:
+            self._wakeup.set()
+
+    async def _deliver(self, outbox_id: int, kind: str, chat_id: int | None, payload: str, attempts: int):
+        handler = self.handlers.get(kind)
+        try:
+            if handler is None:
+                raise ValueError(f"Нет обработчика для уведомлений типа '{kind}'")
+            await handler(self.bot, chat_id, json.loads(payload))
+        except Exception as e:
+            attempts += 1
+            give_up = attempts >= self.max_attempts
+            next_attempt_at = time.time() + self.retry_delay * 2 ** (attempts - 1)
+            if give_up:
+                self.failed += 1
+                logger.error(f"Уведомление {kind} для {chat_id} не доставлено после {attempts} попыток: {e}")
+            else:
+                logger.warning(f"Ошибка доставки уведомления {kind} для {chat_id} (попытка {attempts}): {e}")
+            await self.db.retry_outbox(outbox_id, attempts, next_attempt_at, str(e), give_up)
+            return
+        self.delivered += 1
+        await self.db.complete_outbox(outbox_id)
+
+    def get_stats(self) -> dict:
+        return {"delivered": self.delivered, "failed": self.failed, "inflight": len(self._deliveries)}
@@ -0,0 +1,272 @@
+# utils/photo_mirror.py
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import aiofiles
+from aiogram import Bot
+
+from config import (UPLOAD_FOLDER, PHOTO_MIRROR_ENABLED, PHOTO_MIRROR_MAX_MB, PHOTO_MIRROR_CONCURRENCY,
+                    PHOTO_PUBLIC_URL)
+from utils.file_links import file_link_resolver
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+TOUCH_INTERVAL = 60  # Чаще раза в минуту время обращения к файлу не обновляем
+EVICT_LOW_WATERMARK = 0.9  # Вытесняем файлы, пока зеркало не станет меньше 90% лимита
+
+
+class PhotoMirror:
+    """
+    Локальная копия фотографий заявок в UPLOAD_FOLDER.
+    Каждое фото один раз скачивается потоково (без загрузки целиком в память)
+    и сохраняется по SHA-256 содержимого, поэтому одинаковые файлы хранятся один раз.
+    Таблица photo_files связывает file_id Telegram с файлом, письма и выгрузка
+    берут фото с диска. При превышении лимита вытесняются давно не использованные файлы.
+    """
+
+    def __init__(self, folder: str = UPLOAD_FOLDER, max_bytes: int = PHOTO_MIRROR_MAX_MB * 1024 * 1024,
+                 concurrency: int = PHOTO_MIRROR_CONCURRENCY, public_url: str | None = PHOTO_PUBLIC_URL,
+                 enabled: bool = PHOTO_MIRROR_ENABLED):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.concurrency = max(1, concurrency)
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.enabled = enabled
+        self.db = None
+        self._bot: Bot | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._inflight: dict[str, asyncio.Task] = {}  # file_id -> задача скачивания
+        self._evict_lock = asyncio.Lock()
+        self._backfill_task: asyncio.Task | None = None
+
+        self.total_bytes = 0
+        self.downloaded = 0
+        self.deduplicated = 0
+        self.evicted = 0
+        self.failed = 0
+
+    @property
+    def started(self) -> bool:
+        return self.enabled and self.db is not None
+
+    async def start(self, db, bot: Bot):
+        """Подключает зеркало к базе и боту и восстанавливает текущий размер зеркала."""
+        if not self.enabled:
+            return
+        self.db = db
+        self._bot = bot
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.to_thread(os.makedirs, self.folder, exist_ok=True)
+        _, self.total_bytes, _ = await db.get_photo_storage_totals()
+
+    async def stop(self):
+        if self._backfill_task is not None:
+            self._backfill_task.cancel()
+            await asyncio.gather(self._backfill_task, return_exceptions=True)
+            self._backfill_task = None
+
+    def absolute_path(self, path: str) -> str:
+        return os.path.join(self.folder, path)
+
+    def build_link(self, path: str) -> str | None:
+        """
+        Постоянная ссылка на файл зеркала для выгрузки через PHOTO_PUBLIC_URL.
+        Без него None: путь на сервере получателю выгрузки бесполезен, нужна ссылка Telegram.
+        """
+        if self.public_url:
+            return f"{self.public_url}/{path}"
+        return None
+
+    async def get_local_paths(self, file_ids) -> dict[str, str]:
+        """
+        Возвращает file_id -> путь внутри зеркала для уже сохраненных фото
+        и отмечает обращение к ним (для вытеснения LRU).
+        """
+        if not self.started:
+            return {}
+        unique_ids = list(dict.fromkeys(fid for fid in file_ids if fid))
+        rows = await self.db.get_photo_files(unique_ids)
+        now = time.time()
+        stale = list({sha256 for _, sha256, _, last_access in rows if last_access < now - TOUCH_INTERVAL})
+        if stale:
+            await self.db.touch_photo_blobs(stale, now)
+        return {file_id: path for file_id, _, path, _ in rows}
+
+    async def read(self, file_id: str) -> tuple[bytes, str] | None:
+        """Читает фото с диска. Возвращает (содержимое, расширение) или None, если копии нет."""
+        path = (await self.get_local_paths([file_id])).get(file_id)
+        if path is None:
+            return None
+        try:
+            async with aiofiles.open(self.absolute_path(path), "rb") as f:
+                content = await f.read()
+        except FileNotFoundError:
+            return None
+        return content, os.path.splitext(path)[1].lstrip(".") or "jpg"
+
+    async def mirror_many(self, file_ids):
+        """Сохраняет набор фото. Ошибка любого из них пробрасывается (для повтора через outbox)."""
+        unique_ids = list(dict.fromkeys(fid for fid in file_ids if fid))
+        existing = await self.get_local_paths(unique_ids)
+        missing = [fid for fid in unique_ids
+                   if fid not in existing or not os.path.exists(self.absolute_path(existing[fid]))]
+        await asyncio.gather(*(self.mirror(fid) for fid in missing))
+
+    async def mirror(self, file_id: str) -> str:
+        """Скачивает фото в зеркало (параллельные вызовы для одного file_id объединяются)."""
+        task = self._inflight.get(file_id)
+        if task is None:
+            task = asyncio.create_task(self._mirror(file_id))
+            self._inflight[file_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(file_id, None))
+        return await asyncio.shield(task)
+
+    @metrics.timed("photo_mirror_seconds", "download")
+    async def _mirror(self, file_id: str) -> str:
+        try:
+            async with self._semaphore:
+                file_path = await file_link_resolver.get_file_path(self._bot, file_id)
+                tmp_path, sha256, size = await self._stream_to_temp(file_path)
+        except Exception:
+            self.failed += 1
+            raise
+
+        extension = os.path.splitext(file_path)[1].lower() or ".jpg"
+        path = os.path.join(sha256[:2], f"{sha256}{extension}")
+        final_path = self.absolute_path(path)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)  # Такое же содержимое уже сохранено под другим file_id
+        else:
+            await asyncio.to_thread(os.makedirs, os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+
+        if await self.db.save_photo_file(file_id, sha256, path, size, time.time()):
+            self.downloaded += 1
+            self.total_bytes += size
+        else:
+            self.deduplicated += 1
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            await self.evict()
+        return path
+
+    async def _stream_to_temp(self, file_path: str) -> tuple[str, str, int]:
+        """Пишет файл во временный файл зеркала по частям, считая хэш. Возвращает (путь, sha256, размер)."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".part")
+        os.close(fd)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in self._iter_chunks(file_path):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest(), size
+
+    async def _iter_chunks(self, file_path: str):
+        api = self._bot.session.api
+        if api.is_local:
+            # Локальный сервер Bot API отдает путь к файлу на диске
+            async with aiofiles.open(api.wrap_local_file.to_local(file_path), "rb") as f:
+                while chunk := await f.read(CHUNK_SIZE):
+                    yield chunk
+            return
+        url = api.file_url(self._bot.token, file_path)
+        async for chunk in self._bot.session.stream_content(url, chunk_size=CHUNK_SIZE):
+            yield chunk
+
+    async def evict(self):
+        """Удаляет давно не использованные файлы, пока зеркало не уложится в лимит."""
+        async with self._evict_lock:
+            target = self.max_bytes * EVICT_LOW_WATERMARK
+            while self.total_bytes > target:
+                rows = await self.db.get_lru_photo_blobs(100)
+                if not rows:
+                    self.total_bytes = 0
+                    return
+                # Берем из самых старых файлов ровно столько, сколько нужно освободить
+                excess = self.total_bytes - target
+                victims = []
+                for row in rows:
+                    victims.append(row)
+                    excess -= row[2]
+                    if excess <= 0:
+                        break
+                # Сначала удаляем из индекса, чтобы никто не получил путь к удаляемому файлу
+                await self.db.delete_photo_blobs([sha256 for sha256, _, _ in victims])
+                for sha256, path, size in victims:
+                    try:
+                        os.remove(self.absolute_path(path))
+                    except FileNotFoundError:
+                        pass
+                    self.total_bytes -= size
+                    self.evicted += 1
+            logger.info(f"Зеркало фото очищено до {self.total_bytes / 1024 / 1024:.1f} МБ")
+
+    def start_backfill(self, batch: int = 200) -> bool:
+        """Запускает в фоне копирование фото старых заявок. Возвращает False, если уже идет."""
+        if not self.started or (self._backfill_task is not None and not self._backfill_task.done()):
+            return False
+        self._backfill_task = asyncio.create_task(self._backfill(batch))
+        return True
+
+    def _has_room(self) -> bool:
+        """Есть ли место без вытеснения: фото старых заявок не должны вытеснять фото новых."""
+        return not self.max_bytes or self.total_bytes < self.max_bytes * EVICT_LOW_WATERMARK
+
+    async def _backfill(self, batch: int):
+        failed: set[str] = set()
+        while True:
+            if not self._has_room():
+                logger.warning("Копирование фото старых заявок остановлено: зеркало заполнено до лимита")
+                break
+            file_ids = [fid for fid in await self.db.get_unmirrored_photo_ids(batch + len(failed))
+                        if fid not in failed]
+            if not file_ids:
+                break
+            results = await asyncio.gather(*(self.mirror(fid) for fid in file_ids[:batch]), return_exceptions=True)
+            for file_id, result in zip(file_ids, results):
+                if isinstance(result, Exception):
+                    failed.add(file_id)
+                    logger.warning(f"Не удалось скопировать фото {file_id}: {result}")
+        logger.info(f"Копирование фото старых заявок завершено, ошибок: {len(failed)}")
+
+    def get_stats(self) -> dict:
+        return {
+            "total_bytes": self.total_bytes,
+            "downloaded": self.downloaded,
+            "deduplicated": self.deduplicated,
+            "evicted": self.evicted,
+            "failed": self.failed,
+            "inflight": len(self._inflight),
+        }
+
+    async def get_summary(self) -> dict:
+        """Сводка для команды /storage."""
+        blobs, size, files = await self.db.get_photo_storage_totals()
+        pending, evicted_files = await self.db.count_unmirrored_photos()
+        disk = await asyncio.to_thread(shutil.disk_usage, self.folder)
+        return self.get_stats() | {
+            "blobs": blobs,
+            "total_bytes": size,
+            "files": files,
+            "unmirrored": pending,
+            "evicted_files": evicted_files,
+            "disk_free": disk.free,
+            "backfill_running": self._backfill_task is not None and not self._backfill_task.done(),
+        }
+
+
+# Общее зеркало, которое запускается в main.py
+photo_mirror = PhotoMirror()
@@ -0,0 +1,216 @@
+# utils/receipt_hashes.py
+
+import asyncio
+import io
+import logging
+from collections import OrderedDict
+
+from aiogram import Bot
+
+from config import RECEIPT_PHASH_DISTANCE
+from database.database import receipt_photos
+from utils.file_links import file_link_resolver
+from utils.metrics import metrics
+from utils.photo_mirror import photo_mirror
+
+try:
+    # Необязательные зависимости, нужны только для поиска похожих (а не идентичных) чеков
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8  # dHash 8x8 = 64 бита
+
+
+def dhash(content: bytes) -> int:
+    """
+    Перцептивный хэш (dHash) изображения: картинка уменьшается до 9x8 в оттенках серого,
+    каждый бит - "светлее ли пиксель соседа справа". Хэш устойчив к пересжатию и масштабу.
+    Возвращает 64-битное знаковое число (как хранится в SQLite INTEGER).
+    """
+    with Image.open(io.BytesIO(content)) as image:
+        image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))  # JPEG декодируется сразу в уменьшенном виде
+        pixels = np.asarray(image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return int(bits.view(">i8")[0])
+
+
+def _popcount(values):
+    """Количество единичных бит в каждом элементе массива uint64."""
+    if hasattr(np, "bitwise_count"):  # NumPy 2.0+
+        return np.bitwise_count(values)
+    table = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    return table[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class ReceiptHashIndex:
+    """
+    Индекс перцептивных хэшей всех чеков в памяти.
+    Хэши лежат в упакованном массиве uint64, поэтому сравнение новой заявки
+    со всеми предыдущими - один векторный проход XOR + popcount.
+    Хэш каждого фото чека считается один раз и сохраняется в submission_receipts.phash.
+    Чеки архивированных кампаний из индекса удаляются (discard_campaign).
+    """
+
+    _ARRAYS = ("_hashes", "_submission_ids", "_receipt_positions", "_user_ids", "_campaign_ids")
+
+    def __init__(self, max_distance: int = RECEIPT_PHASH_DISTANCE, capacity: int = 1024):
+        self.max_distance = max_distance
+        self.enabled = np is not None and Image is not None
+        self.db = None
+        self._bot: Bot | None = None
+        self._size = 0
+        self._positions: dict[tuple[int, int], int] = {}  # (submission_id, номер чека) -> позиция в массивах
+        if self.enabled:
+            self._hashes = np.zeros(capacity, dtype=np.uint64)
+            self._submission_ids = np.zeros(capacity, dtype=np.int64)
+            self._receipt_positions = np.zeros(capacity, dtype=np.int64)
+            self._user_ids = np.zeros(capacity, dtype=np.int64)
+            self._campaign_ids = np.zeros(capacity, dtype=np.int64)
+        # Результаты проверки по (заявка, file_id чеков): одна заявка уходит нескольким админам
+        self._checks: OrderedDict[tuple, asyncio.Future] = OrderedDict()
+
+    async def start(self, db, bot: Bot):
+        """Загружает хэши уже проверенных чеков из базы."""
+        self.db = db
+        self._bot = bot
+        if not self.enabled:
+            logger.warning("numpy/Pillow не установлены: поиск похожих чеков отключен, "
+                           "работает только поиск идентичных файлов.")
+            return
+        for submission_id, position, user_id, campaign_id, phash in await db.get_receipt_phashes():
+            self.add(submission_id, position, user_id, campaign_id, phash)
+        logger.info(f"Загружено {self._size} хэшей чеков")
+
+    def _grow(self):
+        capacity = len(self._hashes) * 2
+        for name in self._ARRAYS:
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            setattr(self, name, grown)
+
+    def add(self, submission_id: int, receipt_position: int, user_id: int, campaign_id: int | None, phash: int):
+        """Добавляет хэш фото чека заявки (при повторной подаче заменяет прежний)."""
+        key = (submission_id, receipt_position)
+        position = self._positions.get(key)
+        if position is None:
+            if self._size == len(self._hashes):
+                self._grow()
+            position = self._size
+            self._size += 1
+            self._positions[key] = position
+        self._hashes[position] = np.int64(phash).view(np.uint64)
+        self._submission_ids[position] = submission_id
+        self._receipt_positions[position] = receipt_position
+        self._user_ids[position] = user_id
+        self._campaign_ids[position] = campaign_id or 0
+
+    def discard_campaign(self, campaign_id: int) -> int:
+        """Удаляет из индекса чеки кампании (после переноса в архив). Возвращает число удаленных."""
+        if not self.enabled or not self._size:
+            return 0
+        return self._keep(self._campaign_ids[:self._size] != campaign_id)
+
+    def discard_submission(self, submission_id: int) -> int:
+        """Удаляет из индекса все чеки заявки (перед повторной подачей). Возвращает число удаленных."""
+        if not self.enabled or (submission_id, 0) not in self._positions:  # Первая подача: в индексе ничего нет
+            return 0
+        return self._keep(self._submission_ids[:self._size] != submission_id)
+
+    def _keep(self, mask) -> int:
+        """Оставляет в массивах только отмеченные хэши и пересобирает _positions. Возвращает число удаленных."""
+        keep = np.flatnonzero(mask)
+        removed = self._size - len(keep)
+        if removed:
+            for name in self._ARRAYS:
+                array = getattr(self, name)
+                array[:len(keep)] = array[keep]
+            self._size = len(keep)
+            self._positions = {
+                (int(submission_id), int(receipt_position)): position
+                for position, (submission_id, receipt_position) in enumerate(
+                    zip(self._submission_ids[:self._size], self._receipt_positions[:self._size]))
+            }
+        return removed
+
+    def search(self, phash: int, exclude_user_id: int | None = None, limit: int = 5) -> list[tuple[int, int, int]]:
+        """Ищет чеки на расстоянии Хэмминга не больше порога. Возвращает [(submission_id, user_id, расстояние)]."""
+        if not self._size:
+            return []
+        # Одна заявка может совпасть несколькими фото: берем ближайшее и отбираем limit заявок
+        distances = _popcount(self._hashes[:self._size] ^ np.int64(phash).view(np.uint64))
+        mask = distances <= self.max_distance
+        if exclude_user_id is not None:
+            mask &= self._user_ids[:self._size] != exclude_user_id
+        matches = np.flatnonzero(mask)
+        matches = matches[np.argsort(distances[matches], kind="stable")]
+        found = {}
+        for i in matches:
+            submission_id = int(self._submission_ids[i])
+            if submission_id not in found:
+                found[submission_id] = (submission_id, int(self._user_ids[i]), int(distances[i]))
+                if len(found) == limit:
+                    break
+        return list(found.values())
+
+    async def check_submission(self, payload: dict) -> list[tuple[int, int, int]]:
+        """
+        Считает хэши всех фото чеков заявки, ищет похожие чеки других участников и добавляет
+        чеки в индекс. Повторные вызовы для тех же чеков (по одному на админа) возвращают сохраненный результат.
+        Ошибки не пробрасываются: заявка должна дойти до админов и без проверки.
+        """
+        if not self.enabled or self.db is None:
+            return []
+        key = (payload["submission_id"], *receipt_photos(payload))
+        future = self._checks.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._check(payload))
+            self._checks[key] = future
+            while len(self._checks) > 1000:
+                self._checks.popitem(last=False)
+        try:
+            return await asyncio.shield(future)
+        except Exception as e:
+            self._checks.pop(key, None)
+            logger.warning(f"Не удалось проверить чек заявки №{payload['submission_id']} на повтор: {e}")
+            return []
+
+    @metrics.timed("receipt_check_seconds", "check")
+    async def _check(self, payload: dict) -> list[tuple[int, int, int]]:
+        submission_id, user_id = payload["submission_id"], payload["user_id"]
+        campaign_id = payload.get("campaign_id")
+        if campaign_id is None:  # Уведомление поставлено до появления кампаний в payload
+            campaign_id = await self.db.get_submission_campaign_id(submission_id)
+        file_ids = receipt_photos(payload)
+        contents = await asyncio.gather(*(self._read_photo(file_id) for file_id in file_ids))
+        found = {}
+        # При повторной подаче чеков может стать меньше: хэши прежних позиций не должны остаться в индексе
+        self.discard_submission(submission_id)
+        for position, (file_id, content) in enumerate(zip(file_ids, contents)):
+            phash = await asyncio.to_thread(dhash, content)
+            with metrics.timer("receipt_check_seconds", "search"):
+                matches = self.search(phash, exclude_user_id=user_id)
+            for match in matches:
+                if match[0] not in found or match[2] < found[match[0]][2]:
+                    found[match[0]] = match
+            self.add(submission_id, position, user_id, campaign_id, phash)
+            await self.db.set_receipt_phash(submission_id, position, file_id, phash)
+        return sorted(found.values(), key=lambda match: match[2])[:5]
+
+    async def _read_photo(self, file_id: str) -> bytes:
+        local = await photo_mirror.read(file_id)
+        if local is not None:
+            return local[0]
+        file_path = await file_link_resolver.get_file_path(self._bot, file_id)
+        buffer = io.BytesIO()
+        await self._bot.download_file(file_path, destination=buffer)
+        return buffer.getvalue()
+
+
+# Общий индекс, который запускается в main.py
+receipt_index = ReceiptHashIndex()
@@ -0,0 +1,73 @@
+# utils/search.py
+
+import re
+import time
+from collections import OrderedDict
+
+from config import SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE
+
+NUMBER_RE = re.compile(r"^[#№]?(\d+)$")
+WORD_RE = re.compile(r"\w+")
+
+
+def parse_query(query: str) -> tuple[str | None, int | None, bool]:
+    """
+    Разбирает запрос админа: "#123" или "№123" - ID заявки, "123" - ID заявки или user_id,
+    остальное - username (можно с @ и не целиком: слова ищутся по началу).
+    Возвращает (запрос FTS5, число, только ID заявки).
+    """
+    query = query.strip().lstrip("@")
+    number = NUMBER_RE.match(query)
+    if number:
+        return None, int(number.group(1)), query[0] in "#№"
+    words = WORD_RE.findall(query.lower())
+    # Каждое слово - префикс в кавычках: спецсимволы FTS5 из запроса не попадают в MATCH
+    return (" ".join(f'"{word}"*' for word in words) or None), None, False
+
+
+class ParticipantSearch:
+    """
+    Поиск заявок (/find, inline-запросы) с коротким кэшем страниц результатов.
+    Inline-запросы приходят на каждое нажатие клавиши, а админы часто повторяют одни и те же
+    запросы, поэтому страницы хранятся ttl секунд в LRU на max_entries записей.
+    Статус в кэше может отставать от базы не больше чем на ttl.
+    """
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._cache: OrderedDict[tuple, tuple[float, list[tuple], bool]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    async def search(self, db, query: str, before_id: int | None = None, limit: int = 10) -> tuple[list[tuple], bool]:
+        """
+        Возвращает страницу (id, user_id, username, status, updated_at) от новых заявок к старым
+        и признак, что есть следующая (для нее before_id = ID последней строки).
+        """
+        match, number, submission_only = parse_query(query)
+        if match is None and number is None:
+            return [], False
+        key = (match, number, submission_only, before_id, limit)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached[1], cached[2]
+
+        self.misses += 1
+        rows = await db.search_participants(match, number, before_id, limit + 1, submission_only)
+        rows, has_more = rows[:limit], len(rows) > limit
+        self._cache[key] = (time.monotonic() + self.ttl, rows, has_more)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return rows, has_more
+
+    def get_stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
+
+
+# Общий экземпляр для хендлеров админов
+participant_search = ParticipantSearch()
@@ -0,0 +1,176 @@
+# utils/send_scheduler.py
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (CopyMessage, ForwardMessage, SendDocument, SendMediaGroup, SendMessage,
+                             SendPhoto, TelegramMethod)
+from aiogram.methods.base import Response, TelegramType
+
+from config import ADMIN_IDS, SEND_GLOBAL_RATE, SEND_PER_CHAT_RATE, SEND_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки: меньше - раньше
+PRIORITY_ADMIN = 0  # Сообщения администраторам (новые заявки, ошибки)
+PRIORITY_NORMAL = 1  # Ответы пользователям на их действия
+PRIORITY_BULK = 2  # Массовые рассылки
+
+# Приоритет текущей задачи. Рассылки выставляют PRIORITY_BULK на время своей работы.
+send_priority: ContextVar[int] = ContextVar("send_priority", default=PRIORITY_NORMAL)
+
+# Методы, на которые распространяются лимиты Telegram на отправку сообщений
+THROTTLED_METHODS = (SendMessage, SendMediaGroup, SendDocument, SendPhoto, CopyMessage, ForwardMessage)
+
+
+class SendScheduler:
+    """
+    Общий планировщик исходящих сообщений.
+    Глобальный лимит (~30 сообщений/с) - token bucket, выдача токенов идет по приоритету,
+    поэтому сообщения админам обгоняют массовые рассылки.
+    Лимит на чат (~1 сообщение/с) - равномерные интервалы между отправками в один чат.
+    """
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, per_chat_rate: float = SEND_PER_CHAT_RATE):
+        self.global_rate = global_rate
+        self.per_chat_interval = 1 / per_chat_rate
+        self._tokens = global_rate  # Разрешаем всплеск до одной секунды лимита
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._chat_next: dict[int | str, float] = {}  # chat_id -> самое раннее время следующей отправки
+        self._waiters: list = []  # Куча (приоритет, порядковый номер, future)
+        self._counter = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+        self.sent = 0
+        self.retries = 0
+
+    def _reserve_chat_slot(self, chat_id) -> float:
+        """Резервирует ближайшее свободное время отправки в чат и возвращает, сколько ждать."""
+        now = time.monotonic()
+        if len(self._chat_next) > 50_000:
+            self._chat_next = {cid: t for cid, t in self._chat_next.items() if t > now}
+        slot = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = slot + self.per_chat_interval
+        return slot - now
+
+    def _take_global_token(self) -> float:
+        """Пытается взять токен глобального лимита. Возвращает 0 или время ожидания до следующего токена."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._tokens = min(self.global_rate, self._tokens + (now - self._updated_at) * self.global_rate)
+        self._updated_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.global_rate
+
+    async def _run(self):
+        """Раздает глобальные токены ожидающим в порядке приоритета."""
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._take_global_token()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                self._tokens += 1  # Все ожидающие отменились - возвращаем токен
+
+    async def acquire(self, chat_id, priority: int = PRIORITY_NORMAL):
+        """Ждет, пока отправка в chat_id будет разрешена обоими лимитами."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+        if chat_id is not None:
+            delay = self._reserve_chat_slot(chat_id)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self._wakeup.set()
+        await future
+
+    def set_rates(self, global_rate: float, per_chat_rate: float | None = None):
+        """Меняет лимиты (в многопроцессном режиме общий лимит бота делится между процессами)."""
+        self.global_rate = global_rate
+        self._tokens = min(self._tokens, global_rate)
+        if per_chat_rate:
+            self.per_chat_interval = 1 / per_chat_rate
+
+    def pause_chat(self, chat_id, seconds: float):
+        """Откладывает отправки в чат после ответа 429."""
+        self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), time.monotonic() + seconds)
+
+    def pause_all(self, seconds: float):
+        """Откладывает все отправки (429 без привязки к чату)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def get_stats(self) -> dict:
+        return {
+            "waiting": len(self._waiters),
+            "sent": self.sent,
+            "retries": self.retries,
+            "tracked_chats": len(self._chat_next),
+        }
+
+
+class SendSchedulerMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: пропускает все отправки сообщений через SendScheduler
+    и повторяет запрос после TelegramRetryAfter, выдержав указанное время.
+    """
+
+    def __init__(self, scheduler: SendScheduler, max_retries: int = SEND_MAX_RETRIES):
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not isinstance(method, THROTTLED_METHODS):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        priority = PRIORITY_ADMIN if chat_id in ADMIN_IDS else send_priority.get()
+
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire(chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+                self.scheduler.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.scheduler.retries += 1
+                logger.warning(f"Flood control для чата {chat_id}, повтор через {e.retry_after} с.")
+                if chat_id is not None:
+                    self.scheduler.pause_chat(chat_id, e.retry_after)
+                else:
+                    self.scheduler.pause_all(e.retry_after)
+
+
+# Общий планировщик для всех отправок бота
+send_scheduler = SendScheduler()
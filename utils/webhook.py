@@ -0,0 +1,99 @@
+# utils/webhook.py
+
+import asyncio
+import logging
+import signal
+from typing import Any
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import (WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_MAX_UPDATES,
+                    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_DRAIN_TIMEOUT)
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик вебхука с ограничением одновременно обрабатываемых апдейтов.
+    Апдейт обрабатывается в фоне, но ответ Telegram задерживается, пока не освободится
+    слот: так Telegram (max_connections) сам снижает темп отправки - это и есть backpressure.
+    При остановке новые апдейты получают 503 (Telegram пришлет их повторно),
+    а уже принятые дорабатываются до конца.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_updates: int, drain_timeout: float,
+                 secret_token: str | None = None, **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True,
+                         secret_token=secret_token, **data)
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(max_updates)
+        self._draining = False
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if self._draining:
+            return web.Response(status=503, text="Shutting down")
+        update = await request.json(loads=bot.session.json_loads)
+        await self._slots.acquire()
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        # Слот освобождается, когда фоновая обработка апдейта завершится
+        task.add_done_callback(lambda _: self._slots.release())
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        """Дожидается обработки принятых апдейтов. Сессию бота закрывает main.py."""
+        self._draining = True
+        tasks = list(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        logger.info(f"Ожидаем завершения {len(tasks)} апдейтов перед остановкой...")
+        done, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+        if pending:
+            logger.warning(f"{len(pending)} апдейтов не успели обработаться за {self.drain_timeout} с.")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates: list[str] | None = None, **workflow_data: Any):
+    """
+    Запускает aiohttp-сервер вебхука и регистрирует вебхук в Telegram.
+    allowed_updates - типы апдейтов (по умолчанию те, на которые есть хендлеры в dp).
+    Работает до SIGINT/SIGTERM, затем дожидается обработки принятых апдейтов.
+    """
+    handler = BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        max_updates=WEBHOOK_MAX_UPDATES,
+        drain_timeout=WEBHOOK_DRAIN_TIMEOUT,
+        secret_token=WEBHOOK_SECRET,
+        **workflow_data,
+    )
+    app = web.Application()
+    handler.register(app, path=WEBHOOK_PATH)  # Первым в on_shutdown: сначала дорабатываем апдейты
+    setup_application(app, dp, bot=bot, **workflow_data)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        await bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=allowed_updates or dp.resolve_used_update_types(),
+        )
+        logger.info(f"Вебхук запущен на {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:  # Windows
+                pass
+        await stop_event.wait()
+    finally:
+        # Вебхук не удаляем: пока бот перезапускается, Telegram копит апдейты у себя
+        await runner.cleanup()